@@ -0,0 +1,221 @@
+"""
+shared helpers for the benchmark scripts in this folder: setting up a
+throwaway orthoDB data directory, timing functions, and saving/comparing
+results
+
+The orthodb_tools modules read the location of the orthoDB data from the
+environment when they are imported (see `env_variables.py`), so the benchmark
+scripts call `use_data_dir` before importing anything from orthodb_tools.
+"""
+
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import timeit
+from pathlib import Path
+
+REPO_DIR = Path(__file__).resolve().parents[1]
+SAMPLE_DATA_DIR = REPO_DIR / "data" / "orthoDB_sample_data"
+RESULTS_FORMAT_VERSION = 1
+# a benchmark is reported as a regression (or an improvement) if its median
+# time changed by more than this fraction compared to the baseline
+DEFAULT_THRESHOLD = 0.25
+
+
+def link_source_files(source_dir: str | Path, data_dir: str | Path):
+    """symlink the orthoDB `.tab` files in `source_dir` into `data_dir`, so
+    that the databases are built in `data_dir` and not next to the source
+    files"""
+    data_dir = Path(data_dir)
+    data_dir.mkdir(parents=True, exist_ok=True)
+    source_files = sorted(Path(source_dir).resolve().glob("odb11v0_*.tab"))
+    if not source_files:
+        raise FileNotFoundError(f"no odb11v0_*.tab files in {source_dir}")
+    for source_file in source_files:
+        link = data_dir / source_file.name
+        if not link.exists():
+            link.symlink_to(source_file)
+
+
+def use_data_dir(data_dir: str | Path, **env_vars: str):
+    """point orthodb_tools at `data_dir` (and set any other .env variables,
+    e.g. `SEQUENCE_STORE="offset_index"`). Has to be called before
+    orthodb_tools is imported"""
+    if "orthodb_tools.env_variables.env_variables" in sys.modules:
+        raise RuntimeError(
+            "orthodb_tools was imported before the data directory was set"
+        )
+    os.environ["ORTHODB_DATA_DIR"] = str(data_dir)
+    # results are never read from the stage cache in a benchmark
+    os.environ["STAGE_CACHE_DIR"] = ""
+    for name, value in env_vars.items():
+        os.environ[name] = str(value)
+
+
+def build_databases(tables: list[str] | None = None, compact: bool = False) -> float:
+    """build the databases in the data directory (see `use_data_dir`).
+    Returns the build time in seconds"""
+    import orthodb_tools.scripts.build_databases as build_databases
+
+    start_time = time.perf_counter()
+    build_databases.main(tables, n_cores=1, compact=compact)
+    return time.perf_counter() - start_time
+
+
+def time_function(func, repeat: int = 5, min_time: float = 0.2) -> dict:
+    """time `func()`. It is called in a loop enough times to take at least
+    `min_time` seconds, and the loop is repeated `repeat` times
+
+    Returns
+    -------
+    dict
+        the time per call in seconds (min, median, mean, stdev) and the
+        number of calls per loop
+    """
+    timer = timeit.Timer(func)
+    number = 1
+    # like `Timer.autorange`, but with a configurable minimum time
+    while True:
+        if timer.timeit(number) >= min_time or number >= 10**6:
+            break
+        number *= 10 if number < 10 else 2
+    times = [t / number for t in timer.repeat(repeat=repeat, number=number)]
+    return {
+        "min_s": min(times),
+        "median_s": statistics.median(times),
+        "mean_s": statistics.fmean(times),
+        "stdev_s": statistics.stdev(times) if len(times) > 1 else 0.0,
+        "number": number,
+        "repeat": repeat,
+    }
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=REPO_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_metadata(**extra) -> dict:
+    """where and on what the benchmarks were run"""
+    return {
+        "format_version": RESULTS_FORMAT_VERSION,
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        **extra,
+    }
+
+
+def save_results(results: dict, output_file: str | Path):
+    Path(output_file).parent.mkdir(parents=True, exist_ok=True)
+    with open(output_file, "w") as f:
+        json.dump(results, f, indent=4)
+
+
+def load_results(results_file: str | Path) -> dict:
+    with open(results_file) as f:
+        return json.load(f)
+
+
+def compare_results(
+    results: dict, baseline: dict, threshold: float = DEFAULT_THRESHOLD
+) -> list[dict]:
+    """compare the median time of each benchmark to a baseline
+
+    Returns
+    -------
+    list[dict]
+        one row per benchmark with the baseline and current median times, the
+        ratio (current / baseline) and a status: "regression" or
+        "improvement" if the ratio is over `1 + threshold` or under
+        `1 / (1 + threshold)`, "ok", "new" (not in the baseline), "missing"
+        (only in the baseline) or "skipped"
+    """
+    rows = []
+    current_benchmarks = results["benchmarks"]
+    baseline_benchmarks = baseline["benchmarks"]
+    for name in list(current_benchmarks) + [
+        n for n in baseline_benchmarks if n not in current_benchmarks
+    ]:
+        current = current_benchmarks.get(name)
+        previous = baseline_benchmarks.get(name)
+        row = {"name": name, "baseline_s": None, "current_s": None, "ratio": None}
+        if current is None:
+            row["status"] = "missing"
+        elif previous is None:
+            row["status"] = "new"
+        elif "skipped" in current or "skipped" in previous:
+            row["status"] = "skipped"
+        else:
+            row["baseline_s"] = previous["median_s"]
+            row["current_s"] = current["median_s"]
+            row["ratio"] = current["median_s"] / previous["median_s"]
+            if row["ratio"] > 1 + threshold:
+                row["status"] = "regression"
+            elif row["ratio"] < 1 / (1 + threshold):
+                row["status"] = "improvement"
+            else:
+                row["status"] = "ok"
+        if current is not None and "median_s" in current:
+            row["current_s"] = current["median_s"]
+        rows.append(row)
+    return rows
+
+
+def format_time(seconds: float | None) -> str:
+    if seconds is None:
+        return "-"
+    if seconds < 1e-3:
+        return f"{seconds * 1e6:.1f} us"
+    if seconds < 1:
+        return f"{seconds * 1e3:.2f} ms"
+    return f"{seconds:.2f} s"
+
+
+def format_results(results: dict, header: bool = True, width: int | None = None) -> str:
+    """one line per benchmark with its median time. `width` is the width of
+    the name column (by default, the length of the longest name)"""
+    if width is None:
+        width = max([len(name) for name in results["benchmarks"]] + [9])
+    lines = []
+    if header:
+        lines.append(f"{'benchmark':<{width}} {'median':>10} {'min':>10} {'calls':>8}")
+    for name, result in results["benchmarks"].items():
+        if "skipped" in result:
+            lines.append(f"{name:<{width}} skipped ({result['skipped']})")
+            continue
+        lines.append(
+            f"{name:<{width}} {format_time(result['median_s']):>10} {format_time(result['min_s']):>10} {result['number'] * result['repeat']:>8}"
+        )
+    return "\n".join(lines)
+
+
+def format_comparison(rows: list[dict]) -> str:
+    width = max([len(row["name"]) for row in rows] + [9])
+    lines = [
+        f"{'benchmark':<{width}} {'baseline':>10} {'current':>10} {'ratio':>7}  status"
+    ]
+    for row in rows:
+        ratio = "-" if row["ratio"] is None else f"{row['ratio']:.2f}x"
+        lines.append(
+            f"{row['name']:<{width}} {format_time(row['baseline_s']):>10} {format_time(row['current_s']):>10} {ratio:>7}  {row['status']}"
+        )
+    n_regressions = sum(row["status"] == "regression" for row in rows)
+    n_improvements = sum(row["status"] == "improvement" for row in rows)
+    lines.append(f"{n_regressions} regressions, {n_improvements} improvements")
+    return "\n".join(lines)
@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+
+"""
+compare two saved benchmark results files (from `micro_benchmarks.py` or the
+other benchmark scripts in this folder)
+
+example::
+
+    python benchmarks/compare.py baseline.json new.json --threshold 0.1
+"""
+
+import argparse
+import sys
+
+import bench_utils
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(
+        description="""compare the median times in two benchmark results files.
+Exits with status 1 if any benchmark is slower than the baseline by more than --threshold""",
+        formatter_class=argparse.RawTextHelpFormatter,
+    )
+    parser.add_argument("baseline", type=str, help="""baseline results file""")
+    parser.add_argument("results", type=str, help="""results file to compare""")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        metavar="<float>",
+        default=bench_utils.DEFAULT_THRESHOLD,
+        help=f"""relative change in the median time that counts as a regression/improvement. Default is {bench_utils.DEFAULT_THRESHOLD}""",
+    )
+    args = parser.parse_args()
+    baseline = bench_utils.load_results(args.baseline)
+    results = bench_utils.load_results(args.results)
+    for label, r in [("baseline", baseline), ("results", results)]:
+        metadata = r.get("metadata", {})
+        print(
+            f"{label}: commit {metadata.get('git_commit')}, {metadata.get('time')}, python {metadata.get('python')}"
+        )
+    rows = bench_utils.compare_results(results, baseline, args.threshold)
+    print(bench_utils.format_comparison(rows))
+    if any(row["status"] == "regression" for row in rows):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main_cli()
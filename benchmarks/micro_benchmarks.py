@@ -0,0 +1,397 @@
+#!/usr/bin/env python
+
+"""
+micro-benchmarks of the functions that the pipeline spends its time in
+
+The orthoDB files (the bundled sample data by default) are linked into a
+temporary directory, the databases are built there, and each function is
+timed on its own: the `sql_queries` lookups, fetching sequences, the sequence
+filters, each LDO selection method, the alignment scoring functions and the
+cd-hit .clstr parser.
+
+The results are written as JSON (`--output`). With `--baseline`, they are
+compared to the results of an earlier run and the script exits with status 1
+if any benchmark got slower by more than `--threshold`.
+
+example::
+
+    python benchmarks/micro_benchmarks.py -o baseline.json
+    # ... make changes ...
+    python benchmarks/micro_benchmarks.py -o new.json --baseline baseline.json
+"""
+
+import argparse
+import contextlib
+import io
+import re
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+import bench_utils
+
+
+def _quiet(func):
+    """`func` with its stdout discarded (the LDO methods print progress)"""
+
+    def quiet_func():
+        with contextlib.redirect_stdout(io.StringIO()):
+            return func()
+
+    return quiet_func
+
+
+def _write_clstr_file(
+    clstr_file: Path, sequence_ids: list[str], cluster_size: int = 5
+) -> Path:
+    """write a cd-hit .clstr file that clusters `sequence_ids` in groups of
+    `cluster_size`"""
+    with open(clstr_file, "w") as f:
+        for i in range(0, len(sequence_ids), cluster_size):
+            f.write(f">Cluster {i // cluster_size}\n")
+            for j, sequence_id in enumerate(sequence_ids[i : i + cluster_size]):
+                if j == 0:
+                    f.write(f"{j}\t350aa, >{sequence_id}... *\n")
+                else:
+                    f.write(f"{j}\t340aa, >{sequence_id}... at 95.00%\n")
+    return clstr_file
+
+
+def select_inputs(species_id: str, max_og_size: int) -> dict:
+    """choose the query gene, OG and other inputs of the benchmarks from the
+    data: the first gene of `species_id` (or of any species) with an OG, and
+    its largest OG with at most `max_og_size` members"""
+    import orthodb_tools.sql_queries as sql_queries
+
+    gene_ids = sorted(sql_queries.get_all_odb_gene_ids_from_species_id(species_id))
+    if not gene_ids:
+        ogid = sql_queries.sample_ogids(1)[0]
+        gene_ids = sql_queries.ogid_2_odb_gene_id_list(ogid)
+    for gene_id in gene_ids:
+        og_info_list = sql_queries.odb_gene_id_2_og_info_list(gene_id)
+        if og_info_list:
+            break
+    else:
+        raise ValueError(f"none of the genes of {species_id} have an OG")
+    og_sizes = {
+        ogid: len(sql_queries.ogid_2_odb_gene_id_list(ogid))
+        for ogid, _, _ in og_info_list
+    }
+    small_ogs = [ogid for ogid, size in og_sizes.items() if size <= max_og_size]
+    if small_ogs:
+        ogid = max(small_ogs, key=og_sizes.get)
+    else:
+        ogid = min(og_sizes, key=og_sizes.get)
+    members = sql_queries.ogid_2_odb_gene_id_list(ogid)
+    uniprot_ids = sql_queries.odb_gene_id_list_2_uniprotid_dict(members)
+    uniprot_id = uniprot_ids.get(gene_id) or next(
+        (u for u in uniprot_ids.values() if u), "P00000"
+    )
+    return {
+        "odb_gene_id": gene_id,
+        "species_id": sql_queries.odb_gene_id_2_species_id(gene_id),
+        "uniprot_id": uniprot_id,
+        "ogid": ogid,
+        "og_size": len(members),
+        "members": members,
+        "ogids": [ogid for ogid, _, _ in og_info_list],
+    }
+
+
+def define_benchmarks(inputs: dict, work_dir: Path) -> dict:
+    """{benchmark name: function to time, or the reason it is skipped}"""
+    import numpy as np
+    import pandas as pd
+    from Bio.Align import substitution_matrices
+
+    import orthodb_tools.env_variables.env_variables as env
+    import orthodb_tools.orthogroup_processing.filters as filters
+    import orthodb_tools.orthogroup_processing.find_LDOs as find_LDOs
+    import orthodb_tools.sql_queries as sql_queries
+    import orthodb_tools.tools.alignment_tools as aln_tools
+    import orthodb_tools.tools.cdhit_tools as cdhit_tools
+    from orthodb_tools.sequence_record import SequenceRecord
+
+    gene_id = inputs["odb_gene_id"]
+    members = inputs["members"]
+    ogid = inputs["ogid"]
+    odb_database = env.get_orthoDB_database()
+    sequence_dict = odb_database.get_sequence_records(members)
+    query_seqrecord = sequence_dict[gene_id]
+    species_id_dict = sql_queries.odb_gene_id_list_2_species_id_dict(members)
+
+    benchmarks = {
+        # single lookups
+        "sql_queries.uniprotid_2_odb_gene_id_refs": lambda: sql_queries.uniprotid_2_odb_gene_id_refs(
+            inputs["uniprot_id"]
+        ),
+        "sql_queries.uniprotid_2_odb_gene_id_xrefs": lambda: sql_queries.uniprotid_2_odb_gene_id_xrefs(
+            inputs["uniprot_id"]
+        ),
+        "sql_queries.odb_gene_id_2_species_id": lambda: sql_queries.odb_gene_id_2_species_id(
+            gene_id
+        ),
+        "sql_queries.odb_gene_id_2_ogid_list": lambda: sql_queries.odb_gene_id_2_ogid_list(
+            gene_id
+        ),
+        "sql_queries.get_ogid_info": lambda: sql_queries.get_ogid_info(ogid),
+        "sql_queries.odb_gene_id_2_og_info_list": lambda: sql_queries.odb_gene_id_2_og_info_list(
+            gene_id
+        ),
+        "sql_queries.odb_gene_id_2_uniprotid": lambda: sql_queries.odb_gene_id_2_uniprotid(
+            gene_id
+        ),
+        "sql_queries.ogid_2_odb_gene_id_list": lambda: sql_queries.ogid_2_odb_gene_id_list(
+            ogid
+        ),
+        # batch lookups, on the members of the OG
+        "sql_queries.odb_gene_id_list_2_species_id_dict": lambda: sql_queries.odb_gene_id_list_2_species_id_dict(
+            members
+        ),
+        "sql_queries.ogid_list_2_ogid_info_dict": lambda: sql_queries.ogid_list_2_ogid_info_dict(
+            inputs["ogids"]
+        ),
+        "sql_queries.odb_gene_id_list_2_uniprotid_dict": lambda: sql_queries.odb_gene_id_list_2_uniprotid_dict(
+            members
+        ),
+        # whole-species lookups
+        "sql_queries.get_all_odb_gene_ids_from_species_id": lambda: sql_queries.get_all_odb_gene_ids_from_species_id(
+            inputs["species_id"]
+        ),
+        "sql_queries.species_id_2_og_info_list": lambda: sql_queries.species_id_2_og_info_list(
+            inputs["species_id"]
+        ),
+        "sql_queries.sample_ogids": lambda: sql_queries.sample_ogids(10),
+        # sequences
+        "orthoDBDatabase.get_sequences_from_list_of_seq_ids": lambda: odb_database.get_sequences_from_list_of_seq_ids(
+            members
+        ),
+        "orthoDBDatabase.get_sequence_records": lambda: odb_database.get_sequence_records(
+            members
+        ),
+        "filters.filter_seqs_with_nonaa_chars": lambda: filters.filter_seqs_with_nonaa_chars(
+            sequence_dict
+        ),
+        "filters.filter_shorter_sequences": lambda: filters.filter_shorter_sequences(
+            sequence_dict, 0.5 * len(query_seqrecord)
+        ),
+    }
+
+    # LDO selection, one benchmark per method
+    mafft_found = shutil.which(env.MAFFT_EXECUTABLE) is not None
+    for method in ["alfpy_google_distance", "pairwise", "msa", "msa_by_organism"]:
+        name = f"find_LDOs.find_LDOs_main[{method}]"
+        if method.startswith("msa") and not mafft_found:
+            benchmarks[name] = f"mafft executable `{env.MAFFT_EXECUTABLE}` not found"
+            continue
+        benchmarks[name] = _quiet(
+            lambda method=method: find_LDOs.find_LDOs_main(
+                sequence_dict,
+                query_seqrecord,
+                pid_method=method,
+                n_align_threads=1,
+                species_id_dict=species_id_dict,
+            )
+        )
+
+    # alignment scoring, on the global alignment of the query and another member
+    other_seqrecord = next(
+        (s for i, s in sequence_dict.items() if i != gene_id), query_seqrecord
+    )
+    alignment = aln_tools.pairwise_alignment(
+        str(query_seqrecord.seq), str(other_seqrecord.seq)
+    )
+    aligned_1 = SequenceRecord(query_seqrecord.id, alignment[0])
+    aligned_2 = SequenceRecord(other_seqrecord.id, alignment[1])
+    blosum62 = substitution_matrices.load("BLOSUM62")
+    subs_mat_df = pd.DataFrame(
+        np.array(blosum62),
+        index=list(blosum62.alphabet),
+        columns=list(blosum62.alphabet),
+    )
+    benchmarks["aln_tools.compute_pairwise_percent_id_from_msa"] = (
+        lambda: aln_tools.compute_pairwise_percent_id_from_msa(aligned_1, aligned_2)
+    )
+    benchmarks["aln_tools.score_alignment"] = lambda: aln_tools.score_alignment(
+        alignment[0], alignment[1], subs_mat_df
+    )
+
+    clstr_file = _write_clstr_file(work_dir / "benchmark.clstr", members)
+    benchmarks["cdhit_tools.cd_hit_clstr_parser"] = (
+        lambda: cdhit_tools.cd_hit_clstr_parser(clstr_file)
+    )
+    return benchmarks
+
+
+def run(
+    source_dir: str | Path,
+    repeat: int = 5,
+    min_time: float = 0.2,
+    name_filter: str | None = None,
+    species_id: str = "9606_0",
+    max_og_size: int = 500,
+    sequence_store: str = "sqlite",
+    compact: bool = False,
+    work_dir: str | Path | None = None,
+) -> dict:
+    """build the databases for the files in `source_dir` in `work_dir` (a
+    temporary directory by default) and run the benchmarks whose names match
+    the regex `name_filter`"""
+    with contextlib.ExitStack() as stack:
+        if work_dir is None:
+            work_dir = stack.enter_context(
+                tempfile.TemporaryDirectory(prefix="odb_benchmarks_")
+            )
+        work_dir = Path(work_dir)
+        bench_utils.link_source_files(source_dir, work_dir)
+        bench_utils.use_data_dir(work_dir, SEQUENCE_STORE=sequence_store)
+        build_time = bench_utils.build_databases(compact=compact)
+
+        inputs = select_inputs(species_id, max_og_size)
+        print(
+            f"query: {inputs['odb_gene_id']}, OG: {inputs['ogid']} ({inputs['og_size']} members)"
+        )
+        benchmarks = define_benchmarks(inputs, work_dir)
+        results = {}
+        width = max(len(name) for name in benchmarks)
+        print(bench_utils.format_results({"benchmarks": {}}, width=width))
+        for name, func in benchmarks.items():
+            if name_filter is not None and not re.search(name_filter, name):
+                continue
+            if isinstance(func, str):
+                results[name] = {"skipped": func}
+            else:
+                results[name] = bench_utils.time_function(func, repeat, min_time)
+            print(
+                bench_utils.format_results(
+                    {"benchmarks": {name: results[name]}}, header=False, width=width
+                )
+            )
+        return {
+            "suite": "micro",
+            "metadata": bench_utils.run_metadata(
+                source_dir=str(Path(source_dir).resolve()),
+                sequence_store=sequence_store,
+                compact=compact,
+                build_time_s=build_time,
+                inputs={k: v for k, v in inputs.items() if k != "members"},
+            ),
+            "benchmarks": results,
+        }
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(
+        description="""time the functions that the pipeline spends its time in, on the bundled sample data
+(or on another set of orthoDB files). The databases are built in a temporary directory.
+Results are written as JSON and can be compared to an earlier run with --baseline""",
+        formatter_class=argparse.RawTextHelpFormatter,
+    )
+    parser.add_argument(
+        "-d",
+        "--data_dir",
+        type=str,
+        metavar="<dir>",
+        default=str(bench_utils.SAMPLE_DATA_DIR),
+        help=f"""directory with the odb11v0_*.tab files. Default is the bundled sample data ({bench_utils.SAMPLE_DATA_DIR})""",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        metavar="<file>",
+        default=None,
+        help="""write the results to this JSON file""",
+    )
+    parser.add_argument(
+        "-b",
+        "--baseline",
+        type=str,
+        metavar="<file>",
+        default=None,
+        help="""compare the results to the results in this JSON file (from an earlier run).
+Exits with status 1 if any benchmark is slower than the baseline by more than --threshold""",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        metavar="<float>",
+        default=bench_utils.DEFAULT_THRESHOLD,
+        help=f"""relative change in the median time that counts as a regression/improvement. Default is {bench_utils.DEFAULT_THRESHOLD}""",
+    )
+    parser.add_argument(
+        "-k",
+        "--filter",
+        type=str,
+        metavar="<regex>",
+        default=None,
+        help="""only run the benchmarks whose names match this regular expression""",
+    )
+    parser.add_argument(
+        "-r",
+        "--repeat",
+        type=int,
+        metavar="<int>",
+        default=5,
+        help="""number of times each timing loop is repeated. Default is 5""",
+    )
+    parser.add_argument(
+        "--min_time",
+        type=float,
+        metavar="<float>",
+        default=0.2,
+        help="""minimum time of each timing loop in seconds. Default is 0.2""",
+    )
+    parser.add_argument(
+        "-s",
+        "--species_id",
+        type=str,
+        metavar="<str>",
+        default="9606_0",
+        help="""species of the query gene. Default is 9606_0 (human)""",
+    )
+    parser.add_argument(
+        "--max_og_size",
+        type=int,
+        metavar="<int>",
+        default=500,
+        help="""use the largest OG of the query gene with at most this many members. Default is 500""",
+    )
+    parser.add_argument(
+        "--sequence_store",
+        type=str,
+        default="sqlite",
+        choices=["sqlite", "offset_index", "compressed"],
+        help="""sequence store to build and read sequences from. Default is sqlite""",
+    )
+    parser.add_argument(
+        "--compact",
+        action="store_true",
+        help="""build the databases with the compact schema""",
+    )
+    args = parser.parse_args()
+    results = run(
+        args.data_dir,
+        repeat=args.repeat,
+        min_time=args.min_time,
+        name_filter=args.filter,
+        species_id=args.species_id,
+        max_og_size=args.max_og_size,
+        sequence_store=args.sequence_store,
+        compact=args.compact,
+    )
+    if args.output is not None:
+        bench_utils.save_results(results, args.output)
+        print(f"results saved to {args.output}")
+    if args.baseline is not None:
+        rows = bench_utils.compare_results(
+            results, bench_utils.load_results(args.baseline), args.threshold
+        )
+        print(bench_utils.format_comparison(rows))
+        if any(row["status"] == "regression" for row in rows):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,481 @@
+#!/usr/bin/env python
+
+"""
+end-to-end benchmarks of the pipeline, with stand-ins for mafft and cd-hit
+
+mafft and cd-hit take up most of the time of a real run, which hides the time
+spent in the pipeline itself (OG lookups, fetching sequences, LDO selection,
+writing the output files). By default, these benchmarks run the pipeline with
+the deterministic stand-ins in `stub_tools/`, which return a valid alignment
+or clustering almost instantly, so what is measured is the pipeline. They also
+don't need mafft or cd-hit to be installed. Use `--real_tools` to run with the
+executables in the `.env` file instead.
+
+The benchmarks:
+
+- `orthogroup_pipeline`: the first `--n_genes` genes of `--species_id`, one
+  `orthogroup_pipeline` call per gene and level, in this process
+- `pipeline_input_table`: the same genes through
+  `odb_groups-pipeline_input_table` (`--n_cores` workers)
+- `pipeline_all_genes_in_species`: every gene of `--species_id` through
+  `odb_groups-pipeline_all_genes_in_species` (`--n_cores` workers), once
+  with one job per gene and once with one job per OG and level (`group_by_og`)
+
+A job is one gene at one level. For each benchmark, the time per job, the
+number of jobs per second and the time spent in each stage of the pipeline per
+job (from the stage metrics, see `orthodb_tools/stage_metrics.py`) are
+reported. The results are saved and compared like the results of
+`micro_benchmarks.py`.
+
+example::
+
+    python benchmarks/pipeline_benchmarks.py -o baseline.json
+    python benchmarks/pipeline_benchmarks.py -o new.json --baseline baseline.json
+"""
+
+import argparse
+import contextlib
+import re
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import bench_utils
+
+STUB_TOOLS_DIR = Path(__file__).resolve().parent / "stub_tools"
+OG_LEVELS = ["Vertebrata", "Mammalia"]
+LDO_METHODS = ["msa_by_organism", "alfpy_google_distance", "pairwise", "msa"]
+
+
+def stub_tool_env_vars() -> dict[str, str]:
+    """.env variables that replace mafft and cd-hit with the stand-ins"""
+    return {
+        "MAFFT_EXECUTABLE": str(STUB_TOOLS_DIR / "mafft"),
+        "CD_HIT_EXECUTABLE": str(STUB_TOOLS_DIR / "cd-hit"),
+        "MAFFT_ADDITIONAL_ARGUMENTS": "",
+        "CD_HIT_ADDITIONAL_ARGUMENTS": "",
+    }
+
+
+def make_config(output_folder: Path, ldo_method: str, og_level: str = OG_LEVELS[0]):
+    import orthodb_tools.config.orthodb_pipeline_parameters as conf
+
+    return conf.PipelineParams(
+        og_select_params=conf.OGSelectConf(OG_level_name=og_level),
+        ldo_select_params=conf.LDOSelectConf(
+            LDO_selection_method=ldo_method, LDO_mafft_threads=1
+        ),
+        align_params=conf.AlignConf(align=True, n_align_threads=1),
+        main_output_folder=str(output_folder),
+        overwrite=True,
+    )
+
+
+def species_jobs(species_id: str, og_levels: list[str]):
+    """the genes of `species_id` that have an OG at one of `og_levels`, and
+    the (gene, level) jobs the pipeline scripts run for them"""
+    import orthodb_tools.orthogroup_processing.og_selection as og_selection
+
+    og_table = og_selection.species_og_level_table(species_id, og_levels)
+    og_table = og_table[og_table["n OGs"] > 0]
+    return list(og_table[["odb_gene_id", "level name"]].itertuples(index=False))
+
+
+@contextlib.contextmanager
+def _output_to(log_file: Path | None):
+    """send the output of the pipeline to `log_file` (if not None)"""
+    if log_file is None:
+        yield
+        return
+    with open(log_file, "a") as f:
+        with contextlib.redirect_stdout(f), contextlib.redirect_stderr(f):
+            yield
+
+
+def _run_orthogroup_pipeline(config, jobs):
+    import orthodb_tools.orthogroup_processing.pipeline as pipeline
+
+    for odb_gene_id, og_level in jobs:
+        config.og_select_params.OG_level_name = og_level
+        try:
+            pipeline.orthogroup_pipeline(config, odb_gene_id=odb_gene_id)
+        except ValueError as err:
+            # same as the scripts: genes with e.g. several OGs at a level fail
+            print(f"{odb_gene_id} - {og_level} - {err}")
+
+
+def time_pipeline(
+    run_func, output_folder: Path, n_jobs: int, repeat: int, n_workers: int = 1
+) -> dict:
+    """run `run_func()` (which runs `n_jobs` jobs in `n_workers` processes and
+    writes its output to `output_folder`) `repeat` times
+
+    Returns
+    -------
+    dict
+        the time per job (min, median, mean, stdev over the repeats), the
+        jobs per second of the median run and the time spent in each stage
+        per job. The stage times are from the run with the median time
+    """
+    import orthodb_tools.stage_metrics as stage_metrics
+
+    runs = []
+    for _ in range(repeat):
+        if output_folder.exists():
+            shutil.rmtree(output_folder)
+        stage_metrics.reset_totals()
+        start_time = time.perf_counter()
+        summary = run_func()
+        wall = time.perf_counter() - start_time
+        if summary is None:
+            # the batch scripts save the summary of their workers
+            summary = bench_utils.load_results(
+                output_folder / "stage_metrics_summary.json"
+            )
+        runs.append((wall, summary))
+    runs.sort(key=lambda run: run[0])
+    median_wall, median_summary = runs[(len(runs) - 1) // 2]
+    times = [wall / n_jobs for wall, _ in runs]
+    return {
+        "min_s": min(times),
+        "median_s": statistics.median(times),
+        "mean_s": statistics.fmean(times),
+        "stdev_s": statistics.stdev(times) if len(times) > 1 else 0.0,
+        "number": n_jobs,
+        "repeat": repeat,
+        "jobs": n_jobs,
+        "wall_s": median_wall,
+        "jobs_per_s": n_jobs / median_wall,
+        "stages": stage_overhead(median_summary, n_jobs, median_wall, n_workers),
+    }
+
+
+def stage_overhead(summary: dict, n_jobs: int, wall: float, n_workers: int = 1) -> dict:
+    """the wall/CPU time of each stage per job, in ms, and the share of the
+    summed stage wall times. `unaccounted` is the wall time of the run that
+    wasn't spent in a stage (e.g. loading the OG table), per job. It is None
+    with several workers, where the stage times of the workers overlap"""
+    total_stage_wall = sum(total["wall_s"] for total in summary.values())
+    stages = {}
+    for stage, total in summary.items():
+        stages[stage] = {
+            "wall_ms_per_job": 1000 * total["wall_s"] / n_jobs,
+            "cpu_ms_per_job": 1000 * total["cpu_s"] / n_jobs,
+            "children_cpu_ms_per_job": 1000 * total["children_cpu_s"] / n_jobs,
+            "share": total["wall_s"] / total_stage_wall if total_stage_wall else 0.0,
+            "peak_rss_mb": total["peak_rss_mb"],
+        }
+    unaccounted = None
+    if n_workers == 1:
+        unaccounted = 1000 * (wall - total_stage_wall) / n_jobs
+    return {"stages": stages, "unaccounted_ms_per_job": unaccounted}
+
+
+def format_stage_overhead(name: str, result: dict) -> str:
+    lines = [
+        f"{name}: {result['jobs']} jobs in {result['wall_s']:.2f} s, {result['jobs_per_s']:.1f} jobs/s",
+        f"  {'stage':<16} {'wall ms/job':>12} {'cpu ms/job':>11} {'child cpu ms/job':>17} {'share':>7}",
+    ]
+    for stage, overhead in result["stages"]["stages"].items():
+        lines.append(
+            f"  {stage:<16} {overhead['wall_ms_per_job']:>12.2f} {overhead['cpu_ms_per_job']:>11.2f} {overhead['children_cpu_ms_per_job']:>17.2f} {overhead['share']:>7.1%}"
+        )
+    unaccounted = result["stages"]["unaccounted_ms_per_job"]
+    if unaccounted is not None:
+        lines.append(f"  {'unaccounted':<16} {unaccounted:>12.2f}")
+    return "\n".join(lines)
+
+
+def define_benchmarks(
+    work_dir: Path,
+    species_id: str,
+    og_levels: list[str],
+    n_genes: int,
+    ldo_method: str,
+    n_cores: int,
+) -> dict:
+    """{benchmark name: (function that runs it, output folder, number of jobs,
+    number of worker processes)}"""
+    import pandas as pd
+
+    import orthodb_tools.scripts.pipeline_all_genes_in_species as all_genes_script
+    import orthodb_tools.scripts.pipeline_input_table as input_table_script
+
+    all_jobs = species_jobs(species_id, og_levels)
+    if not all_jobs:
+        raise ValueError(f"no genes of {species_id} have an OG at {og_levels}")
+    genes = list(dict.fromkeys(gene for gene, _ in all_jobs))[:n_genes]
+    gene_jobs = [job for job in all_jobs if job[0] in set(genes)]
+    table_file = work_dir / "genes.csv"
+    pd.DataFrame({"odb_gene_id": genes}).to_csv(table_file, index=False)
+    multiprocess = n_cores > 1
+
+    benchmarks = {}
+    output_folder = work_dir / "orthogroup_pipeline"
+    config = make_config(output_folder, ldo_method)
+
+    def run_orthogroup_pipeline(config=config):
+        import orthodb_tools.stage_metrics as stage_metrics
+
+        _run_orthogroup_pipeline(config, gene_jobs)
+        return stage_metrics.merge_totals([stage_metrics.totals()])
+
+    benchmarks[f"orthogroup_pipeline[{ldo_method}]"] = (
+        run_orthogroup_pipeline,
+        output_folder,
+        len(gene_jobs),
+        1,
+    )
+
+    output_folder = work_dir / "pipeline_input_table"
+    config = make_config(output_folder, ldo_method)
+    benchmarks[f"pipeline_input_table[{ldo_method},n_cores={n_cores}]"] = (
+        lambda config=config: input_table_script.main(
+            config,
+            str(table_file),
+            og_levels,
+            odb_gene_id_column="odb_gene_id",
+            n_cores=n_cores,
+            multiprocess=multiprocess,
+        ),
+        output_folder,
+        len(gene_jobs),
+        n_cores,
+    )
+
+    output_folder = work_dir / "pipeline_all_genes_in_species"
+    config = make_config(output_folder, ldo_method)
+    benchmarks[f"pipeline_all_genes_in_species[{ldo_method},n_cores={n_cores}]"] = (
+        lambda config=config: all_genes_script.main(
+            config,
+            og_levels,
+            multiprocess=multiprocess,
+            species_id=species_id,
+            n_cores=n_cores,
+            overwrite=True,
+        ),
+        output_folder,
+        len(all_jobs),
+        n_cores,
+    )
+
+    output_folder = work_dir / "pipeline_all_genes_in_species_grouped"
+    config = make_config(output_folder, ldo_method)
+    benchmarks[
+        f"pipeline_all_genes_in_species[{ldo_method},n_cores={n_cores},group_by_og]"
+    ] = (
+        lambda config=config: all_genes_script.main(
+            config,
+            og_levels,
+            multiprocess=multiprocess,
+            species_id=species_id,
+            n_cores=n_cores,
+            overwrite=True,
+            group_by_og=True,
+        ),
+        output_folder,
+        len(all_jobs),
+        n_cores,
+    )
+    return benchmarks
+
+
+def run(
+    source_dir: str | Path,
+    species_id: str = "9606_0",
+    og_levels: list[str] = OG_LEVELS,
+    n_genes: int = 20,
+    ldo_method: str = "alfpy_google_distance",
+    n_cores: int = 1,
+    repeat: int = 3,
+    name_filter: str | None = None,
+    real_tools: bool = False,
+    verbose: bool = False,
+    work_dir: str | Path | None = None,
+) -> dict:
+    """build the databases for the files in `source_dir` in `work_dir` (a
+    temporary directory by default) and run the benchmarks whose names match
+    the regex `name_filter`"""
+    with contextlib.ExitStack() as stack:
+        if work_dir is None:
+            work_dir = stack.enter_context(
+                tempfile.TemporaryDirectory(prefix="odb_benchmarks_")
+            )
+        work_dir = Path(work_dir)
+        bench_utils.link_source_files(source_dir, work_dir)
+        env_vars = {} if real_tools else stub_tool_env_vars()
+        bench_utils.use_data_dir(work_dir, **env_vars)
+        log_file = None if verbose else work_dir / "pipeline.log"
+        with _output_to(log_file):
+            build_time = bench_utils.build_databases()
+
+        benchmarks = define_benchmarks(
+            work_dir, species_id, og_levels, n_genes, ldo_method, n_cores
+        )
+        results = {}
+        for name, (run_func, output_folder, n_jobs, n_workers) in benchmarks.items():
+            if name_filter is not None and not re.search(name_filter, name):
+                continue
+            print(f"running {name} ({n_jobs} jobs x {repeat})")
+            with _output_to(log_file):
+                results[name] = time_pipeline(
+                    run_func, output_folder, n_jobs, repeat, n_workers
+                )
+            print(format_stage_overhead(name, results[name]))
+        return {
+            "suite": "pipeline",
+            "metadata": bench_utils.run_metadata(
+                source_dir=str(Path(source_dir).resolve()),
+                build_time_s=build_time,
+                species_id=species_id,
+                og_levels=og_levels,
+                n_genes=n_genes,
+                ldo_method=ldo_method,
+                n_cores=n_cores,
+                tools="real" if real_tools else "stub",
+            ),
+            "benchmarks": results,
+        }
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(
+        description="""end-to-end benchmarks of the pipeline (orthogroup_pipeline and the batch scripts), on the bundled
+sample data (or on another set of orthoDB files). The databases are built in a temporary directory.
+By default, mafft and cd-hit are replaced with stand-ins that return almost instantly (benchmarks/stub_tools/),
+so that the time spent in the pipeline itself is measured.
+Reports the time per job (one gene at one level), jobs per second and the time spent in each stage per job.
+Results are written as JSON and can be compared to an earlier run with --baseline""",
+        formatter_class=argparse.RawTextHelpFormatter,
+    )
+    parser.add_argument(
+        "-d",
+        "--data_dir",
+        type=str,
+        metavar="<dir>",
+        default=str(bench_utils.SAMPLE_DATA_DIR),
+        help=f"""directory with the odb11v0_*.tab files. Default is the bundled sample data ({bench_utils.SAMPLE_DATA_DIR})""",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        metavar="<file>",
+        default=None,
+        help="""write the results to this JSON file""",
+    )
+    parser.add_argument(
+        "-b",
+        "--baseline",
+        type=str,
+        metavar="<file>",
+        default=None,
+        help="""compare the results to the results in this JSON file (from an earlier run).
+Exits with status 1 if the time per job of any benchmark is higher than in the baseline by more than --threshold""",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        metavar="<float>",
+        default=bench_utils.DEFAULT_THRESHOLD,
+        help=f"""relative change in the median time per job that counts as a regression/improvement. Default is {bench_utils.DEFAULT_THRESHOLD}""",
+    )
+    parser.add_argument(
+        "-k",
+        "--filter",
+        type=str,
+        metavar="<regex>",
+        default=None,
+        help="""only run the benchmarks whose names match this regular expression""",
+    )
+    parser.add_argument(
+        "-r",
+        "--repeat",
+        type=int,
+        metavar="<int>",
+        default=3,
+        help="""number of times each benchmark is run. Default is 3""",
+    )
+    parser.add_argument(
+        "-s",
+        "--species_id",
+        type=str,
+        metavar="<str>",
+        default="9606_0",
+        help="""species of the query genes. Default is 9606_0 (human)""",
+    )
+    parser.add_argument(
+        "-l",
+        "--og_levels",
+        nargs="*",
+        metavar="<list>",
+        default=OG_LEVELS,
+        help=f"""levels to run each gene at. Default is {OG_LEVELS}""",
+    )
+    parser.add_argument(
+        "-g",
+        "--n_genes",
+        type=int,
+        metavar="<int>",
+        default=20,
+        help="""number of genes for the orthogroup_pipeline and pipeline_input_table benchmarks.
+pipeline_all_genes_in_species runs every gene of the species. Default is 20""",
+    )
+    parser.add_argument(
+        "-m",
+        "--ldo_method",
+        type=str,
+        default="alfpy_google_distance",
+        choices=LDO_METHODS,
+        help="""LDO selection method. Default is alfpy_google_distance""",
+    )
+    parser.add_argument(
+        "-n",
+        "--n_cores",
+        type=int,
+        metavar="<int>",
+        default=1,
+        help="""number of worker processes of the batch scripts. With 1, the jobs are run in this process. Default is 1""",
+    )
+    parser.add_argument(
+        "--real_tools",
+        action="store_true",
+        help="""use the mafft and cd-hit executables in the .env file instead of the stand-ins""",
+    )
+    parser.add_argument(
+        "-v",
+        "--verbose",
+        action="store_true",
+        help="""show the output of the pipeline (by default it is written to a log file in the temporary directory)""",
+    )
+    args = parser.parse_args()
+    results = run(
+        args.data_dir,
+        species_id=args.species_id,
+        og_levels=args.og_levels,
+        n_genes=args.n_genes,
+        ldo_method=args.ldo_method,
+        n_cores=args.n_cores,
+        repeat=args.repeat,
+        name_filter=args.filter,
+        real_tools=args.real_tools,
+        verbose=args.verbose,
+    )
+    print(bench_utils.format_results(results))
+    if args.output is not None:
+        bench_utils.save_results(results, args.output)
+        print(f"results saved to {args.output}")
+    if args.baseline is not None:
+        rows = bench_utils.compare_results(
+            results, bench_utils.load_results(args.baseline), args.threshold
+        )
+        print(bench_utils.format_comparison(rows))
+        if any(row["status"] == "regression" for row in rows):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main_cli()
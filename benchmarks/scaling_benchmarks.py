@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+
+"""
+how the database build, the lookups and LDO selection scale with the size of
+the orthoDB data
+
+For each size (approximate number of genes), a synthetic data set is
+generated with `synthetic_data.py` and `micro_benchmarks.py` is run on it in a
+separate process (the orthoDB data directory is read when orthodb_tools is
+imported, so it can't change within a process). The build time of the
+databases and the median time of each micro-benchmark are reported for each
+size.
+
+example::
+
+    python benchmarks/scaling_benchmarks.py --sizes 1000 10000 100000 1000000 -o scaling.json
+"""
+
+import argparse
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+import bench_utils
+import synthetic_data
+
+BENCHMARKS_DIR = Path(__file__).resolve().parent
+SIZES = [1_000, 10_000, 100_000]
+# the lookups, fetching sequences and LDO selection without mafft
+DEFAULT_FILTER = r"sql_queries|orthoDBDatabase|alfpy|pairwise\]"
+
+
+def run_size(
+    n_genes: int,
+    work_dir: Path,
+    generator_kwargs: dict,
+    benchmark_args: list[str],
+) -> dict:
+    """generate a data set with about `n_genes` genes in `work_dir` and run
+    the micro-benchmarks on it"""
+    data_dir = work_dir / f"data_{n_genes}"
+    n_ogs = synthetic_data.n_ogs_for_n_genes(
+        n_genes,
+        generator_kwargs["n_species"],
+        generator_kwargs["og_size"],
+        generator_kwargs["paralogs"],
+        generator_kwargs["og_size_distribution"],
+    )
+    summary = synthetic_data.generate(data_dir, n_ogs=n_ogs, **generator_kwargs)
+    print(
+        f"{n_genes:,}: generated {summary['n_genes']:,} genes in {summary['n_ogs']:,} OGs in {summary['time_s']} s"
+    )
+    results_file = work_dir / f"results_{n_genes}.json"
+    subprocess.run(
+        [
+            sys.executable,
+            str(BENCHMARKS_DIR / "micro_benchmarks.py"),
+            "--data_dir",
+            str(data_dir),
+            "--output",
+            str(results_file),
+            *benchmark_args,
+        ],
+        check=True,
+        stdout=subprocess.DEVNULL,
+    )
+    results = bench_utils.load_results(results_file)
+    results["metadata"]["synthetic_data"] = summary
+    return results
+
+
+def format_scaling(results_by_size: dict) -> str:
+    """one row per benchmark, one column per size, with the median times and
+    the build time of the databases in the first row"""
+    sizes = list(results_by_size)
+    names = []
+    for results in results_by_size.values():
+        names += [n for n in results["benchmarks"] if n not in names]
+    width = max(len(n) for n in names + ["build databases"])
+    lines = [
+        f"{'n genes':<{width}} "
+        + " ".join(
+            f"{results_by_size[s]['metadata']['synthetic_data']['n_genes']:>12,}"
+            for s in sizes
+        )
+    ]
+    lines.append(
+        f"{'build databases':<{width}} "
+        + " ".join(
+            f"{bench_utils.format_time(results_by_size[s]['metadata']['build_time_s']):>12}"
+            for s in sizes
+        )
+    )
+    for name in names:
+        times = []
+        for s in sizes:
+            result = results_by_size[s]["benchmarks"].get(name, {})
+            times.append(bench_utils.format_time(result.get("median_s")))
+        lines.append(f"{name:<{width}} " + " ".join(f"{t:>12}" for t in times))
+    return "\n".join(lines)
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(
+        description="""run the micro-benchmarks (and time the database build) on synthetic data sets of increasing size
+(see synthetic_data.py), to see how they scale with the number of genes""",
+        formatter_class=argparse.RawTextHelpFormatter,
+    )
+    parser.add_argument(
+        "--sizes",
+        nargs="*",
+        type=int,
+        metavar="<int>",
+        default=SIZES,
+        help=f"""approximate numbers of genes of the data sets. Default is {SIZES}""",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        metavar="<file>",
+        default=None,
+        help="""write the results of every size to this JSON file""",
+    )
+    parser.add_argument(
+        "-w",
+        "--work_dir",
+        type=str,
+        metavar="<dir>",
+        default=None,
+        help="""directory for the data sets and the results of each size. They are kept after the run.
+Default is a temporary directory that is deleted at the end""",
+    )
+    parser.add_argument(
+        "-k",
+        "--filter",
+        type=str,
+        metavar="<regex>",
+        default=DEFAULT_FILTER,
+        help=f"""micro-benchmarks to run (regex). Default is {DEFAULT_FILTER}""",
+    )
+    parser.add_argument(
+        "-r",
+        "--repeat",
+        type=int,
+        metavar="<int>",
+        default=3,
+        help="""number of times each timing loop is repeated. Default is 3""",
+    )
+    parser.add_argument(
+        "--n_species",
+        type=int,
+        metavar="<int>",
+        default=100,
+        help="""number of species of the data sets. Default is 100""",
+    )
+    parser.add_argument(
+        "--og_size",
+        type=float,
+        metavar="<float>",
+        default=20,
+        help="""median number of species that a gene family is present in. Default is 20""",
+    )
+    parser.add_argument(
+        "--og_size_distribution",
+        type=str,
+        default="lognormal",
+        choices=synthetic_data.OG_SIZE_DISTRIBUTIONS,
+        help="""distribution of the number of species in a gene family. Default is lognormal""",
+    )
+    parser.add_argument(
+        "--paralogs",
+        type=float,
+        metavar="<float>",
+        default=1.3,
+        help="""mean number of genes of a family in each species that it is present in. Default is 1.3""",
+    )
+    parser.add_argument(
+        "--compact",
+        action="store_true",
+        help="""build the databases with the compact schema""",
+    )
+    args = parser.parse_args()
+    generator_kwargs = {
+        "n_species": args.n_species,
+        "og_size": args.og_size,
+        "og_size_distribution": args.og_size_distribution,
+        "paralogs": args.paralogs,
+    }
+    benchmark_args = ["--filter", args.filter, "--repeat", str(args.repeat)]
+    if args.compact:
+        benchmark_args.append("--compact")
+    with tempfile.TemporaryDirectory(prefix="odb_scaling_") as temp_dir:
+        work_dir = Path(args.work_dir) if args.work_dir is not None else Path(temp_dir)
+        work_dir.mkdir(parents=True, exist_ok=True)
+        results_by_size = {}
+        for n_genes in args.sizes:
+            results_by_size[n_genes] = run_size(
+                n_genes, work_dir, generator_kwargs, benchmark_args
+            )
+    print(format_scaling(results_by_size))
+    if args.output is not None:
+        bench_utils.save_results(
+            {
+                "suite": "scaling",
+                "metadata": bench_utils.run_metadata(sizes=args.sizes),
+                "results": {str(s): r for s, r in results_by_size.items()},
+            },
+            args.output,
+        )
+        print(f"results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main_cli()
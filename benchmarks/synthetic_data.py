@@ -0,0 +1,480 @@
+#!/usr/bin/env python
+
+"""
+generate a synthetic set of orthoDB files (`odb11v0_*.tab`) for scale testing
+
+The files have the same columns and id formats as the real orthoDB files, so
+the databases can be built from them and the pipeline can be run on them.
+Only the sizes are meant to be realistic:
+
+- the levels are nested (each level contains the first `level_fraction` of
+  the species of the level above it). The first 5 are named like the orthoDB
+  levels (Eukaryota > Metazoa > Vertebrata > Tetrapoda > Mammalia), so the
+  default levels of the pipeline scripts can be used. The first species is
+  human (`9606_0`) and is in every level
+- each gene family is present in a number of species drawn from
+  `og_size_distribution`, with `1 + Poisson(paralogs - 1)` genes in each of
+  them. A family has an OG at each level where it is present in at least
+  `MIN_SPECIES_PER_OG` species. The OG contains all of the family's genes in
+  the species of the level
+- the genes of a family are copies of a random ancestral sequence (length
+  drawn from a lognormal distribution around `seq_length`) in which a random
+  fraction of up to `divergence` of the residues are substituted, with a
+  random start and end (each gene is 85-100% of the family length)
+- a `uniprot_fraction` of the genes have a UniProt id (`SYN` + a number), in
+  the genes table and the xrefs
+
+The output only depends on the parameters and the `seed`.
+
+example::
+
+    python benchmarks/synthetic_data.py -o synthetic_data --n_genes 100000
+    python benchmarks/micro_benchmarks.py -d synthetic_data
+"""
+
+import argparse
+import json
+import math
+import time
+from pathlib import Path
+
+import numpy as np
+
+# (name, NCBI tax id) of the first levels
+LEVELS = [
+    ("Eukaryota", 2759),
+    ("Metazoa", 33208),
+    ("Vertebrata", 7742),
+    ("Tetrapoda", 32523),
+    ("Mammalia", 40674),
+]
+# tax ids of the levels after the first 5, and of the species other than human
+EXTRA_LEVEL_TAXID_START = 900_000
+SPECIES_TAXID_START = 1_000_000
+HUMAN = (9606, "Homo sapiens")
+MIN_SPECIES_PER_OG = 2
+OG_SIZE_DISTRIBUTIONS = ["lognormal", "uniform", "fixed"]
+AMINO_ACIDS = np.frombuffer(b"ACDEFGHIKLMNPQRSTVWY", dtype=np.uint8)
+MIN_SEQ_LENGTH = 30
+MAX_SEQ_LENGTH = 5000
+FASTA_LINE_LENGTH = 60
+# the fraction of the family length that each gene covers
+MIN_GENE_COVERAGE = 0.85
+
+
+def _level_list(n_levels: int) -> list[tuple[str, int]]:
+    levels = LEVELS[:n_levels]
+    for i in range(len(levels), n_levels):
+        levels.append((f"Level{i}", EXTRA_LEVEL_TAXID_START + i))
+    return levels
+
+
+def _species_list(n_species: int) -> list[tuple[int, str, str]]:
+    """(NCBI tax id, species id, species name) of each species"""
+    species = [(HUMAN[0], f"{HUMAN[0]}_0", HUMAN[1])]
+    for i in range(1, n_species):
+        taxid = SPECIES_TAXID_START + i
+        species.append((taxid, f"{taxid}_0", f"Synthetic species {i}"))
+    return species
+
+
+def level_sizes(n_species: int, n_levels: int, level_fraction: float) -> list[int]:
+    """the number of species in each level. Level i has the first
+    `n_species * level_fraction**i` species (at least `MIN_SPECIES_PER_OG`)"""
+    return [
+        min(
+            n_species,
+            max(MIN_SPECIES_PER_OG, round(n_species * level_fraction**i)),
+        )
+        for i in range(n_levels)
+    ]
+
+
+def n_ogs_for_n_genes(
+    n_genes: int,
+    n_species: int,
+    og_size: float,
+    paralogs: float,
+    og_size_distribution: str = "lognormal",
+) -> int:
+    """the number of gene families that gives about `n_genes` genes"""
+    # the mean family size, from a sample of the (clipped) distribution
+    mean_og_size = _draw_og_sizes(
+        np.random.default_rng(0), 10_000, n_species, og_size, og_size_distribution
+    ).mean()
+    return max(1, round(n_genes / (mean_og_size * paralogs)))
+
+
+def _draw_og_sizes(
+    rng: np.random.Generator,
+    n_ogs: int,
+    n_species: int,
+    og_size: float,
+    distribution: str,
+) -> np.ndarray:
+    """the number of species that each family is present in"""
+    if distribution == "lognormal":
+        sizes = rng.lognormal(math.log(og_size), 1.0, n_ogs)
+    elif distribution == "uniform":
+        sizes = rng.uniform(MIN_SPECIES_PER_OG, 2 * og_size - MIN_SPECIES_PER_OG, n_ogs)
+    elif distribution == "fixed":
+        sizes = np.full(n_ogs, og_size)
+    else:
+        raise ValueError(
+            f"unknown og_size_distribution `{distribution}`. must be one of: {OG_SIZE_DISTRIBUTIONS}"
+        )
+    return np.clip(np.rint(sizes), MIN_SPECIES_PER_OG, n_species).astype(np.int64)
+
+
+def _family_sequences(
+    rng: np.random.Generator, n_genes: int, family_length: int, divergence: float
+) -> list[bytes]:
+    """the sequences of the genes of a family (see the module docstring)"""
+    ancestor = rng.choice(AMINO_ACIDS, family_length)
+    copies = np.tile(ancestor, (n_genes, 1))
+    rates = rng.uniform(0, divergence, (n_genes, 1))
+    mutated = rng.random(copies.shape) < rates
+    copies[mutated] = rng.choice(AMINO_ACIDS, int(mutated.sum()))
+    lengths = np.maximum(
+        MIN_SEQ_LENGTH,
+        (family_length * rng.uniform(MIN_GENE_COVERAGE, 1, n_genes)).astype(np.int64),
+    )
+    lengths = np.minimum(lengths, family_length)
+    starts = rng.integers(0, family_length - lengths + 1)
+    return [
+        copies[i, starts[i] : starts[i] + lengths[i]].tobytes() for i in range(n_genes)
+    ]
+
+
+def _fasta_entry(gene_id: str, species_id: str, sequence: bytes) -> str:
+    sequence = sequence.decode()
+    lines = [
+        sequence[i : i + FASTA_LINE_LENGTH]
+        for i in range(0, len(sequence), FASTA_LINE_LENGTH)
+    ]
+    return f">{gene_id}\t{species_id}\n" + "\n".join(lines) + "\n"
+
+
+def generate(
+    output_dir: str | Path,
+    n_species: int = 100,
+    n_levels: int = 5,
+    level_fraction: float = 0.5,
+    n_ogs: int = 1000,
+    og_size: float = 20,
+    og_size_distribution: str = "lognormal",
+    paralogs: float = 1.3,
+    seq_length: int = 400,
+    divergence: float = 0.4,
+    uniprot_fraction: float = 0.5,
+    seed: int = 0,
+) -> dict:
+    """write a synthetic set of orthoDB files to `output_dir`
+
+    Parameters
+    ----------
+    output_dir : str | Path
+        directory to write the `odb11v0_*.tab` files to
+    n_species : int, optional
+        number of species, by default 100
+    n_levels : int, optional
+        number of (nested) levels, by default 5
+    level_fraction : float, optional
+        fraction of the species of a level that are in the level below it, by
+        default 0.5
+    n_ogs : int, optional
+        number of gene families (OGs at the first level), by default 1000
+    og_size : float, optional
+        median number of species that a family is present in, by default 20
+    og_size_distribution : str, optional
+        distribution of the number of species in a family, one of
+        `OG_SIZE_DISTRIBUTIONS`, by default "lognormal"
+    paralogs : float, optional
+        mean number of genes of a family in each species it is present in, by
+        default 1.3
+    seq_length : int, optional
+        median length of the sequences, by default 400
+    divergence : float, optional
+        maximum fraction of the residues of a gene that differ from the
+        ancestral sequence of its family, by default 0.4
+    uniprot_fraction : float, optional
+        fraction of the genes with a UniProt id, by default 0.5
+    seed : int, optional
+        random seed, by default 0
+
+    Returns
+    -------
+    dict
+        the parameters and the number of species, levels, families, OGs (at
+        all levels), genes and residues written. Also saved to `synthetic_data.json` in `output_dir`
+    """
+    if n_species < MIN_SPECIES_PER_OG:
+        raise ValueError(f"n_species must be at least {MIN_SPECIES_PER_OG}")
+    if n_levels < 1:
+        raise ValueError("n_levels must be at least 1")
+    if paralogs < 1:
+        raise ValueError("paralogs must be at least 1")
+    parameters = {
+        "n_species": n_species,
+        "n_levels": n_levels,
+        "level_fraction": level_fraction,
+        "n_ogs": n_ogs,
+        "og_size": og_size,
+        "og_size_distribution": og_size_distribution,
+        "paralogs": paralogs,
+        "seq_length": seq_length,
+        "divergence": divergence,
+        "uniprot_fraction": uniprot_fraction,
+        "seed": seed,
+    }
+    start_time = time.perf_counter()
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    levels = _level_list(n_levels)
+    sizes = level_sizes(n_species, n_levels, level_fraction)
+    species = _species_list(n_species)
+    og_sizes = _draw_og_sizes(rng, n_ogs, n_species, og_size, og_size_distribution)
+
+    # counters for the species and levels tables
+    species_n_genes = np.zeros(n_species, dtype=np.int64)
+    species_n_ogs = np.zeros(n_species, dtype=np.int64)
+    level_n_genes = np.zeros(n_levels, dtype=np.int64)
+    level_n_ogs = np.zeros(n_levels, dtype=np.int64)
+    n_genes = 0
+    n_residues = 0
+    files = {
+        name: open(output_dir / f"odb11v0_{name}.tab", "w")
+        for name in ["genes", "gene_xrefs", "OGs", "OG2genes", "all_og_fasta"]
+    }
+    try:
+        for family in range(n_ogs):
+            family_species = np.sort(
+                rng.choice(n_species, og_sizes[family], replace=False)
+            )
+            copies = 1 + rng.poisson(paralogs - 1, len(family_species))
+            gene_species = np.repeat(family_species, copies)
+            family_length = int(
+                np.clip(
+                    rng.lognormal(math.log(seq_length), 0.5),
+                    MIN_SEQ_LENGTH,
+                    MAX_SEQ_LENGTH,
+                )
+            )
+            sequences = _family_sequences(
+                rng, len(gene_species), family_length, divergence
+            )
+            has_uniprot = rng.random(len(gene_species)) < uniprot_fraction
+            gene_ids = []
+            for i, species_index in enumerate(gene_species):
+                _, species_id, _ = species[species_index]
+                gene_number = species_n_genes[species_index]
+                species_n_genes[species_index] += 1
+                gene_id = f"{species_id}:{gene_number:06x}"
+                gene_ids.append(gene_id)
+                source_id = f"XP_{n_genes + i:09d}.1"
+                uniprot_id = f"SYN{n_genes + i:08d}" if has_uniprot[i] else ""
+                files["genes"].write(
+                    f"{gene_id}\t{species_id}\t{source_id}\tFAM{family}\t{uniprot_id}\t\t\tsynthetic protein family {family}\n"
+                )
+                files["gene_xrefs"].write(f"{gene_id}\t{source_id}\tNCBIproteinAcc\n")
+                if uniprot_id:
+                    files["gene_xrefs"].write(f"{gene_id}\t{uniprot_id}\tUniProt\n")
+                files["all_og_fasta"].write(
+                    _fasta_entry(gene_id, species_id, sequences[i])
+                )
+            species_n_ogs[family_species] += 1
+            n_genes += len(gene_species)
+            n_residues += sum(len(s) for s in sequences)
+            # an OG at each level where the family is in enough species. The
+            # species of a level are the first `sizes[level]` species
+            for level, (_, level_taxid) in enumerate(levels):
+                if (family_species < sizes[level]).sum() < MIN_SPECIES_PER_OG:
+                    # the levels below have fewer species
+                    break
+                ogid = f"{family}at{level_taxid}"
+                files["OGs"].write(
+                    f"{ogid}\t{level_taxid}\tsynthetic protein family {family}\n"
+                )
+                level_genes = [
+                    gene_id
+                    for gene_id, species_index in zip(gene_ids, gene_species)
+                    if species_index < sizes[level]
+                ]
+                files["OG2genes"].writelines(
+                    f"{ogid}\t{gene_id}\n" for gene_id in level_genes
+                )
+                level_n_ogs[level] += 1
+                level_n_genes[level] += len(level_genes)
+    finally:
+        for f in files.values():
+            f.close()
+
+    with open(output_dir / "odb11v0_species.tab", "w") as f:
+        for i, (taxid, species_id, name) in enumerate(species):
+            f.write(
+                f"{taxid}\t{species_id}\t{name}\tGCF_{i:09d}.1\t{species_n_genes[i]}\t{species_n_ogs[i]}\tC\n"
+            )
+    with open(output_dir / "odb11v0_levels.tab", "w") as f:
+        for level, (name, taxid) in enumerate(levels):
+            f.write(
+                f"{taxid}\t{name}\t{level_n_genes[level]}\t{level_n_ogs[level]}\t{sizes[level]}\n"
+            )
+    # the path from the first level to each species
+    root_taxid = levels[0][1]
+    with open(output_dir / "odb11v0_level2species.tab", "w") as f:
+        for i, (taxid, species_id, _) in enumerate(species):
+            path = [t for level, (_, t) in enumerate(levels) if i < sizes[level]]
+            path.append(taxid)
+            f.write(
+                f"{root_taxid}\t{species_id}\t{len(path) - 1}\t{{{','.join(map(str, path))}}}\n"
+            )
+
+    summary = {
+        "parameters": parameters,
+        "n_species": n_species,
+        "n_levels": n_levels,
+        "n_families": n_ogs,
+        "n_ogs": int(level_n_ogs.sum()),
+        "n_genes": n_genes,
+        "n_residues": n_residues,
+        "human_genes": int(species_n_genes[0]),
+        "time_s": round(time.perf_counter() - start_time, 2),
+    }
+    with open(output_dir / "synthetic_data.json", "w") as f:
+        json.dump(summary, f, indent=4)
+    return summary
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(
+        description="""generate a synthetic set of orthoDB files (odb11v0_*.tab) for scale testing.
+The files have the same columns and id formats as the orthoDB files. The first species is human (9606_0),
+and the first 5 levels are Eukaryota > Metazoa > Vertebrata > Tetrapoda > Mammalia (nested).
+Point ORTHODB_DATA_DIR (or the --data_dir option of the benchmark scripts) at the output directory""",
+        formatter_class=argparse.RawTextHelpFormatter,
+    )
+    parser.add_argument(
+        "-o",
+        "--output_dir",
+        type=str,
+        metavar="<dir>",
+        required=True,
+        help="""directory to write the files to""",
+    )
+    parser.add_argument(
+        "--n_species",
+        type=int,
+        metavar="<int>",
+        default=100,
+        help="""number of species. Default is 100""",
+    )
+    parser.add_argument(
+        "--n_levels",
+        type=int,
+        metavar="<int>",
+        default=5,
+        help="""number of nested levels. Default is 5""",
+    )
+    parser.add_argument(
+        "--level_fraction",
+        type=float,
+        metavar="<float>",
+        default=0.5,
+        help="""fraction of the species of a level that are in the next level. Default is 0.5""",
+    )
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument(
+        "--n_ogs",
+        type=int,
+        metavar="<int>",
+        default=None,
+        help="""number of gene families (OGs at the first level). Default is 1000""",
+    )
+    group.add_argument(
+        "--n_genes",
+        type=int,
+        metavar="<int>",
+        default=None,
+        help="""approximate number of genes. Sets the number of gene families from --og_size and --paralogs""",
+    )
+    parser.add_argument(
+        "--og_size",
+        type=float,
+        metavar="<float>",
+        default=20,
+        help="""median number of species that a gene family is present in. Default is 20""",
+    )
+    parser.add_argument(
+        "--og_size_distribution",
+        type=str,
+        default="lognormal",
+        choices=OG_SIZE_DISTRIBUTIONS,
+        help="""distribution of the number of species in a gene family. Default is lognormal""",
+    )
+    parser.add_argument(
+        "--paralogs",
+        type=float,
+        metavar="<float>",
+        default=1.3,
+        help="""mean number of genes of a family in each species that it is present in (at least 1). Default is 1.3""",
+    )
+    parser.add_argument(
+        "--seq_length",
+        type=int,
+        metavar="<int>",
+        default=400,
+        help="""median sequence length. Default is 400""",
+    )
+    parser.add_argument(
+        "--divergence",
+        type=float,
+        metavar="<float>",
+        default=0.4,
+        help="""maximum fraction of the residues of a gene that differ from the ancestral sequence of its family. Default is 0.4""",
+    )
+    parser.add_argument(
+        "--uniprot_fraction",
+        type=float,
+        metavar="<float>",
+        default=0.5,
+        help="""fraction of the genes that have a UniProt id. Default is 0.5""",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        metavar="<int>",
+        default=0,
+        help="""random seed. Default is 0""",
+    )
+    args = parser.parse_args()
+    n_ogs = args.n_ogs if args.n_ogs is not None else 1000
+    if args.n_genes is not None:
+        n_ogs = n_ogs_for_n_genes(
+            args.n_genes,
+            args.n_species,
+            args.og_size,
+            args.paralogs,
+            args.og_size_distribution,
+        )
+    summary = generate(
+        args.output_dir,
+        n_species=args.n_species,
+        n_levels=args.n_levels,
+        level_fraction=args.level_fraction,
+        n_ogs=n_ogs,
+        og_size=args.og_size,
+        og_size_distribution=args.og_size_distribution,
+        paralogs=args.paralogs,
+        seq_length=args.seq_length,
+        divergence=args.divergence,
+        uniprot_fraction=args.uniprot_fraction,
+        seed=args.seed,
+    )
+    print(
+        f"{summary['n_genes']:,} genes ({summary['human_genes']:,} human) in {summary['n_ogs']:,} OGs, {summary['n_species']} species, {summary['n_levels']} levels, written to {args.output_dir} in {summary['time_s']} s"
+    )
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,326 @@
+"""
+block-compressed sequence store with random access
+
+A compressed copy of `odb11v0_all_og_fasta.tab` that can be used instead of
+the fasta file + index (e.g. on compute nodes where copying the whole fasta
+file is too slow). The records are packed, in file order, into blocks of
+roughly `block_size` bytes which are compressed independently with zlib (or
+zstd if the optional `zstandard` package is installed). The store is a
+directory with:
+
+- `blocks.bin`: the compressed blocks, one after the other
+- `block_offsets.npy`: where each block starts/ends in `blocks.bin`
+- `ids.npy`: the sorted sequence ids
+- `record_blocks.npy`, `record_offsets.npy`, `record_lengths.npy`: the block of
+  each record and its position in the decompressed block
+
+Fetching a sequence decompresses only its block. Recently used decompressed
+blocks are kept in a small LRU cache, so fetching the members of an OG (which
+tend to be close together in the file) usually decompresses each block once.
+
+Build the store with `odb_groups-build_databases -t fasta_compressed` and
+select it with `SEQUENCE_STORE=compressed` in the `.env` file. The codec and
+block size are set with `COMPRESSED_STORE_CODEC` and `COMPRESSED_STORE_BLOCK_KB`.
+Use `odb_groups-sequence_store_report` to compare the size and fetch latency
+of the sequence stores.
+"""
+
+import mmap
+import multiprocessing
+import os
+import time
+import zlib
+from pathlib import Path
+
+import numpy as np
+
+from orthodb_tools.fasta_offset_index import (
+    SortedIdSequenceStore,
+    _parse_record,
+    _scan_chunk,
+    fasta_chunks,
+    read_build_info,
+    sort_by_id,
+)
+from orthodb_tools.query_cache import LRUCache
+
+FORMAT_VERSION = 1
+CODECS = ["zlib", "zstd"]
+
+
+def _get_compressor(codec: str):
+    if codec == "zlib":
+        return lambda data: zlib.compress(data, 6)
+    if codec == "zstd":
+        return _import_zstandard().ZstdCompressor(level=3).compress
+    raise ValueError(f"unknown codec `{codec}`. must be one of: {CODECS}")
+
+
+def _get_decompressor(codec: str):
+    if codec == "zlib":
+        return zlib.decompress
+    if codec == "zstd":
+        return _import_zstandard().ZstdDecompressor().decompress
+    raise ValueError(f"unknown codec `{codec}`. must be one of: {CODECS}")
+
+
+def _import_zstandard():
+    try:
+        import zstandard
+    except ImportError as e:
+        raise ImportError(
+            "the zstd codec requires the `zstandard` package. Install it with `pip install zstandard` or use the zlib codec"
+        ) from e
+    return zstandard
+
+
+def _compress_chunk(
+    fasta_file: str, chunk_start: int, chunk_end: int, codec: str, block_size: int
+) -> dict:
+    """pack the records that start in [chunk_start, chunk_end) into compressed blocks"""
+    ids, starts, ends = _scan_chunk(fasta_file, chunk_start, chunk_end)
+    compress = _get_compressor(codec)
+    blocks = []
+    record_blocks = np.zeros(len(ids), dtype=np.int64)
+    record_offsets = np.zeros(len(ids), dtype=np.int64)
+    record_lengths = np.zeros(len(ids), dtype=np.int64)
+    raw_size = 0
+    block = bytearray()
+    if len(ids) > 0:
+        with (
+            open(fasta_file, "rb") as f,
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm,
+        ):
+            for i, (start, end) in enumerate(zip(starts, ends)):
+                # store the parsed title and sequence, not the wrapped fasta lines
+                title, sequence = _parse_record(mm[start:end])
+                record = f"{title}\n{sequence}".encode()
+                if block and len(block) + len(record) > block_size:
+                    blocks.append(compress(bytes(block)))
+                    raw_size += len(block)
+                    block = bytearray()
+                record_blocks[i] = len(blocks)
+                record_offsets[i] = len(block)
+                record_lengths[i] = len(record)
+                block += record
+    if block:
+        blocks.append(compress(bytes(block)))
+        raw_size += len(block)
+    return {
+        "ids": ids,
+        "record_blocks": record_blocks,
+        "record_offsets": record_offsets,
+        "record_lengths": record_lengths,
+        "blocks": blocks,
+        "raw_size": raw_size,
+    }
+
+
+def _compress_chunk_star(args):
+    return _compress_chunk(*args)
+
+
+def build_compressed_store(
+    fasta_file: str | Path,
+    store_dir: str | Path,
+    codec: str = "zlib",
+    block_size: int = 64 * 1024,
+    n_processes: int | None = None,
+) -> dict:
+    """build a block-compressed store from a fasta file
+
+    Chunks of the fasta file are compressed in parallel (see
+    `fasta_offset_index.fasta_chunks`) and their blocks are written out in
+    file order.
+
+    Parameters
+    ----------
+    fasta_file : str | Path
+        fasta file to compress
+    store_dir : str | Path
+        directory to write the store to. Created if it doesn't exist
+    codec : str, optional
+        "zlib" or "zstd", by default "zlib"
+    block_size : int, optional
+        approximate size of the decompressed blocks in bytes, by default 64 KiB
+    n_processes : int | None, optional
+        number of processes used to compress the file, by default all of the cores
+
+    Returns
+    -------
+    dict
+        build statistics: number of sequences, number of blocks, decompressed
+        and compressed size (bytes) and the compression ratio
+    """
+    _get_compressor(codec)
+    fasta_file = str(fasta_file)
+    store_dir = Path(store_dir)
+    store_dir.mkdir(parents=True, exist_ok=True)
+    chunks, n_processes = fasta_chunks(fasta_file, n_processes)
+    chunks = [chunk + (codec, block_size) for chunk in chunks]
+    ids, record_blocks, record_offsets, record_lengths = [], [], [], []
+    block_offsets = [0]
+    raw_size = 0
+    pool = multiprocessing.Pool(n_processes) if n_processes > 1 else None
+    try:
+        # imap keeps the chunks in file order
+        if pool is not None:
+            results = pool.imap(_compress_chunk_star, chunks)
+        else:
+            results = map(_compress_chunk_star, chunks)
+        with open(store_dir / "blocks.bin", "wb") as blocks_file:
+            for result in results:
+                ids.append(result["ids"])
+                record_blocks.append(result["record_blocks"] + len(block_offsets) - 1)
+                record_offsets.append(result["record_offsets"])
+                record_lengths.append(result["record_lengths"])
+                for block in result["blocks"]:
+                    blocks_file.write(block)
+                    block_offsets.append(block_offsets[-1] + len(block))
+                raw_size += result["raw_size"]
+    finally:
+        if pool is not None:
+            pool.terminate()
+    ids, record_blocks, record_offsets, record_lengths = sort_by_id(
+        fasta_file,
+        np.concatenate(ids),
+        np.concatenate(record_blocks),
+        np.concatenate(record_offsets),
+        np.concatenate(record_lengths),
+    )
+    np.save(store_dir / "ids.npy", ids)
+    np.save(store_dir / "record_blocks.npy", record_blocks)
+    np.save(store_dir / "record_offsets.npy", record_offsets)
+    np.save(store_dir / "record_lengths.npy", record_lengths)
+    np.save(store_dir / "block_offsets.npy", np.array(block_offsets, dtype=np.int64))
+    compressed_size = block_offsets[-1]
+    return {
+        "n_rows": len(ids),
+        "n_blocks": len(block_offsets) - 1,
+        "codec": codec,
+        "block_size": block_size,
+        "raw_size": raw_size,
+        "compressed_size": compressed_size,
+        "compression_ratio": raw_size / compressed_size if compressed_size else 0.0,
+    }
+
+
+class CompressedSequenceStore(SortedIdSequenceStore):
+    """read-only mapping of sequence id -> SeqRecord backed by a block-compressed store
+
+    Parameters
+    ----------
+    store_dir : str | Path
+        directory with the store built by `build_compressed_store`
+    cache_mb : float, optional
+        maximum size of the decompressed block cache in MB, by default 64
+    """
+
+    def __init__(self, store_dir: str | Path, cache_mb: float = 64):
+        self.store_dir = Path(store_dir)
+        if not (self.store_dir / "ids.npy").exists():
+            raise FileNotFoundError(
+                f"compressed sequence store not found: {self.store_dir}. Build it with `odb_groups-build_databases -t fasta_compressed`"
+            )
+        self.build_info = read_build_info(self.store_dir)
+        self.codec = self.build_info.get("codec", "zlib")
+        self._decompress = _get_decompressor(self.codec)
+        self.ids = np.load(self.store_dir / "ids.npy", mmap_mode="r")
+        self.record_blocks = np.load(
+            self.store_dir / "record_blocks.npy", mmap_mode="r"
+        )
+        self.record_offsets = np.load(
+            self.store_dir / "record_offsets.npy", mmap_mode="r"
+        )
+        self.record_lengths = np.load(
+            self.store_dir / "record_lengths.npy", mmap_mode="r"
+        )
+        self.block_offsets = np.load(self.store_dir / "block_offsets.npy")
+        self._file = open(self.store_dir / "blocks.bin", "rb")
+        if self.block_offsets[-1] > 0:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._mm = b""
+        # approximate: each cached block is ~block_size bytes
+        self.block_cache = LRUCache(
+            max_entries=1_000_000, max_bytes=int(cache_mb * 1024 * 1024)
+        )
+        self._pid = os.getpid()
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.n_fetches = 0
+        self.n_records = 0
+        self.n_blocks_decompressed = 0
+        self.fetch_time = 0.0
+        self.block_cache.reset_stats()
+
+    def _block(self, block: int) -> bytes:
+        if self._pid != os.getpid():
+            # forked: keep the cached blocks but not the parent's lock and counters
+            self.block_cache._after_fork()
+            self._pid = os.getpid()
+        data = self.block_cache.get(block, None)
+        if data is None:
+            data = self._decompress(
+                self._mm[self.block_offsets[block] : self.block_offsets[block + 1]]
+            )
+            self.n_blocks_decompressed += 1
+            self.block_cache.put(block, data)
+        return data
+
+    def get_many_raw(self, sequence_ids: list[str]) -> dict[str, tuple[str, str]]:
+        """return {sequence id: (description, sequence)} for a batch of ids
+
+        The records are read block by block, so each block is decompressed at
+        most once per batch.
+
+        Raises
+        ------
+        KeyError
+            if any of the ids is not in the store
+        """
+        start_time = time.perf_counter()
+        sequence_ids, positions = self._lookup(sequence_ids)
+        blocks = self.record_blocks[positions]
+        offsets = self.record_offsets[positions]
+        lengths = self.record_lengths[positions]
+        records = [None] * len(sequence_ids)
+        current_block, data = -1, b""
+        for i in np.lexsort((offsets, blocks)):
+            if blocks[i] != current_block:
+                current_block = blocks[i]
+                data = self._block(current_block)
+            title, _, sequence = (
+                data[offsets[i] : offsets[i] + lengths[i]].decode().partition("\n")
+            )
+            records[i] = (title, sequence)
+        self.n_fetches += 1
+        self.n_records += len(sequence_ids)
+        self.fetch_time += time.perf_counter() - start_time
+        return dict(zip(sequence_ids, records))
+
+    def stats(self) -> dict:
+        """compression ratio of the store and fetch latency/block cache counters
+        since the store was opened (or `reset_stats` was called)"""
+        raw_size = int(self.build_info.get("raw_size", 0))
+        compressed_size = int(self.block_offsets[-1])
+        return {
+            "codec": self.codec,
+            "n_blocks": len(self.block_offsets) - 1,
+            "raw_size": raw_size,
+            "compressed_size": compressed_size,
+            "compression_ratio": raw_size / compressed_size if compressed_size else 0.0,
+            "n_fetches": self.n_fetches,
+            "n_records": self.n_records,
+            "mean_fetch_ms": (
+                1000 * self.fetch_time / self.n_fetches if self.n_fetches else 0.0
+            ),
+            "n_blocks_decompressed": self.n_blocks_decompressed,
+            "block_cache": self.block_cache.stats(),
+        }
+
+    def close(self):
+        if isinstance(self._mm, mmap.mmap):
+            self._mm.close()
+        self._file.close()
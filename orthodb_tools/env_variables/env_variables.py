@@ -1,5 +1,6 @@
-import copy
+import functools
 import os
+import threading
 from pathlib import Path
 
 import dotenv
@@ -9,6 +10,9 @@ import pandas as pd
 from attrs import frozen
 from Bio import SeqIO
 
+from orthodb_tools import metadata_snapshot
+from orthodb_tools.sequence_record import SequenceRecord
+
 dotenv_path = os.path.join(os.path.dirname(__file__), ".env")
 dotenv.load_dotenv(dotenv_path)
 orthodb_dir = Path(os.environ["ORTHODB_DATA_DIR"])
@@ -16,6 +20,25 @@ MAFFT_EXECUTABLE = os.environ["MAFFT_EXECUTABLE"]
 MAFFT_ADDITIONAL_ARGUMENTS = os.environ["MAFFT_ADDITIONAL_ARGUMENTS"]
 CD_HIT_EXECUTABLE = os.environ["CD_HIT_EXECUTABLE"]
 CD_HIT_ADDITIONAL_ARGUMENTS = os.environ["CD_HIT_ADDITIONAL_ARGUMENTS"]
+# optional sqlite tuning. defaults are used if they are missing from the .env file
+SQLITE_MMAP_SIZE = int(os.environ.get("SQLITE_MMAP_SIZE", 268435456))
+SQLITE_CACHE_SIZE = int(os.environ.get("SQLITE_CACHE_SIZE", -65536))
+METADATA_CACHE_MAX_ENTRIES = int(os.environ.get("METADATA_CACHE_MAX_ENTRIES", 200000))
+METADATA_CACHE_MAX_MB = float(os.environ.get("METADATA_CACHE_MAX_MB", 256))
+# where the sequences are read from: "sqlite" (`SeqIO.index_db`), "offset_index" or "compressed"
+SEQUENCE_STORE = os.environ.get("SEQUENCE_STORE", "sqlite")
+SEQUENCE_STORES = ["sqlite", "offset_index", "compressed"]
+COMPRESSED_STORE_CODEC = os.environ.get("COMPRESSED_STORE_CODEC", "zlib")
+COMPRESSED_STORE_BLOCK_KB = int(os.environ.get("COMPRESSED_STORE_BLOCK_KB", 64))
+COMPRESSED_STORE_CACHE_MB = float(os.environ.get("COMPRESSED_STORE_CACHE_MB", 64))
+# where the snapshots of the species and levels tables are saved (see
+# `metadata_snapshot.py`). Defaults to the orthoDB data directory. An empty
+# string turns the snapshots off
+METADATA_SNAPSHOT_DIR = os.environ.get("METADATA_SNAPSHOT_DIR", str(orthodb_dir))
+# on-disk cache of the LDO selection, CD-HIT and MAFFT results (see
+# `stage_cache.py`). Off unless STAGE_CACHE_DIR is set
+STAGE_CACHE_DIR = os.environ.get("STAGE_CACHE_DIR", "")
+STAGE_CACHE_MAX_MB = float(os.environ.get("STAGE_CACHE_MAX_MB", 4096))
 
 # ==============================================================================
 # // getting odb filepaths
@@ -26,6 +49,8 @@ CD_HIT_ADDITIONAL_ARGUMENTS = os.environ["CD_HIT_ADDITIONAL_ARGUMENTS"]
 class OrthoDBFiles:
     all_seqs_fasta: str = str(orthodb_dir / "odb11v0_all_og_fasta.tab")
     all_seqs_sqlite: str = str(orthodb_dir / "odb11v0_all_og.sqlite")
+    all_seqs_offset_index: str = str(orthodb_dir / "odb11v0_all_og.offset_index")
+    all_seqs_compressed: str = str(orthodb_dir / "odb11v0_all_og.compressed")
     gene_refs_tsv: str = str(orthodb_dir / "odb11v0_genes.tab")
     gene_refs_sqlite: str = str(orthodb_dir / "odb11v0_genes.sqlite")
     gene_xrefs_tsv = str(orthodb_dir / "odb11v0_gene_xrefs.tab")
@@ -34,9 +59,20 @@ class OrthoDBFiles:
     ogs_sqlite: str = str(orthodb_dir / "odb11v0_OGs.sqlite")
     OG2genes_tsv: str = str(orthodb_dir / "odb11v0_OG2genes.tab")
     OG2genes_sqlite: str = str(orthodb_dir / "odb11v0_OG2genes.sqlite")
+    # CSR membership arrays (a directory, see `og_membership_index.py`). Has to
+    # be next to the OG2genes database, with the same name and a .csr suffix
+    OG2genes_csr: str = str(orthodb_dir / "odb11v0_OG2genes.csr")
     levels_tsv: str = str(orthodb_dir / "odb11v0_levels.tab")
     levels2species_tsv: str = str(orthodb_dir / "odb11v0_level2species.tab")
     species_tsv: str = str(orthodb_dir / "odb11v0_species.tab")
+    # Parquet datasets (directories, see `tools/parquet_tools.py`)
+    gene_refs_parquet: str = str(orthodb_dir / "odb11v0_genes.parquet")
+    gene_xrefs_parquet: str = str(orthodb_dir / "odb11v0_gene_xrefs.parquet")
+    ogs_parquet: str = str(orthodb_dir / "odb11v0_OGs.parquet")
+    OG2genes_parquet: str = str(orthodb_dir / "odb11v0_OG2genes.parquet")
+    levels_parquet: str = str(orthodb_dir / "odb11v0_levels.parquet")
+    levels2species_parquet: str = str(orthodb_dir / "odb11v0_level2species.parquet")
+    species_parquet: str = str(orthodb_dir / "odb11v0_species.parquet")
 
 
 orthoDB_files = OrthoDBFiles()
@@ -45,7 +81,25 @@ orthoDB_files = OrthoDBFiles()
 # ==============================================================================
 # // data loading functions
 # ==============================================================================
-def load_data_all_odb_seqs(database_files: OrthoDBFiles = orthoDB_files):
+def load_data_all_odb_seqs(
+    database_files: OrthoDBFiles = orthoDB_files, sequence_store: str = SEQUENCE_STORE
+):
+    if sequence_store not in SEQUENCE_STORES:
+        raise ValueError(
+            f"unknown SEQUENCE_STORE `{sequence_store}`. must be one of: {SEQUENCE_STORES}"
+        )
+    if sequence_store == "offset_index":
+        from orthodb_tools.fasta_offset_index import FastaOffsetIndex
+
+        return FastaOffsetIndex(
+            database_files.all_seqs_offset_index, database_files.all_seqs_fasta
+        )
+    if sequence_store == "compressed":
+        from orthodb_tools.compressed_sequence_store import CompressedSequenceStore
+
+        return CompressedSequenceStore(
+            database_files.all_seqs_compressed, cache_mb=COMPRESSED_STORE_CACHE_MB
+        )
     data_all_seqrecords_dict = SeqIO.index_db(
         str(database_files.all_seqs_sqlite),
         str(database_files.all_seqs_fasta),
@@ -91,40 +145,178 @@ def load_data_levels_df(database_files: OrthoDBFiles = orthoDB_files):
 class orthoDBDatabase:
     """
     main class that holds the orthoDB data
+
+    Nothing is loaded when the object is created. Each table is loaded the
+    first time it is used, so e.g. the sequence store isn't opened by code that
+    only needs the levels table.
+
+    The species and levels tables (and the dicts made from them) are loaded
+    from binary snapshots when they are up to date (see `metadata_snapshot.py`).
+    Pass `snapshot_dir=None` to always parse the tables.
+
+    The sequence store is reopened in a forked process (e.g. a
+    `multiprocessing.Pool` worker), since the sqlite index can't be shared
+    across a fork. The tables are plain in-memory objects, so the forked
+    process keeps the ones that the parent had already loaded.
     """
 
-    def __init__(self, database_files: OrthoDBFiles = orthoDB_files):
+    def __init__(
+        self,
+        database_files: OrthoDBFiles = orthoDB_files,
+        snapshot_dir: str | None = METADATA_SNAPSHOT_DIR or None,
+    ):
         self.datafiles = database_files
-        self.data_all_seqrecords_dict = load_data_all_odb_seqs(self.datafiles)
-        self.data_levels_df = load_data_levels_df(self.datafiles)
-        self.data_species_df = load_data_species_df(self.datafiles)
-        # special dictionaries that I want to have available for quick lookup
-        self.data_species_dict = self._load_data_species_dict()
-        self.data_levels_taxid_name_dict = self._load_data_levels_taxid_name_dict()
-
-    def _load_data_species_dict(self):
+        self.snapshot_dir = snapshot_dir
+        self._data_all_seqrecords_dict = None
+        self._pid = os.getpid()
+        # sequences in shared memory, read before the sequence store (set by
+        # `shared_database.worker_init`)
+        self.shared_sequences = None
+
+    @property
+    def data_all_seqrecords_dict(self):
+        if self._pid != os.getpid():
+            # inherited from the parent process
+            self._data_all_seqrecords_dict = None
+            self._pid = os.getpid()
+        if self._data_all_seqrecords_dict is None:
+            self._data_all_seqrecords_dict = load_data_all_odb_seqs(self.datafiles)
+        return self._data_all_seqrecords_dict
+
+    @functools.cached_property
+    def _levels(self) -> tuple[pd.DataFrame, dict]:
+        return metadata_snapshot.load_with_snapshot(
+            self.datafiles.levels_tsv, self._load_levels, self.snapshot_dir
+        )
+
+    @functools.cached_property
+    def _species(self) -> tuple[pd.DataFrame, dict]:
+        return metadata_snapshot.load_with_snapshot(
+            self.datafiles.species_tsv, self._load_species, self.snapshot_dir
+        )
+
+    @property
+    def data_levels_df(self) -> pd.DataFrame:
+        return self._levels[0]
+
+    @property
+    def data_species_df(self) -> pd.DataFrame:
+        return self._species[0]
+
+    # special dictionaries that I want to have available for quick lookup
+    @property
+    def data_species_dict(self) -> dict:
+        return self._species[1]
+
+    @property
+    def data_levels_taxid_name_dict(self) -> dict:
+        return self._levels[1]
+
+    def _load_species(self) -> tuple[pd.DataFrame, dict]:
+        species_df = load_data_species_df(self.datafiles)
+        return species_df, self._load_data_species_dict(species_df)
+
+    def _load_levels(self) -> tuple[pd.DataFrame, dict]:
+        levels_df = load_data_levels_df(self.datafiles)
+        return levels_df, self._load_data_levels_taxid_name_dict(levels_df)
+
+    @staticmethod
+    def _load_data_species_dict(species_df: pd.DataFrame) -> dict:
         return (
-            self.data_species_df[["species ID", "species name"]]
+            species_df[["species ID", "species name"]]
             .set_index("species ID")
             .to_dict()["species name"]
         )
 
-    def _load_data_levels_taxid_name_dict(self):
+    @staticmethod
+    def _load_data_levels_taxid_name_dict(levels_df: pd.DataFrame) -> dict:
         return (
-            self.data_levels_df[["level NCBI tax id", "level name"]]
+            levels_df[["level NCBI tax id", "level name"]]
             .set_index("level NCBI tax id")
             .to_dict()["level name"]
         )
 
     def get_sequences_from_list_of_seq_ids(self, sequence_ids: list[str]) -> dict:
+        if hasattr(self.data_all_seqrecords_dict, "get_many"):
+            # batch lookup (the offset index)
+            return self.data_all_seqrecords_dict.get_many(sequence_ids)
+        # the sqlite index parses a new SeqRecord for each lookup, so they
+        # don't need to be copied
         og_seq_dict = {}
         for odb_gene_id in sequence_ids:
             og_seq_dict[odb_gene_id] = self.data_all_seqrecords_dict[odb_gene_id]
-        return copy.deepcopy(og_seq_dict)
+        return og_seq_dict
+
+    def get_raw_sequences(self, sequence_ids: list[str]) -> dict[str, tuple[str, str]]:
+        """return {sequence id: (description, sequence)} for a list of sequence
+        ids, without creating `SeqRecord` objects if the store has a batch
+        lookup (the offset index and the compressed store)
+
+        Sequences in `shared_sequences` (see `shared_database.py`) are read
+        from there instead of the store.
+        """
+        sequence_ids = list(dict.fromkeys(sequence_ids))
+        shared = {}
+        if self.shared_sequences is not None:
+            shared = self.shared_sequences.get_many_raw(sequence_ids)
+            if len(shared) == len(sequence_ids):
+                return shared
+        missing = [i for i in sequence_ids if i not in shared]
+        store = self.data_all_seqrecords_dict
+        if hasattr(store, "get_many_raw"):
+            fetched = store.get_many_raw(missing)
+        else:
+            fetched = {}
+            for sequence_id in missing:
+                record = store[sequence_id]
+                fetched[sequence_id] = (record.description, str(record.seq))
+        if not shared:
+            return fetched
+        # in the same order as the input
+        return {i: shared[i] if i in shared else fetched[i] for i in sequence_ids}
+
+    def get_sequence_records(
+        self, sequence_ids: list[str]
+    ) -> dict[str, SequenceRecord]:
+        """return {sequence id: `SequenceRecord`} for a list of sequence ids
+        (see `get_raw_sequences`)"""
+        return {
+            sequence_id: SequenceRecord(sequence_id, sequence, description)
+            for sequence_id, (description, sequence) in self.get_raw_sequences(
+                sequence_ids
+            ).items()
+        }
+
 
+# the orthoDB_database object shared by everything in the process (see
+# `get_orthoDB_database`)
+_ODB_DATABASE = None
+_ODB_DATABASE_LOCK = threading.Lock()
+
+
+def _reset_lock_after_fork():
+    global _ODB_DATABASE_LOCK
+    # the lock could have been held by another thread of the parent process
+    _ODB_DATABASE_LOCK = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_lock_after_fork)
+
+
+def get_orthoDB_database() -> orthoDBDatabase:
+    """return the process-wide `orthoDBDatabase`, creating it on the first call
+
+    Importing orthodb_tools doesn't load any of the orthoDB data. The tables
+    and the sequence store are loaded when they are first used, once per
+    process (see `orthoDBDatabase`).
+    """
+    global _ODB_DATABASE
+    if _ODB_DATABASE is None:
+        with _ODB_DATABASE_LOCK:
+            if _ODB_DATABASE is None:
+                _ODB_DATABASE = orthoDBDatabase()
+    return _ODB_DATABASE
 
-# make the orthoDB_database object available as a global environment variable
-# ODB_DATABASE = orthoDB_database()
 
 # Below is an attempt to deal with the fact that the orthoDB file names might change with different versions
 # file_wildcards = {
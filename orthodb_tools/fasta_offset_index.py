@@ -0,0 +1,317 @@
+"""
+memory-mapped offset index for the orthoDB fasta file
+
+An alternative to the `SeqIO.index_db` sqlite index for fetching sequences
+from `odb11v0_all_og_fasta.tab`. The index is 3 numpy arrays saved in a
+directory: the sequence ids (sorted) and the start/end byte offsets of each
+record in the fasta file. The arrays are loaded with `mmap_mode="r"` and the
+fasta file itself is memory-mapped, so looking up a batch of ids is a
+vectorized binary search (`np.searchsorted`) followed by slicing the records
+out of the mapped file. Batches are read in file offset order so that the
+reads are sequential.
+
+Build the index with `odb_groups-build_databases -t fasta_offset_index` and
+select it with `SEQUENCE_STORE=offset_index` in the `.env` file.
+"""
+
+import json
+import mmap
+import multiprocessing
+import os
+from pathlib import Path
+
+import numpy as np
+from Bio.Seq import Seq
+from Bio.SeqRecord import SeqRecord
+
+FORMAT_VERSION = 1
+BUILD_INFO_FILE = "build_info.json"
+# don't split the fasta file into chunks smaller than this when building the index
+MIN_CHUNK_SIZE = 64 * 1024 * 1024
+
+
+def _scan_chunk(
+    fasta_file: str, chunk_start: int, chunk_end: int
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """find the records that start in the byte range [chunk_start, chunk_end)
+    of the fasta file. Returns their ids and start/end offsets"""
+    ids, starts, ends = [], [], []
+    with open(fasta_file, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return (
+                np.array([], dtype="S1"),
+                np.array([], np.int64),
+                np.array([], np.int64),
+            )
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if chunk_start == 0 and mm[:1] == b">":
+                pos = 0
+            else:
+                pos = mm.find(b"\n>", max(chunk_start - 1, 0))
+                pos = -1 if pos == -1 else pos + 1
+            while pos != -1 and pos < chunk_end:
+                header_end = mm.find(b"\n", pos)
+                if header_end == -1:
+                    header_end = size
+                next_pos = mm.find(b"\n>", header_end)
+                title = mm[pos + 1 : header_end].split(None, 1)
+                ids.append(title[0] if title else b"")
+                starts.append(pos)
+                ends.append(size if next_pos == -1 else next_pos + 1)
+                pos = -1 if next_pos == -1 else next_pos + 1
+    return (
+        np.array(ids, dtype=bytes) if ids else np.array([], dtype="S1"),
+        np.array(starts, dtype=np.int64),
+        np.array(ends, dtype=np.int64),
+    )
+
+
+def _scan_chunk_star(args):
+    return _scan_chunk(*args)
+
+
+def fasta_chunks(
+    fasta_file: str, n_processes: int | None = None
+) -> tuple[list[tuple[str, int, int]], int]:
+    """split a fasta file into byte ranges that can be scanned in parallel
+
+    Returns the list of (fasta file, chunk start, chunk end) and the number of
+    processes to use, which is 1 when called from a daemonic process (e.g. a
+    `multiprocessing.Pool` worker), since those can't start a pool of their own
+    """
+    size = Path(fasta_file).stat().st_size
+    if n_processes is None:
+        n_processes = os.cpu_count() or 1
+    if multiprocessing.current_process().daemon:
+        n_processes = 1
+    n_chunks = max(1, min(n_processes * 4, size // MIN_CHUNK_SIZE + 1))
+    bounds = np.linspace(0, size, n_chunks + 1).astype(np.int64)
+    chunks = [(fasta_file, int(bounds[i]), int(bounds[i + 1])) for i in range(n_chunks)]
+    return chunks, max(1, min(n_processes, n_chunks))
+
+
+def sort_by_id(fasta_file: str, ids: np.ndarray, *arrays: np.ndarray) -> list:
+    """sort `ids` and the per-record `arrays` by id
+
+    Raises
+    ------
+    ValueError
+        if an id is found more than once
+    """
+    order = np.argsort(ids, kind="stable")
+    ids = ids[order]
+    duplicates = np.flatnonzero(ids[1:] == ids[:-1])
+    if len(duplicates) > 0:
+        raise ValueError(
+            f"duplicate sequence id in {fasta_file}: {ids[duplicates[0]].decode()}"
+        )
+    return [ids] + [array[order] for array in arrays]
+
+
+def build_offset_index(
+    fasta_file: str | Path, index_dir: str | Path, n_processes: int | None = None
+) -> dict:
+    """build the offset index of a fasta file
+
+    The file is split into chunks which are scanned in parallel. The index
+    can't be built in parallel from a daemonic process (e.g. a
+    `multiprocessing.Pool` worker), so it is built in a single process in
+    that case.
+
+    Parameters
+    ----------
+    fasta_file : str | Path
+        fasta file to index
+    index_dir : str | Path
+        directory to write the index to. Created if it doesn't exist
+    n_processes : int | None, optional
+        number of processes used to scan the file, by default all of the cores
+
+    Returns
+    -------
+    dict
+        {"n_rows": number of sequences indexed}
+
+    Raises
+    ------
+    ValueError
+        if a sequence id is found more than once
+    """
+    fasta_file = str(fasta_file)
+    chunks, n_processes = fasta_chunks(fasta_file, n_processes)
+    if n_processes > 1:
+        with multiprocessing.Pool(n_processes) as p:
+            results = p.map(_scan_chunk_star, chunks)
+    else:
+        results = [_scan_chunk(*chunk) for chunk in chunks]
+    ids, starts, ends = sort_by_id(
+        fasta_file,
+        np.concatenate([r[0] for r in results]),
+        np.concatenate([r[1] for r in results]),
+        np.concatenate([r[2] for r in results]),
+    )
+    index_dir = Path(index_dir)
+    index_dir.mkdir(parents=True, exist_ok=True)
+    np.save(index_dir / "ids.npy", ids)
+    np.save(index_dir / "starts.npy", starts)
+    np.save(index_dir / "ends.npy", ends)
+    return {"n_rows": len(ids)}
+
+
+def read_build_info(index_dir: str | Path) -> dict[str, str]:
+    """return the build info stored with an index ({} if there is none)"""
+    build_info_file = Path(index_dir) / BUILD_INFO_FILE
+    if not build_info_file.exists():
+        return {}
+    with open(build_info_file) as f:
+        return json.load(f)
+
+
+def write_build_info(index_dir: str | Path, info: dict):
+    """store `info` with an index. Values are stored as text"""
+    with open(Path(index_dir) / BUILD_INFO_FILE, "w") as f:
+        json.dump({key: str(value) for key, value in info.items()}, f, indent=4)
+
+
+def _parse_record(record: bytes) -> tuple[str, str]:
+    """return the (title, sequence) of a raw fasta record, parsed the same
+    way as `Bio.SeqIO.FastaIO.FastaIterator`"""
+    header, _, body = record.partition(b"\n")
+    title = header[1:].rstrip().decode()
+    sequence = body.translate(None, b" \t\r\n").decode()
+    return title, sequence
+
+
+def _first_word(title: str) -> str:
+    words = title.split(None, 1)
+    return words[0] if words else ""
+
+
+class SortedIdSequenceStore:
+    """base class for the read-only sequence id -> SeqRecord mappings that
+    look sequences up in a sorted array of ids (`self.ids`)
+
+    They can be used in place of the `SeqIO.index_db` dictionary. Use `get_raw`
+    and `get_many_raw` to get (description, sequence) strings without creating
+    SeqRecord objects. Subclasses implement `get_many_raw`.
+    """
+
+    ids: np.ndarray
+
+    def _positions(self, sequence_ids: list[str]) -> np.ndarray:
+        """position of each id in `self.ids`, -1 if it isn't there"""
+        if len(sequence_ids) == 0 or len(self.ids) == 0:
+            return np.full(len(sequence_ids), -1, dtype=np.int64)
+        keys = [i.encode() for i in sequence_ids]
+        # numpy silently truncates strings that are longer than the dtype
+        fits = np.array([len(k) <= self.ids.dtype.itemsize for k in keys])
+        query = np.array(keys, dtype=self.ids.dtype)
+        positions = np.searchsorted(self.ids, query)
+        clipped = np.minimum(positions, len(self.ids) - 1)
+        found = fits & (positions < len(self.ids)) & (self.ids[clipped] == query)
+        return np.where(found, positions, -1)
+
+    def _lookup(self, sequence_ids: list[str]) -> tuple[list[str], np.ndarray]:
+        """return the unique ids and their positions
+
+        Raises
+        ------
+        KeyError
+            if any of the ids is not in the store
+        """
+        sequence_ids = list(dict.fromkeys(sequence_ids))
+        positions = self._positions(sequence_ids)
+        missing = np.flatnonzero(positions < 0)
+        if len(missing) > 0:
+            raise KeyError(sequence_ids[missing[0]])
+        return sequence_ids, positions
+
+    def get_many_raw(self, sequence_ids: list[str]) -> dict[str, tuple[str, str]]:
+        raise NotImplementedError
+
+    def get_raw(self, sequence_id: str) -> tuple[str, str]:
+        """return the (description, sequence) of one sequence"""
+        return self.get_many_raw([sequence_id])[sequence_id]
+
+    def get_many(self, sequence_ids: list[str]) -> dict[str, SeqRecord]:
+        """return {sequence id: SeqRecord} for a batch of ids"""
+        return {
+            sequence_id: _to_seqrecord(description, sequence)
+            for sequence_id, (description, sequence) in self.get_many_raw(
+                sequence_ids
+            ).items()
+        }
+
+    def __getitem__(self, sequence_id: str) -> SeqRecord:
+        return _to_seqrecord(*self.get_raw(sequence_id))
+
+    def __contains__(self, sequence_id) -> bool:
+        return isinstance(sequence_id, str) and self._positions([sequence_id])[0] >= 0
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __iter__(self):
+        return (i.decode() for i in self.ids)
+
+    def keys(self):
+        return iter(self)
+
+
+class FastaOffsetIndex(SortedIdSequenceStore):
+    """read-only mapping of sequence id -> SeqRecord backed by the offset index
+
+    Parameters
+    ----------
+    index_dir : str | Path
+        directory with the index built by `build_offset_index`
+    fasta_file : str | Path
+        the fasta file that was indexed
+    """
+
+    def __init__(self, index_dir: str | Path, fasta_file: str | Path):
+        self.index_dir = Path(index_dir)
+        self.fasta_file = Path(fasta_file)
+        if not (self.index_dir / "ids.npy").exists():
+            raise FileNotFoundError(
+                f"fasta offset index not found: {self.index_dir}. Build it with `odb_groups-build_databases -t fasta_offset_index`"
+            )
+        self.ids = np.load(self.index_dir / "ids.npy", mmap_mode="r")
+        self.starts = np.load(self.index_dir / "starts.npy", mmap_mode="r")
+        self.ends = np.load(self.index_dir / "ends.npy", mmap_mode="r")
+        self._file = open(self.fasta_file, "rb")
+        if os.fstat(self._file.fileno()).st_size > 0:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._mm = b""
+
+    def get_many_raw(self, sequence_ids: list[str]) -> dict[str, tuple[str, str]]:
+        """return {sequence id: (description, sequence)} for a batch of ids
+
+        The records are read in the order they are in the file.
+
+        Raises
+        ------
+        KeyError
+            if any of the ids is not in the index
+        """
+        sequence_ids, positions = self._lookup(sequence_ids)
+        starts = self.starts[positions]
+        ends = self.ends[positions]
+        records = [None] * len(sequence_ids)
+        for i in np.argsort(starts, kind="stable"):
+            records[i] = _parse_record(self._mm[starts[i] : ends[i]])
+        return dict(zip(sequence_ids, records))
+
+    def close(self):
+        if isinstance(self._mm, mmap.mmap):
+            self._mm.close()
+        self._file.close()
+
+
+def _to_seqrecord(description: str, sequence: str) -> SeqRecord:
+    first_word = _first_word(description)
+    return SeqRecord(
+        Seq(sequence), id=first_word, name=first_word, description=description
+    )
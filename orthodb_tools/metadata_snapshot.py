@@ -0,0 +1,112 @@
+"""
+binary snapshots of the small orthoDB tables that every process loads
+
+`orthoDBDatabase` parses the species and levels tables with pandas and then
+builds lookup dicts from them. The parsed table and the dict are saved
+together in a pickle file (`<table file name>.snapshot.pkl`, in
+`METADATA_SNAPSHOT_DIR`) the first time they are loaded, and later processes
+load the snapshot instead of parsing the table again.
+
+A snapshot is keyed by the size and modification time of the table it was
+made from, along with the snapshot format and pandas versions. If any of them
+don't match, the table is parsed again and the snapshot is replaced.
+"""
+
+import os
+import pickle
+from pathlib import Path
+from typing import Any, Callable
+
+import pandas as pd
+
+from orthodb_tools.tools.general_utils import file_fingerprint
+
+FORMAT_VERSION = 1
+SNAPSHOT_SUFFIX = ".snapshot.pkl"
+
+
+def snapshot_path(source_file: str | Path, snapshot_dir: str | Path) -> Path:
+    """the snapshot file for a table file"""
+    return Path(snapshot_dir) / f"{Path(source_file).name}{SNAPSHOT_SUFFIX}"
+
+
+def _snapshot_key(source_file: str | Path) -> dict:
+    fingerprint = file_fingerprint(source_file, checksum=False)
+    return {
+        "format_version": FORMAT_VERSION,
+        "pandas_version": pd.__version__,
+        "source_file": Path(source_file).name,
+        "source_size": fingerprint["size"],
+        "source_mtime_ns": fingerprint["mtime_ns"],
+    }
+
+
+def _read_snapshot(snapshot_file: Path, key: dict) -> Any | None:
+    """the data in a snapshot, or None if it is missing or out of date"""
+    if not snapshot_file.exists():
+        return None
+    try:
+        with open(snapshot_file, "rb") as f:
+            # the key is pickled separately so that an out of date snapshot
+            # isn't unpickled
+            if pickle.load(f) != key:
+                return None
+            return pickle.load(f)
+    except Exception:
+        # e.g. a truncated file. It is just regenerated
+        return None
+
+
+def _write_snapshot(snapshot_file: Path, key: dict, data: Any):
+    snapshot_file.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = snapshot_file.with_name(f"{snapshot_file.name}.{os.getpid()}.tmp")
+    try:
+        with open(tmp_file, "wb") as f:
+            pickle.dump(key, f, protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+    except BaseException:
+        tmp_file.unlink(missing_ok=True)
+        raise
+    # processes that are loading the snapshot at the same time see either the
+    # old file or the new one
+    os.replace(tmp_file, snapshot_file)
+
+
+def load_with_snapshot(
+    source_file: str | Path,
+    loader: Callable[[], Any],
+    snapshot_dir: str | Path | None,
+) -> Any:
+    """return the data made from `source_file` by `loader`, from its snapshot
+    if it is up to date
+
+    Parameters
+    ----------
+    source_file : str | Path
+        the file that `loader` reads
+    loader : Callable[[], Any]
+        function that reads `source_file` and returns the data to snapshot
+        (anything that can be pickled)
+    snapshot_dir : str | Path | None
+        directory for the snapshot file. If None, no snapshot is used and
+        `loader` is always called
+
+    Returns
+    -------
+    Any
+        the output of `loader`
+    """
+    if snapshot_dir is None:
+        return loader()
+    snapshot_file = snapshot_path(source_file, snapshot_dir)
+    key = _snapshot_key(source_file)
+    data = _read_snapshot(snapshot_file, key)
+    if data is not None:
+        return data
+    data = loader()
+    try:
+        _write_snapshot(snapshot_file, key, data)
+    except OSError as e:
+        # e.g. a read-only data directory. The data is still returned
+        print(f"WARNING: could not write the snapshot {snapshot_file}: {e}")
+    return data
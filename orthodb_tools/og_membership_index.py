@@ -0,0 +1,191 @@
+"""
+memory-mapped CSR arrays of the OG <-> gene membership in `odb11v0_OG2genes.tab`
+
+The OG ids and gene ids are replaced by their position in sorted arrays of the
+unique ids, and the membership is stored in both directions in compressed
+sparse row (CSR) form:
+
+- `ogids.npy`, `gene_ids.npy`: the sorted unique OG ids and odb_gene_ids
+- `og_offsets.npy`, `og_members.npy`: the members of OG `i` are the genes
+  `og_members[og_offsets[i]:og_offsets[i + 1]]`, in the same order as in the
+  orthoDB file (and the OG2genes sqlite database)
+- `gene_offsets.npy`, `gene_ogs.npy`: the OGs of gene `j` are
+  `gene_ogs[gene_offsets[j]:gene_offsets[j + 1]]` (sorted, without duplicates)
+
+The arrays are loaded with `mmap_mode="r"`, so a lookup is a binary search
+for the id and a slice, and processes that use the index share the pages in
+the OS page cache instead of each holding a copy.
+
+Build the index with `odb_groups-build_databases -t OG2genes_csr` (it is
+built by default). `sql_queries` uses it for the OG membership lookups when it
+exists next to the OG2genes database (see `sql_queries._membership_index`).
+"""
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+FORMAT_VERSION = 1
+# rows of the OG2genes file read at a time when building the index
+READ_CHUNK_SIZE = 5_000_000
+
+
+def _read_og2genes(og2genes_file: str | Path) -> tuple[np.ndarray, np.ndarray]:
+    """return the OG ids and gene ids of the rows of an OG2genes file as bytes arrays"""
+    og_ids, gene_ids = [], []
+    if Path(og2genes_file).stat().st_size == 0:
+        # (pandas can't read an empty file)
+        return np.array([], dtype="S1"), np.array([], dtype="S1")
+    for chunk in pd.read_csv(
+        og2genes_file,
+        sep="\t",
+        header=None,
+        names=["OG_id", "odb_gene_id"],
+        dtype=str,
+        na_filter=False,
+        chunksize=READ_CHUNK_SIZE,
+    ):
+        og_ids.append(chunk["OG_id"].to_numpy(dtype=bytes))
+        gene_ids.append(chunk["odb_gene_id"].to_numpy(dtype=bytes))
+    return np.concatenate(og_ids), np.concatenate(gene_ids)
+
+
+def _offsets(row_codes: np.ndarray, n_rows: int) -> np.ndarray:
+    """CSR offsets from the (sorted) row of each entry"""
+    offsets = np.zeros(n_rows + 1, dtype=np.int64)
+    np.cumsum(np.bincount(row_codes, minlength=n_rows), out=offsets[1:])
+    return offsets
+
+
+def _index_dtype(n: int):
+    return np.int32 if n < 2**31 else np.int64
+
+
+def build_membership_index(og2genes_file: str | Path, index_dir: str | Path) -> dict:
+    """build the CSR membership arrays from an OG2genes file
+
+    The whole file is held in memory while building the index (roughly
+    `2 * id length + 24` bytes per row).
+
+    Parameters
+    ----------
+    og2genes_file : str | Path
+        the orthoDB OG2genes file (OG id, odb_gene_id)
+    index_dir : str | Path
+        directory to write the index to. Created if it doesn't exist
+
+    Returns
+    -------
+    dict
+        {"n_rows": number of rows, "n_ogs": number of OGs, "n_genes": number of genes}
+    """
+    og_ids, gene_ids = _read_og2genes(og2genes_file)
+    n_rows = len(og_ids)
+    ogids, og_codes = np.unique(og_ids, return_inverse=True)
+    del og_ids
+    gene_id_array, gene_codes = np.unique(gene_ids, return_inverse=True)
+    del gene_ids
+    n_ogs, n_genes = len(ogids), len(gene_id_array)
+
+    # OG -> genes. A stable sort keeps the members in file order
+    order = np.argsort(og_codes, kind="stable")
+    og_members = gene_codes[order].astype(_index_dtype(n_genes))
+    og_offsets = _offsets(og_codes[order], n_ogs)
+    del order
+
+    # gene -> OGs, without the duplicated rows
+    pairs = np.unique(gene_codes.astype(np.int64) * max(n_ogs, 1) + og_codes)
+    gene_ogs = (pairs % max(n_ogs, 1)).astype(_index_dtype(n_ogs))
+    gene_offsets = _offsets(pairs // max(n_ogs, 1), n_genes)
+
+    index_dir = Path(index_dir)
+    index_dir.mkdir(parents=True, exist_ok=True)
+    np.save(index_dir / "ogids.npy", ogids)
+    np.save(index_dir / "gene_ids.npy", gene_id_array)
+    np.save(index_dir / "og_offsets.npy", og_offsets)
+    np.save(index_dir / "og_members.npy", og_members)
+    np.save(index_dir / "gene_offsets.npy", gene_offsets)
+    np.save(index_dir / "gene_ogs.npy", gene_ogs)
+    return {"n_rows": n_rows, "n_ogs": n_ogs, "n_genes": n_genes}
+
+
+def _find(sorted_ids: np.ndarray, key: str) -> int:
+    """position of `key` in a sorted bytes array, -1 if it isn't there"""
+    key = key.encode()
+    # numpy silently truncates strings that are longer than the dtype
+    if len(sorted_ids) == 0 or len(key) > sorted_ids.dtype.itemsize:
+        return -1
+    position = int(np.searchsorted(sorted_ids, key))
+    if position < len(sorted_ids) and sorted_ids[position] == key:
+        return position
+    return -1
+
+
+class OGMembershipIndex:
+    """read-only OG <-> gene membership lookups on the CSR arrays
+
+    Parameters
+    ----------
+    index_dir : str | Path
+        directory with the index built by `build_membership_index`
+    """
+
+    def __init__(self, index_dir: str | Path):
+        self.index_dir = Path(index_dir)
+        if not (self.index_dir / "ogids.npy").exists():
+            raise FileNotFoundError(
+                f"OG membership index not found: {self.index_dir}. Build it with `odb_groups-build_databases -t OG2genes_csr`"
+            )
+        self.ogids = self._load("ogids")
+        self.gene_ids = self._load("gene_ids")
+        self.og_offsets = self._load("og_offsets")
+        self.og_members = self._load("og_members")
+        self.gene_offsets = self._load("gene_offsets")
+        self.gene_ogs = self._load("gene_ogs")
+
+    def _load(self, name: str) -> np.ndarray:
+        return np.load(self.index_dir / f"{name}.npy", mmap_mode="r")
+
+    def og_members_list(self, ogid: str) -> list[str]:
+        """the odb_gene_ids of the members of an OG, in the same order as the
+        OG2genes file ([] if the OG isn't in the index)"""
+        i = _find(self.ogids, ogid)
+        if i < 0:
+            return []
+        members = self.og_members[self.og_offsets[i] : self.og_offsets[i + 1]]
+        return [x.decode() for x in self.gene_ids[members]]
+
+    def gene_ogid_list(self, odb_gene_id: str) -> list[str]:
+        """the OG ids of the OGs that a gene belongs to ([] if the gene isn't
+        in the index)"""
+        j = _find(self.gene_ids, odb_gene_id)
+        if j < 0:
+            return []
+        ogs = self.gene_ogs[self.gene_offsets[j] : self.gene_offsets[j + 1]]
+        return [x.decode() for x in self.ogids[ogs]]
+
+    def species_gene_ogid_pairs(self, species_id: str) -> list[tuple[str, str]]:
+        """(odb_gene_id, OG id) for every OG membership of the genes of a species
+
+        odb_gene_ids are formatted as "{species_id}:{gene}", so the genes of a
+        species are a contiguous range of the sorted gene ids.
+        """
+        # ";" is the character after ":"
+        bounds = [f"{species_id}:".encode(), f"{species_id};".encode()]
+        if len(self.gene_ids) == 0 or len(bounds[1]) > self.gene_ids.dtype.itemsize:
+            # (no gene id is long enough to belong to this species)
+            return []
+        first, last = np.searchsorted(self.gene_ids, bounds)
+        offsets = self.gene_offsets[first : last + 1]
+        if len(offsets) < 2:
+            return []
+        n_ogs = np.diff(offsets)
+        genes = np.repeat(np.arange(first, last), n_ogs)
+        ogs = self.gene_ogs[offsets[0] : offsets[-1]]
+        return list(
+            zip(
+                [x.decode() for x in self.gene_ids[genes]],
+                [x.decode() for x in self.ogids[ogs]],
+            )
+        )
@@ -1,16 +1,15 @@
-import copy
 from typing import Union
 
 import pandas as pd
-from Bio import SeqIO
 
 import orthodb_tools.tools.cdhit_tools as cdhit_tools
 import orthodb_tools.tools.cli_wrappers as cli
+from orthodb_tools.sequence_record import SequenceRecord
 
 
 def cdhit_clstr_retrieve_representative_sequences(
-    clstr_dict: dict, seqrecord_dict: dict[str, SeqIO.SeqRecord]
-) -> dict[str, SeqIO.SeqRecord]:
+    clstr_dict: dict, seqrecord_dict: dict[str, SequenceRecord]
+) -> dict[str, SequenceRecord]:
     """
     pull out representative seqs defined in cdhit clstr_dict from full seqrecord_dict
     """
@@ -18,16 +17,16 @@ def cdhit_clstr_retrieve_representative_sequences(
     for cluster_id in clstr_dict.keys():
         id_i = clstr_dict[cluster_id]["representative_seq"]
         # id_i = re.findall(r'\d+\_\d\:.+$', rep_i)[0]
-        clustered_seq_dict[id_i] = copy.deepcopy(seqrecord_dict[id_i])
+        clustered_seq_dict[id_i] = seqrecord_dict[id_i]
     return clustered_seq_dict
 
 
 def cdhit_main(
-    seqrecord_dict: dict[str, SeqIO.SeqRecord],
+    seqrecord_dict: dict[str, SequenceRecord],
     query_odb_gene_id: str,
     repr_id_keywords: list[str] | None = None,
     **kwargs,
-) -> tuple[str, dict[str, SeqIO.SeqRecord]]:
+) -> tuple[str, dict[str, SequenceRecord]]:
     """ """
     if repr_id_keywords is None:
         repr_id_keywords = []
@@ -1,17 +1,15 @@
-import copy
-
-import pandas as pd
-from Bio.SeqRecord import SeqRecord
+from orthodb_tools.sequence_record import SequenceRecord
 
 
 def filter_seqs_with_nonaa_chars(
-    seqrecord_dict: dict[str, SeqRecord],
+    seqrecord_dict: dict[str, SequenceRecord],
     prohibited_chars: list[str] = ["X", "x", "*", "J", "B", "Z", "U"],
-) -> dict[str, SeqRecord]:
+) -> dict[str, SequenceRecord]:
     """
     filter sequences with non amino acid characters such as X and *.
 
-    Returns a new dictionary with the filtered sequences
+    Returns a new dictionary with the filtered sequences. The records are
+    immutable, so they are not copied
     """
     filtered_og_seq_dict = {}
     for seq_id, seq in seqrecord_dict.items():
@@ -24,17 +22,17 @@ def filter_seqs_with_nonaa_chars(
         s = str(seq.seq)
         if any(char in s for char in prohibited_chars):
             continue
-        filtered_og_seq_dict[seq_id] = copy.deepcopy(seq)
+        filtered_og_seq_dict[seq_id] = seq
     return filtered_og_seq_dict
 
 
 def filter_shorter_sequences(
-    seqrecord_dict: dict[str, SeqRecord],
+    seqrecord_dict: dict[str, SequenceRecord],
     min_length: int | float,
-) -> dict[str, SeqRecord]:
+) -> dict[str, SequenceRecord]:
     filtered_og_seq_dict = {}
     for seq_id, seq in seqrecord_dict.items():
         if len(seq) < min_length:
             continue
-        filtered_og_seq_dict[seq_id] = copy.deepcopy(seq)
+        filtered_og_seq_dict[seq_id] = seq
     return filtered_og_seq_dict
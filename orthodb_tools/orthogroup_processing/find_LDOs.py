@@ -1,37 +1,50 @@
-import copy
-
 import numpy as np
 import pandas as pd
 from alfpy.utils import distmatrix
-from Bio import SeqIO
 
-import orthodb_tools.sql_queries as sql_queries
+import orthodb_tools.query_cache as query_cache
 import orthodb_tools.tools.alignment_tools as aln_tools
 import orthodb_tools.tools.cli_wrappers as cli
+from orthodb_tools.orthogroup_processing.og_group import OGGroup
+from orthodb_tools.sequence_record import SequenceRecord
 
 
-def setup_df(seqrecord_dict_in: dict[str, SeqIO.SeqRecord]) -> pd.DataFrame:
-    seqrecord_dict = copy.deepcopy(seqrecord_dict_in)
+def setup_df(
+    seqrecord_dict: dict[str, SequenceRecord],
+    species_id_dict: dict[str, str] | None = None,
+) -> pd.DataFrame:
+    """`species_id_dict` maps odb_gene_ids to species ids. If it's not provided,
+    the species are looked up"""
     seqrecord_list = [seq for seq in seqrecord_dict.values()]
     df = pd.DataFrame(columns=["id"], index=range(len(seqrecord_dict)))
     df["id"] = [seqrecord.id for seqrecord in seqrecord_list]
-    df["organism"] = df["id"].apply(lambda x: sql_queries.odb_gene_id_2_species_id(x))
+    if species_id_dict is None:
+        species_id_dict = query_cache.odb_gene_id_list_2_species_id_dict(list(df["id"]))
+    df["organism"] = [species_id_dict[i] for i in df["id"]]
     df["sequence"] = df["id"].map(seqrecord_dict)
     return df
 
 
 def addpid_by_msa(
     df_in: pd.DataFrame,
-    query_seqrecord: SeqIO.SeqRecord,
-    seqrecord_dict: dict[str, SeqIO.SeqRecord],
+    query_seqrecord: SequenceRecord,
+    seqrecord_dict: dict[str, SequenceRecord],
     n_align_threads: int = 8,
+    og_group: OGGroup | None = None,
     **mafft_kwargs,
 ) -> pd.DataFrame:
+    """if `og_group` is provided, the MSA is shared with the other queries of
+    the group that align the same sequences"""
     df = df_in.copy()
     seqrecord_list = [seq for seq in seqrecord_dict.values()]
-    _, msa_seqrecord_dict = cli.mafft_align_wrapper(
-        seqrecord_list, n_align_threads=n_align_threads, **mafft_kwargs
-    )
+    if og_group is not None:
+        _, msa_seqrecord_dict = og_group.mafft_align(
+            seqrecord_list, n_align_threads=n_align_threads, **mafft_kwargs
+        )
+    else:
+        _, msa_seqrecord_dict = cli.mafft_align_wrapper(
+            seqrecord_list, n_align_threads=n_align_threads, **mafft_kwargs
+        )
     query_msa_seqrecord = msa_seqrecord_dict[query_seqrecord.id]  # type: ignore
     # query_msa_seqrecord = [i for i in msa_seqrecord_dict if i.id == query_seqrecord.id][ # type: ignore
     # 0
@@ -47,7 +60,7 @@ def addpid_by_msa(
 
 def addpid_by_msa_by_organism(
     df_in: pd.DataFrame,
-    query_seqrecord: SeqIO.SeqRecord,
+    query_seqrecord: SequenceRecord,
     n_align_threads: int = 8,
     **mafft_kwargs,
 ) -> pd.DataFrame:
@@ -79,36 +92,47 @@ def addpid_by_msa_by_organism(
 
 
 def addpid_by_alfpy_google_distance(
-    df_in: pd.DataFrame, query_seqrecord: SeqIO.SeqRecord
+    df_in: pd.DataFrame,
+    query_seqrecord: SequenceRecord,
+    og_group: OGGroup | None = None,
 ) -> pd.DataFrame:
+    """if `og_group` is provided, the similarities are computed from the word
+    frequencies shared by the queries of the group (see `og_group.py`)"""
     df = df_in.copy()
     print("comparing sequences using alignment free comparison (alfpy google distance)")
-    org_set = df["organism"].unique()
+    # the sequences of each organism, in order of first appearance (like
+    # `df["organism"].unique()`), without filtering the dataframe for each one
+    org_seqs_dict = {}
+    for org_i, seq in zip(df["organism"], df["sequence"]):
+        org_seqs_dict.setdefault(org_i, []).append(seq)
     pid_map_dict = {}
     # counter = 0
-    for org_i in org_set:
+    for org_i, seqs in org_seqs_dict.items():
         # counter += 1
-        # get all the sequences for this organism
-        seqs = list(df[df["organism"] == org_i]["sequence"].values)
         # add the query sequence to the list
         if query_seqrecord.id not in [seq.id for seq in seqs]:
             seqs.append(query_seqrecord)
-        matrix = aln_tools.alfpy_distance_matrix(seqs, word_size=2)
-        id_list, query_row_similarity = aln_tools.query_alfpy_distance_matrix(
-            query_seqrecord.id, matrix, similarity=True
-        )
+        if og_group is not None:
+            id_list, query_row_similarity = og_group.alfpy_google_similarities(
+                seqs, query_seqrecord.id
+            )
+        else:
+            matrix = aln_tools.alfpy_distance_matrix(seqs, word_size=2)
+            id_list, query_row_similarity = aln_tools.query_alfpy_distance_matrix(
+                query_seqrecord.id, matrix, similarity=True
+            )
         for seq_id, similarity in zip(id_list, query_row_similarity):
             pid_map_dict[seq_id] = similarity
         # if counter % 100 == 0:
-        # print(f'finished {counter} of {len(org_set)} organisms')
+        # print(f'finished {counter} of {len(org_seqs_dict)} organisms')
     df["PID"] = df["id"].map(pid_map_dict)
     return df
 
 
 def addpid_by_pairwise(
     df_in: pd.DataFrame,
-    query_seqrecord: SeqIO.SeqRecord,
-    seqrecord_dict: dict[str, SeqIO.SeqRecord],
+    query_seqrecord: SequenceRecord,
+    seqrecord_dict: dict[str, SequenceRecord],
 ) -> pd.DataFrame:
     df = df_in.copy()
     seqrecord_list = [seq for seq in seqrecord_dict.values()]
@@ -121,8 +145,15 @@ def addpid_by_pairwise(
     return df
 
 
-def get_LDOs_from_pids(df: pd.DataFrame, query_seqrecord: SeqIO.SeqRecord) -> list[str]:
-    query_species_id = sql_queries.odb_gene_id_2_species_id(query_seqrecord.id)
+def get_LDOs_from_pids(
+    df: pd.DataFrame,
+    query_seqrecord: SequenceRecord,
+    species_id_dict: dict[str, str] | None = None,
+) -> list[str]:
+    if species_id_dict is not None and query_seqrecord.id in species_id_dict:
+        query_species_id = species_id_dict[query_seqrecord.id]
+    else:
+        query_species_id = query_cache.odb_gene_id_2_species_id(query_seqrecord.id)
     # remove sequences in the query organism that are not the query sequence
     df = df[(df["organism"] != query_species_id) | (df["id"] == query_seqrecord.id)]
     assert query_seqrecord.id in df["id"].values, "query sequence not found in df"
@@ -133,25 +164,36 @@ def get_LDOs_from_pids(df: pd.DataFrame, query_seqrecord: SeqIO.SeqRecord) -> li
 
 
 def find_LDOs_main(
-    seqrecord_dict: dict[str, SeqIO.SeqRecord],
-    query_seqrecord: SeqIO.SeqRecord,
+    seqrecord_dict: dict[str, SequenceRecord],
+    query_seqrecord: SequenceRecord,
     pid_method: str = "alfpy_google_distance",
     n_align_threads: int = 8,
+    species_id_dict: dict[str, str] | None = None,
+    og_group: OGGroup | None = None,
     **mafft_kwargs,
 ) -> tuple[pd.DataFrame, list[str]]:
+    """score the sequences in `seqrecord_dict` against the query with
+    `pid_method` and select the LDOs (the closest sequence in each organism)
+
+    `species_id_dict` ({odb_gene_id: species id}) can be provided if the
+    species of the sequences are already known
+
+    `og_group` can be provided to share work with the other queries of the
+    same OG (see `og_group.py`). The results are the same
+    """
     assert pid_method in [
         "msa_by_organism",
         "alfpy_google_distance",
         "pairwise",
         "msa",
     ], "LDO selection method not recognized. must be one of: msa_by_organism, alfpy_google_distance, pairwise, msa"
-    df = setup_df(seqrecord_dict)
+    df = setup_df(seqrecord_dict, species_id_dict)
     if pid_method == "msa_by_organism":
         df = addpid_by_msa_by_organism(
             df, query_seqrecord, n_align_threads=n_align_threads, **mafft_kwargs
         )
     elif pid_method == "alfpy_google_distance":
-        df = addpid_by_alfpy_google_distance(df, query_seqrecord)
+        df = addpid_by_alfpy_google_distance(df, query_seqrecord, og_group)
     elif pid_method == "pairwise":
         df = addpid_by_pairwise(df, query_seqrecord, seqrecord_dict)
     elif pid_method == "msa":
@@ -160,6 +202,7 @@ def find_LDOs_main(
             query_seqrecord,
             seqrecord_dict,
             n_align_threads=n_align_threads,
+            og_group=og_group,
             **mafft_kwargs,
         )
-    return df, get_LDOs_from_pids(df, query_seqrecord)
+    return df, get_LDOs_from_pids(df, query_seqrecord, species_id_dict)
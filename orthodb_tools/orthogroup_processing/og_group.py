@@ -0,0 +1,138 @@
+"""
+work that is shared by the queries of one OG
+
+When the pipeline is run for many genes of a species (see
+`scripts/pipeline_all_genes_in_species.py`), paralogs often belong to the same
+OG at a level. An `OGGroup` holds what can be computed once for all of the
+queries of an OG and reused by each of them:
+
+- the 2-mer (word) frequencies of each sequence, used for the alfpy google
+  distance LDO selection (see `find_LDOs.addpid_by_alfpy_google_distance`)
+- the MSAs of the "msa" LDO selection method, for queries that align the same
+  sequences (see `find_LDOs.addpid_by_msa`)
+
+The similarities are the same as the ones computed with alfpy (bit for bit).
+alfpy builds the word list from the sequences that are compared (in order of
+first appearance) and the sums of the frequency vectors depend on that order,
+so the vectors of each comparison are rebuilt in the same order from the
+frequencies of each sequence instead of being taken from one all-vs-all matrix
+of the OG.
+"""
+
+import numpy as np
+
+import orthodb_tools.tools.alignment_tools as aln_tools
+import orthodb_tools.tools.cli_wrappers as cli
+from orthodb_tools.sequence_record import SequenceRecord
+
+# the word size used for the alfpy google distance (see `find_LDOs.py`)
+WORD_SIZE = 2
+# larger than any unicode code point, to encode a word as one integer
+_CODE_BASE = 0x110000
+
+
+def _word_frequencies(sequence: str) -> tuple[np.ndarray, np.ndarray]:
+    """the distinct 2-mers of `sequence` (as integers) in order of first
+    appearance and their frequencies, as computed by alfpy's `word_vector.Freqs`
+    """
+    codes = np.frombuffer(sequence.upper().encode("utf-32-le"), dtype=np.uint32)
+    codes = codes.astype(np.int64)
+    words = codes[:-1] * _CODE_BASE + codes[1:]
+    unique_words, first_index, counts = np.unique(
+        words, return_index=True, return_counts=True
+    )
+    order = np.argsort(first_index)
+    return unique_words[order], counts[order] / (len(sequence) - WORD_SIZE + 1)
+
+
+class OGGroup:
+    """the shared work of the queries of one OG (see the module docstring)
+
+    Parameters
+    ----------
+    sequence_dict : dict[str, SequenceRecord]
+        the sequences of the OG
+    species_id_dict : dict[str, str] | None, optional
+        maps the odb_gene_ids of the sequences to their species ids, by default None
+    """
+
+    def __init__(
+        self,
+        sequence_dict: dict[str, SequenceRecord],
+        species_id_dict: dict[str, str] | None = None,
+    ):
+        self.sequence_dict = sequence_dict
+        self.species_id_dict = species_id_dict
+        self._word_frequencies = {}
+        self._msas = {}
+
+    def word_frequencies(
+        self, seqrecord: SequenceRecord
+    ) -> tuple[np.ndarray, np.ndarray]:
+        if seqrecord.id not in self._word_frequencies:
+            self._word_frequencies[seqrecord.id] = _word_frequencies(str(seqrecord.seq))
+        return self._word_frequencies[seqrecord.id]
+
+    def alfpy_google_similarities(
+        self, seqrecord_list: list[SequenceRecord], query_id: str
+    ) -> tuple[list[str], np.ndarray]:
+        """the alfpy google similarity of the query to each sequence of
+        `seqrecord_list` (which includes the query)
+
+        Same as `aln_tools.alfpy_distance_matrix` followed by
+        `aln_tools.query_alfpy_distance_matrix`, but only the query row is
+        computed and the word frequencies of the sequences are computed once
+        for the group
+        """
+        id_list = [i.id for i in seqrecord_list]
+        if any(len(i) < WORD_SIZE for i in seqrecord_list):
+            # alfpy divides by zero or has no words to compare
+            matrix = aln_tools.alfpy_distance_matrix(
+                seqrecord_list, word_size=WORD_SIZE
+            )
+            return aln_tools.query_alfpy_distance_matrix(
+                query_id, matrix, similarity=True
+            )
+        # same row as `query_alfpy_distance_matrix`
+        query_row = [c for c, i in enumerate(id_list) if query_id in i][0]
+        frequencies = [self.word_frequencies(i) for i in seqrecord_list]
+        words = np.concatenate([w for w, _ in frequencies])
+        # the word list of alfpy: the words of all of the sequences in order
+        # of first appearance
+        _, first_index, inverse = np.unique(
+            words, return_index=True, return_inverse=True
+        )
+        column = np.empty(len(first_index), dtype=np.int64)
+        column[np.argsort(first_index)] = np.arange(len(first_index))
+        vectors = np.zeros((len(seqrecord_list), len(first_index)))
+        vectors[
+            np.repeat(np.arange(len(frequencies)), [len(w) for w, _ in frequencies]),
+            column[inverse],
+        ] = np.concatenate([f for _, f in frequencies])
+        # `word_distance.Distance.pwdist_google` for the query row
+        sums = np.sum(vectors, axis=1)
+        sum_min = np.sum(np.minimum(vectors[query_row], vectors), axis=1)
+        query_sum = sums[query_row]
+        distance = (np.maximum(query_sum, sums) - sum_min) / (
+            (query_sum + sums) - np.minimum(query_sum, sums)
+        )
+        distance[query_row] = 0
+        return id_list, 1 - distance
+
+    def mafft_align(
+        self,
+        seqrecord_list: list[SequenceRecord],
+        n_align_threads: int = 8,
+        **mafft_kwargs,
+    ):
+        """`cli.mafft_align_wrapper`, run once for each list of sequences"""
+        key = (
+            tuple(i.id for i in seqrecord_list),
+            n_align_threads,
+            tuple(sorted(mafft_kwargs.items())),
+        )
+        if key not in self._msas:
+            self._msas[key] = cli.mafft_align_wrapper(
+                seqrecord_list, n_align_threads=n_align_threads, **mafft_kwargs
+            )
+        return self._msas[key]
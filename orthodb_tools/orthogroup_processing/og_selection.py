@@ -1,17 +1,19 @@
 import pandas as pd
 
 import orthodb_tools.env_variables.env_variables as env
+import orthodb_tools.query_cache as query_cache
 import orthodb_tools.sql_queries as sql_queries
 
-ODB_DATABASE = env.orthoDBDatabase()
-
 
 def _ogid_list_2_og_info_df(ogid_list: list[str]) -> pd.DataFrame:
-    og_query_results = []
-    for og_id in ogid_list:
-        og_query_results.append(sql_queries.get_ogid_info(og_id))
+    og_info_dict = query_cache.ogid_list_2_ogid_info_dict(ogid_list)
+    og_query_results = [og_info_dict[og_id] for og_id in ogid_list]
+    return _og_info_list_2_og_info_df(og_query_results)
+
+
+def _og_info_list_2_og_info_df(og_info_list: list[tuple[str]]) -> pd.DataFrame:
     og_df = pd.DataFrame.from_records(
-        og_query_results, columns=["OG id", "level NCBI tax id", "OG name"]
+        og_info_list, columns=["OG id", "level NCBI tax id", "OG name"]
     )
     og_df["level NCBI tax id"] = og_df["level NCBI tax id"].astype(int)
     return og_df
@@ -20,8 +22,15 @@ def _ogid_list_2_og_info_df(ogid_list: list[str]) -> pd.DataFrame:
 def ogid_list_2_og_level_info_df(ogid_list: list[str]) -> pd.DataFrame:
     """get info about the list of OGs available for the selected geneid"""
     query_og_df = _ogid_list_2_og_info_df(ogid_list)
+    return _og_info_df_2_og_level_info_df(query_og_df)
+
+
+def _og_info_df_2_og_level_info_df(query_og_df: pd.DataFrame) -> pd.DataFrame:
     query_available_OGs_info_df = pd.merge(
-        query_og_df, ODB_DATABASE.data_levels_df, on="level NCBI tax id", how="left"
+        query_og_df,
+        env.get_orthoDB_database().data_levels_df,
+        on="level NCBI tax id",
+        how="left",
     )
     query_available_OGs_info_df = query_available_OGs_info_df[
         [
@@ -50,13 +59,44 @@ def get_available_ogs(odb_gene_id: str) -> pd.DataFrame:
     returns a dataframe with the following columns:
     OG id | level NCBI tax id | level name | total non-redundant count of species underneath | OG name
     """
-    ogid_list = sql_queries.odb_gene_id_2_ogid_list(odb_gene_id)
-    return ogid_list_2_og_level_info_df(ogid_list)
+    og_info_list = query_cache.odb_gene_id_2_og_info_list(odb_gene_id)
+    return _og_info_df_2_og_level_info_df(_og_info_list_2_og_info_df(og_info_list))
+
 
+def get_og_level_list(odb_gene_id: str) -> list[tuple[str, int, str]]:
+    """get the OG id, level NCBI tax id and level name of each OG that an input
+    odb gene id belongs to.
 
-def select_OG_by_level_name(odb_gene_id: str, level_name: str) -> tuple[str, str]:
+    This is a single query to the OG databases (see `sql_queries.odb_gene_id_2_og_info_list`),
+    the level names are looked up in the levels table that is already in memory.
+
+    Raises
+    ------
+    ValueError
+        raised by `sql_queries.odb_gene_id_2_og_info_list` (through
+        `query_cache`) if no OGs are found for the `odb_gene_id`, including
+        when the `odb_gene_id` is not in the database. Callers that only need
+        the OGs of the genes that have some (e.g. to plan jobs) have to catch it
+    """
+    levels_taxid_name_dict = env.get_orthoDB_database().data_levels_taxid_name_dict
+    og_level_list = []
+    for ogid, level_taxid, _ in query_cache.odb_gene_id_2_og_info_list(odb_gene_id):
+        level_taxid = int(level_taxid)
+        level_name = levels_taxid_name_dict.get(level_taxid)
+        og_level_list.append((ogid, level_taxid, level_name))
+    return og_level_list
+
+
+def select_OG_by_level_name(
+    odb_gene_id: str,
+    level_name: str,
+    og_level_list: list[tuple[str, int, str]] | None = None,
+) -> tuple[str, str]:
     """select an OG from the list of available OGs for the selected gene id
 
+    `og_level_list` is the output of `get_og_level_list` for the gene, if it
+    has already been looked up (e.g. to select OGs at several levels)
+
     Returns
     -------
     str
@@ -71,7 +111,13 @@ def select_OG_by_level_name(odb_gene_id: str, level_name: str) -> tuple[str, str
     ValueError
         raised if multiple OGs are found for the `odb_gene_id` with level name `level_name`
     """
-    ogs_info_df = get_available_ogs(odb_gene_id)
+    if og_level_list is None:
+        og_level_list = get_og_level_list(odb_gene_id)
+    selected_ogs = [og for og in og_level_list if og[2] == level_name]
+    if len(selected_ogs) == 1:
+        return selected_ogs[0][0], selected_ogs[0][2]
+    # only build the full table of available OGs when it's needed for the error message
+    ogs_info_df = ogid_list_2_og_level_info_df([og[0] for og in og_level_list])
     selected_OG_info_df = ogs_info_df[ogs_info_df["level name"] == level_name]
     if len(selected_OG_info_df) == 0:
         raise ValueError(
@@ -85,3 +131,39 @@ def select_OG_by_level_name(odb_gene_id: str, level_name: str) -> tuple[str, str
         selected_OG_info_df["OG id"].values[0],
         selected_OG_info_df["level name"].values[0],
     )
+
+
+def species_og_level_table(species_id: str, level_names: list[str]) -> pd.DataFrame:
+    """build a table of the OG that each gene of a species belongs to at each
+    level in `level_names`.
+
+    The OG membership of the whole species is read in one pass (see
+    `sql_queries.species_id_2_og_info_list`) instead of looking up the OGs of
+    each gene separately.
+
+    returns a dataframe with one row for every gene in the species and level name
+    with the following columns:
+    odb_gene_id | level name | OG id | n OGs
+
+    `n OGs` is the number of OGs that the gene belongs to at that level. `OG id`
+    is only filled in if there is exactly one OG (i.e. if `select_OG_by_level_name`
+    would succeed), otherwise it is missing.
+    """
+    gene_list = sorted(sql_queries.get_all_odb_gene_ids_from_species_id(species_id))
+    level_names = list(dict.fromkeys(level_names))
+    levels_taxid_name_dict = env.get_orthoDB_database().data_levels_taxid_name_dict
+    gene_level_ogs = {}
+    for odb_gene_id, ogid, level_taxid in sql_queries.species_id_2_og_info_list(
+        species_id
+    ):
+        level_name = levels_taxid_name_dict.get(int(level_taxid))
+        gene_level_ogs.setdefault((odb_gene_id, level_name), []).append(ogid)
+    records = []
+    for odb_gene_id in gene_list:
+        for level_name in level_names:
+            ogids = gene_level_ogs.get((odb_gene_id, level_name), [])
+            ogid = ogids[0] if len(ogids) == 1 else None
+            records.append((odb_gene_id, level_name, ogid, len(ogids)))
+    return pd.DataFrame.from_records(
+        records, columns=["odb_gene_id", "level name", "OG id", "n OGs"]
+    )
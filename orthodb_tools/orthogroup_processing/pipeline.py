@@ -1,9 +1,11 @@
 #!/usr/bin/env python
 
-import copy
 import json
+from itertools import chain
 from pathlib import Path
 
+import alfpy
+import Bio
 import yaml
 from attrs import asdict
 from Bio import SeqIO
@@ -11,16 +13,16 @@ from Bio import SeqIO
 import orthodb_tools.env_variables.env_variables as env
 import orthodb_tools.tools.cli_wrappers as cli_wrappers
 from orthodb_tools.config import orthodb_pipeline_parameters
-from orthodb_tools import sql_queries
+from orthodb_tools import query_cache, stage_cache, stage_metrics
 from orthodb_tools.orthogroup_processing import (
     cluster,
     filters,
     find_LDOs,
+    og_group,
     og_selection,
     uniprotid_search,
 )
-
-ODB_DATABASE = env.orthoDBDatabase()
+from orthodb_tools.sequence_record import SequenceRecord
 
 
 def load_config(config_file: str | None) -> orthodb_pipeline_parameters.PipelineParams:
@@ -33,36 +35,202 @@ def load_config(config_file: str | None) -> orthodb_pipeline_parameters.Pipeline
     return config
 
 
-def generate_species_map(odb_gene_id_list: list[str]):
+def generate_species_map(
+    odb_gene_id_list: list[str], species_id_dict: dict[str, str] | None = None
+):
+    if species_id_dict is None:
+        species_id_dict = query_cache.odb_gene_id_list_2_species_id_dict(
+            odb_gene_id_list
+        )
+    species_dict = env.get_orthoDB_database().data_species_dict
     species_map = {}
     for odb_gene_id in odb_gene_id_list:
-        species_id = sql_queries.odb_gene_id_2_species_id(odb_gene_id)
-        species_map[odb_gene_id] = ODB_DATABASE.data_species_dict[species_id]
+        species_id = species_id_dict[odb_gene_id]
+        species_map[odb_gene_id] = species_dict[species_id]
     return species_map
 
 
-def filter_sequences(min_fraction_shorter_than_query, query_seqrecord, sequence_dict):
+def _sequences_passing_filters(
+    min_fraction_shorter_than_query, query_seqrecord, sequence_dict
+):
     filtered_sequence_dict = filters.filter_seqs_with_nonaa_chars(
         sequence_dict,
     )
     min_length = min_fraction_shorter_than_query * len(query_seqrecord)
-    filtered_sequence_dict = filters.filter_shorter_sequences(
+    return filters.filter_shorter_sequences(
         filtered_sequence_dict,
         min_length=min_length,
     )
+
+
+def filter_sequences(min_fraction_shorter_than_query, query_seqrecord, sequence_dict):
+    filtered_sequence_dict = _sequences_passing_filters(
+        min_fraction_shorter_than_query, query_seqrecord, sequence_dict
+    )
     if query_seqrecord.id not in filtered_sequence_dict:
-        filtered_sequence_dict[query_seqrecord.id] = copy.deepcopy(query_seqrecord)
+        filtered_sequence_dict[query_seqrecord.id] = query_seqrecord
     return filtered_sequence_dict
 
 
+def find_LDOs_cached(
+    config: orthodb_pipeline_parameters.PipelineParams,
+    seqrecord_dict: dict[str, SequenceRecord],
+    query_seqrecord: SequenceRecord,
+    species_id_dict: dict[str, str] | None = None,
+    group: og_group.OGGroup | None = None,
+):
+    """`find_LDOs.find_LDOs_main` through the stage cache (see `stage_cache.py`)"""
+    params = config.ldo_select_params
+
+    def run():
+        return find_LDOs.find_LDOs_main(
+            seqrecord_dict=seqrecord_dict,
+            query_seqrecord=query_seqrecord,
+            pid_method=params.LDO_selection_method,
+            n_align_threads=params.LDO_mafft_threads,
+            species_id_dict=species_id_dict,
+            og_group=group,
+            mafft_executable=params._LDO_mafft_exe,
+            extra_args=params._LDO_mafft_additional_args,
+        )
+
+    cache = stage_cache.get_stage_cache()
+    if cache is None:
+        return run()
+    key_params = {
+        "query": query_seqrecord.id,
+        "pid_method": params.LDO_selection_method,
+    }
+    if params.LDO_selection_method in ["msa", "msa_by_organism"]:
+        key_params["mafft"] = stage_cache.tool_fingerprint(params._LDO_mafft_exe)
+        key_params["mafft_args"] = params._LDO_mafft_additional_args
+    else:
+        key_params["alfpy"] = alfpy.__version__
+        key_params["biopython"] = Bio.__version__
+    key = stage_cache.stage_key("find_LDOs", seqrecord_dict.values(), key_params)
+    cached = cache.get("find_LDOs", key)
+    if cached is not None:
+        pid_df = cached["pid_df"]
+        # the sequences aren't stored in the cache
+        pid_df.insert(2, "sequence", pid_df["id"].map(seqrecord_dict))
+        return pid_df, cached["ldos"]
+    pid_df, ldos = run()
+    cache.put(
+        "find_LDOs",
+        key,
+        {"pid_df": pid_df.drop(columns="sequence"), "ldos": ldos},
+    )
+    return pid_df, ldos
+
+
+def cdhit_cached(
+    config: orthodb_pipeline_parameters.PipelineParams,
+    seqrecord_dict: dict[str, SequenceRecord],
+    query_odb_gene_id: str,
+) -> tuple[str, dict[str, SequenceRecord]]:
+    """`cluster.cdhit_main` through the stage cache (see `stage_cache.py`)"""
+
+    def run():
+        return cluster.cdhit_main(
+            seqrecord_dict,
+            query_odb_gene_id,
+            cd_hit_executable=config._cd_hit_exe,
+            extra_args=config._cd_hit_additional_args,
+        )
+
+    cache = stage_cache.get_stage_cache()
+    if cache is None:
+        return run()
+    key_params = {
+        "query": query_odb_gene_id,
+        "cd_hit": stage_cache.tool_fingerprint(config._cd_hit_exe),
+        "cd_hit_args": config._cd_hit_additional_args,
+    }
+    key = stage_cache.stage_key("cdhit", seqrecord_dict.values(), key_params)
+    cached = cache.get("cdhit", key)
+    if cached is not None:
+        return cached["command"], {
+            i: seqrecord_dict[i] for i in cached["representatives"]
+        }
+    cdhit_command, clustered_seqrecord_dict = run()
+    cache.put(
+        "cdhit",
+        key,
+        {
+            "command": cdhit_command,
+            "representatives": list(clustered_seqrecord_dict.keys()),
+        },
+    )
+    return cdhit_command, clustered_seqrecord_dict
+
+
+def mafft_align_cached(
+    config: orthodb_pipeline_parameters.PipelineParams,
+    seqrecord_list: list[SequenceRecord],
+) -> tuple[str, list]:
+    """`cli_wrappers.mafft_align_wrapper` (the final alignment) through the
+    stage cache (see `stage_cache.py`). Returns the command and the aligned
+    `SeqRecord`s"""
+
+    def run():
+        return cli_wrappers.mafft_align_wrapper(
+            seqrecord_list,
+            n_align_threads=config.align_params.n_align_threads,
+            mafft_executable=config.align_params._mafft_exe,
+            extra_args=config.align_params._mafft_additional_args,
+            output_format="list",
+        )
+
+    cache = stage_cache.get_stage_cache()
+    if cache is None:
+        return run()
+    key_params = {
+        "mafft": stage_cache.tool_fingerprint(config.align_params._mafft_exe),
+        "mafft_args": config.align_params._mafft_additional_args,
+    }
+    key = stage_cache.stage_key("mafft_alignment", seqrecord_list, key_params)
+    cached = cache.get("mafft_alignment", key)
+    if cached is not None:
+        return cached["command"], [
+            SequenceRecord(i, seq, description).to_seqrecord()
+            for i, description, seq in cached["alignment"]
+        ]
+    mafft_command, aln = run()
+    cache.put(
+        "mafft_alignment",
+        key,
+        {
+            "command": mafft_command,
+            "alignment": [(r.id, r.description, str(r.seq)) for r in aln],
+        },
+    )
+    return mafft_command, aln
+
+
 def save_info_json(output_dict: dict, output_file: str | Path):
     Path(output_file).parent.mkdir(parents=True, exist_ok=True)
     with open(output_file, "w") as f:
         json.dump(output_dict, f, indent=4)
 
 
+def save_stage_metrics_summary(
+    config: orthodb_pipeline_parameters.PipelineParams, summary: dict
+):
+    """print the summary of the stage metrics of a run (see
+    `stage_metrics.merge_totals`) and save it to
+    `stage_metrics_summary.json` in the main output folder"""
+    print(stage_metrics.format_summary(summary))
+    if config.write_files and summary:
+        save_info_json(
+            summary, Path(config.main_output_folder) / "stage_metrics_summary.json"
+        )
+
+
 def _pipeline(
-    config: orthodb_pipeline_parameters.PipelineParams, odb_gene_id: str
+    config: orthodb_pipeline_parameters.PipelineParams,
+    odb_gene_id: str,
+    ogid: str | None = None,
+    metrics: stage_metrics.StageMetrics | None = None,
 ) -> dict:
     """runs the pipeline for a odb_gene_id. This isn't meant to be called directly,
     Instead, use pipeline_from_uniprot_id or pipeline_from_odb_gene_id.
@@ -73,47 +241,87 @@ def _pipeline(
         pipeline parameters
     odb_gene_id : str
         the orthoDB gene id of the gene of interest (e.g. "9606_0:001c7b")
+    ogid : str | None, optional
+        the OG to use. If None, the OG is selected using `config.og_select_params`, by default None
+    metrics : stage_metrics.StageMetrics | None, optional
+        where to record the time/memory used by each stage, by default None
 
     Returns
     -------
     dict
         the results of the pipeline in a dictionary
     """
+    if metrics is None:
+        metrics = stage_metrics.StageMetrics()
     results_dict = {}
-    try:
-        ogid, oglevel = og_selection.select_OG_by_level_name(
-            odb_gene_id=odb_gene_id, level_name=config.og_select_params.OG_level_name
-        )
-    except ValueError as e:
-        results_dict["critical error"] = str(e)
-        return results_dict
-
-    group_members = sql_queries.ogid_2_odb_gene_id_list(ogid)
-    sequence_dict = ODB_DATABASE.get_sequences_from_list_of_seq_ids(group_members)
+    if ogid is not None:
+        oglevel = config.og_select_params.OG_level_name
+    else:
+        try:
+            with metrics.measure("og_selection"):
+                ogid, oglevel = og_selection.select_OG_by_level_name(
+                    odb_gene_id=odb_gene_id,
+                    level_name=config.og_select_params.OG_level_name,
+                )
+        except ValueError as e:
+            results_dict["critical error"] = str(e)
+            return results_dict
+
+    odb_database = env.get_orthoDB_database()
+    with metrics.measure("member_listing"):
+        group_members = query_cache.ogid_2_odb_gene_id_list(ogid)
+    with metrics.measure("sequence_fetch"):
+        sequence_dict = odb_database.get_sequence_records(group_members)
     query_seqrecord = sequence_dict[odb_gene_id]
 
-    filtered_sequence_dict = filter_sequences(
-        config.filter_params.min_fraction_shorter_than_query,
-        query_seqrecord,
+    with metrics.measure("filtering"):
+        filtered_sequence_dict = filter_sequences(
+            config.filter_params.min_fraction_shorter_than_query,
+            query_seqrecord,
+            sequence_dict,
+        )
+    return _og_stages(
+        config,
+        odb_gene_id,
+        ogid,
+        oglevel,
         sequence_dict,
+        filtered_sequence_dict,
+        metrics=metrics,
     )
 
-    pid_df, ldos = find_LDOs.find_LDOs_main(
-        seqrecord_dict=filtered_sequence_dict,
-        query_seqrecord=query_seqrecord,
-        pid_method=config.ldo_select_params.LDO_selection_method,
-        n_align_threads=config.ldo_select_params.LDO_mafft_threads,
-        mafft_executable=config.ldo_select_params._LDO_mafft_exe,
-        extra_args=config.ldo_select_params._LDO_mafft_additional_args,
-    )
-    ldo_seqrecord_dict = ODB_DATABASE.get_sequences_from_list_of_seq_ids(ldos)
 
-    cdhit_command, clustered_ldo_seqrec_dict = cluster.cdhit_main(
-        ldo_seqrecord_dict,
-        odb_gene_id,
-        cd_hit_executable=config._cd_hit_exe,
-        extra_args=config._cd_hit_additional_args,
-    )
+def _og_stages(
+    config: orthodb_pipeline_parameters.PipelineParams,
+    odb_gene_id: str,
+    ogid: str,
+    oglevel: str,
+    sequence_dict: dict[str, SequenceRecord],
+    filtered_sequence_dict: dict[str, SequenceRecord],
+    species_id_dict: dict[str, str] | None = None,
+    metrics: stage_metrics.StageMetrics | None = None,
+    group: og_group.OGGroup | None = None,
+) -> dict:
+    """the stages of the pipeline that run on the sequences of one OG (LDO
+    selection and clustering), once the sequences have been fetched and
+    filtered. `species_id_dict` ({odb_gene_id: species id}) can be provided if
+    the species of the sequences are already known. `group` is the work shared
+    with the other queries of the OG, if any (see `og_group.py`)"""
+    if metrics is None:
+        metrics = stage_metrics.StageMetrics()
+    results_dict = {}
+    query_seqrecord = sequence_dict[odb_gene_id]
+    with metrics.measure("ldo_selection"):
+        pid_df, ldos = find_LDOs_cached(
+            config, filtered_sequence_dict, query_seqrecord, species_id_dict, group
+        )
+    # the LDOs are members of the group, so their records were already fetched
+    ldo_seqrecord_dict = {ldo: sequence_dict[ldo] for ldo in ldos}
+
+    with metrics.measure("cdhit"):
+        cdhit_command, clustered_ldo_seqrec_dict = cdhit_cached(
+            config, ldo_seqrecord_dict, odb_gene_id
+        )
 
     results_dict["query_odb_gene_id"] = odb_gene_id
     results_dict["query_sequence_str"] = str(query_seqrecord.seq)
@@ -124,32 +332,44 @@ def _pipeline(
     results_dict["sequences_ldos"] = list(ldo_seqrecord_dict.keys())
     results_dict["sequences_clustered_ldos"] = clustered_ldo_seqrec_dict
     results_dict["cdhit_command"] = cdhit_command
-    results_dict["species_map"] = generate_species_map(
-        list(clustered_ldo_seqrec_dict.keys())
-    )
+    with metrics.measure("output"):
+        results_dict["species_map"] = generate_species_map(
+            list(clustered_ldo_seqrec_dict.keys()), species_id_dict
+        )
     return results_dict
 
 
 def pipeline_from_uniprot_id(
-    config: orthodb_pipeline_parameters.PipelineParams, uniprot_id: str
+    config: orthodb_pipeline_parameters.PipelineParams,
+    uniprot_id: str,
+    metrics: stage_metrics.StageMetrics | None = None,
 ):
+    if metrics is None:
+        metrics = stage_metrics.StageMetrics()
     try:
-        odb_gene_id = uniprotid_search.uniprotid_2_odb_gene_id(uniprot_id)
+        with metrics.measure("og_selection"):
+            odb_gene_id = uniprotid_search.uniprotid_2_odb_gene_id(uniprot_id)
     except ValueError as e:
         output_dict = {}
         output_dict["query_uniprot_id"] = uniprot_id
         output_dict["critical error"] = str(e)
         return output_dict
-    output_dict = _pipeline(config, odb_gene_id)
+    output_dict = _pipeline(config, odb_gene_id, metrics=metrics)
     output_dict["query_uniprot_id"] = uniprot_id
     return output_dict
 
 
 def pipeline_from_odb_gene_id(
-    config: orthodb_pipeline_parameters.PipelineParams, odb_gene_id: str
+    config: orthodb_pipeline_parameters.PipelineParams,
+    odb_gene_id: str,
+    ogid: str | None = None,
+    metrics: stage_metrics.StageMetrics | None = None,
 ):
-    query_uniprot_id = sql_queries.odb_gene_id_2_uniprotid(odb_gene_id)
-    output_dict = _pipeline(config, odb_gene_id)
+    if metrics is None:
+        metrics = stage_metrics.StageMetrics()
+    with metrics.measure("og_selection"):
+        query_uniprot_id = query_cache.odb_gene_id_2_uniprotid(odb_gene_id)
+    output_dict = _pipeline(config, odb_gene_id, ogid, metrics=metrics)
     output_dict["query_uniprot_id"] = query_uniprot_id
     return output_dict
 
@@ -158,6 +378,7 @@ def orthogroup_pipeline(
     config: orthodb_pipeline_parameters.PipelineParams,
     uniprot_id: str | None = None,
     odb_gene_id: str | None = None,
+    ogid: str | None = None,
 ):
     """run the main pipeline for a single gene. Either uniprot_id or odb_gene_id must be provided
 
@@ -169,6 +390,11 @@ def orthogroup_pipeline(
         uniprot id of the query protein. If not provided, then `odb_gene_id` must be provided, by default None
     odb_gene_id : str | None, optional
         orthoDB gene id of the query protein. If not provided, then `uniprot_id` must be provided, by default None
+    ogid : str | None, optional
+        the OG to use for the `odb_gene_id` if it is already known (e.g. from
+        `og_selection.species_og_level_table`). It should be the OG at level
+        `config.og_select_params.OG_level_name`. If None, the OG is selected
+        using `config.og_select_params`, by default None
 
     Returns
     -------
@@ -183,13 +409,33 @@ def orthogroup_pipeline(
         raises a ValueError if there is a "critical error" in the pipeline
         When the pipeline is run, errors are stored in the output dictionary under the key "critical error". This error is raised if it exists
     """
+    metrics = stage_metrics.StageMetrics()
     if odb_gene_id is not None:
-        output_dict = pipeline_from_odb_gene_id(config, odb_gene_id)  # type: ignore
+        output_dict = pipeline_from_odb_gene_id(config, odb_gene_id, ogid, metrics)  # type: ignore
     elif uniprot_id is not None:
-        output_dict = pipeline_from_uniprot_id(config, uniprot_id)  # type: ignore
+        output_dict = pipeline_from_uniprot_id(config, uniprot_id, metrics)  # type: ignore
     else:
         raise ValueError("either uniprot_id or odb_gene_id must be provided")
+    return _save_outputs(config, output_dict, uniprot_id, odb_gene_id, metrics)
 
+
+def _output_file_prefix(odb_gene_id: str, oglevel: str, ogid: str) -> str:
+    return f'{odb_gene_id.replace(":", "_")}_{oglevel}_{ogid}'
+
+
+def _save_outputs(
+    config: orthodb_pipeline_parameters.PipelineParams,
+    output_dict: dict,
+    uniprot_id: str | None,
+    odb_gene_id: str | None,
+    metrics: stage_metrics.StageMetrics,
+):
+    """align the clustered LDOs and write the output files of the pipeline
+    results in `output_dict` (see `orthogroup_pipeline`)
+
+    The stage metrics are saved in the info json under "stage_metrics". The
+    "output" stage doesn't include writing the info json itself
+    """
     output_dict["processing params"] = asdict(config)
     og_info_json_folder = Path(config.main_output_folder) / "info_jsons"
     og_info_failure_folder = og_info_json_folder / "failures"
@@ -200,31 +446,32 @@ def orthogroup_pipeline(
             og_info_json_file = (
                 og_info_failure_folder / f"{uniprot_id}{odb_gene_id}_info.json"
             )
+            output_dict["stage_metrics"] = metrics.as_dict()
             save_info_json(output_dict, og_info_json_file)
         raise ValueError(output_dict["critical error"])
 
-    output_file_prefix = f'{output_dict["query_odb_gene_id"].replace(":", "_")}_{output_dict["oglevel"]}_{output_dict["ogid"]}'
+    output_file_prefix = _output_file_prefix(
+        output_dict["query_odb_gene_id"], output_dict["oglevel"], output_dict["ogid"]
+    )
     og_info_json_file = og_info_json_folder / f"{output_file_prefix}_info.json"
 
     if og_info_json_file.exists() and not config.overwrite:
         raise FileExistsError(f"info json file already exists: {og_info_json_file}")
 
     if config.align_params.align:
-        mafft_command, aln = cli_wrappers.mafft_align_wrapper(
-            list(output_dict["sequences_clustered_ldos"].values()),
-            n_align_threads=config.align_params.n_align_threads,
-            mafft_executable=config.align_params._mafft_exe,
-            extra_args=config.align_params._mafft_additional_args,
-            output_format="list",
-        )
-        if config.write_files:
-            alignment_folder = Path(config.main_output_folder) / "alignments"
-            alignment_folder.mkdir(parents=True, exist_ok=True)
-            alignment_output_file = (
-                alignment_folder / f"{output_file_prefix}_clustered_ldos_aln.fasta"
+        with metrics.measure("alignment"):
+            mafft_command, aln = mafft_align_cached(
+                config, list(output_dict["sequences_clustered_ldos"].values())
             )
-            with open(alignment_output_file, "w") as f:
-                SeqIO.write(aln, f, "fasta")
+        if config.write_files:
+            with metrics.measure("output"):
+                alignment_folder = Path(config.main_output_folder) / "alignments"
+                alignment_folder.mkdir(parents=True, exist_ok=True)
+                alignment_output_file = (
+                    alignment_folder / f"{output_file_prefix}_clustered_ldos_aln.fasta"
+                )
+                with open(alignment_output_file, "w") as f:
+                    SeqIO.write(aln, f, "fasta")
             output_dict["alignment_clustered_ldos_file"] = str(
                 alignment_output_file.resolve()
             )
@@ -234,6 +481,287 @@ def orthogroup_pipeline(
     output_dict["sequences_clustered_ldos"] = list(
         output_dict["sequences_clustered_ldos"].keys()
     )
+    output_dict["stage_metrics"] = metrics.as_dict()
     if config.write_files:
         save_info_json(output_dict, og_info_json_file)
     return og_info_json_file, output_dict
+
+
+def multi_level_pipeline(
+    config: orthodb_pipeline_parameters.PipelineParams,
+    og_levels: list[str],
+    uniprot_id: str | None = None,
+    odb_gene_id: str | None = None,
+    og_level_ogid_dict: dict[str, str] | None = None,
+) -> dict[str, tuple[Path, dict] | Exception]:
+    """run the main pipeline for a single gene at several OG levels. Either
+    uniprot_id or odb_gene_id must be provided
+
+    The output files are the same as running `orthogroup_pipeline` once for
+    each level (with `config.og_select_params.OG_level_name` set to the
+    level), but the work that is shared by the levels is only done once: the
+    query and its list of OGs are looked up once, the sequences of all of the
+    OGs are fetched in one batch, and their species and the sequence filters
+    are computed once for all of the sequences. The LDO selection, clustering
+    and alignment are then run on the sequences of each OG.
+
+    The "stage_metrics" in the info json of each level include the metrics of
+    the shared stages (which ran once for all of the levels).
+
+    Parameters
+    ----------
+    config : conf.PipelineParams
+        pipeline parameters in a PipelineParams object.
+        `config.og_select_params.OG_level_name` is set to each level in turn
+    og_levels : list[str]
+        the level names at which to run the pipeline
+    uniprot_id : str | None, optional
+        uniprot id of the query protein. If not provided, then `odb_gene_id` must be provided, by default None
+    odb_gene_id : str | None, optional
+        orthoDB gene id of the query protein. If not provided, then `uniprot_id` must be provided, by default None
+    og_level_ogid_dict : dict[str, str] | None, optional
+        maps levels to the OG of the query at that level if it is already
+        known (see `og_selection.species_og_level_table`). The OGs of the
+        other levels are selected using `og_select_params`, by default None
+
+    Returns
+    -------
+    dict[str, tuple[Path, dict] | Exception]
+        for each level, the output of `orthogroup_pipeline` (the path of the
+        output file and the pipeline results), or the ValueError (critical
+        error) or FileExistsError (the output already exists) that
+        `orthogroup_pipeline` would have raised for that level
+
+    Raises
+    ------
+    ValueError
+        raises a ValueError if neither `uniprot_id` nor `odb_gene_id` are provided
+    """
+    og_levels = list(dict.fromkeys(og_levels))
+    if og_level_ogid_dict is None:
+        og_level_ogid_dict = {}
+    if odb_gene_id is None and uniprot_id is None:
+        raise ValueError("either uniprot_id or odb_gene_id must be provided")
+    # metrics of the stages that are shared by all of the levels
+    shared_metrics = stage_metrics.StageMetrics()
+    query_error = None
+    with shared_metrics.measure("og_selection"):
+        if odb_gene_id is not None:
+            query_odb_gene_id = odb_gene_id
+            query_uniprot_id = query_cache.odb_gene_id_2_uniprotid(odb_gene_id)
+        else:
+            query_uniprot_id = uniprot_id
+            try:
+                query_odb_gene_id = uniprotid_search.uniprotid_2_odb_gene_id(uniprot_id)
+            except ValueError as e:
+                query_error = str(e)
+
+    level_results = {}
+    level_metrics = {}
+    level_errors = {}
+    if query_error is None:
+        # select the OG of each level
+        level_ogs = {}
+        og_level_list = None
+        for level in og_levels:
+            ogid = og_level_ogid_dict.get(level)
+            oglevel = level
+            if ogid is None:
+                try:
+                    with shared_metrics.measure("og_selection"):
+                        if og_level_list is None:
+                            og_level_list = og_selection.get_og_level_list(
+                                query_odb_gene_id
+                            )
+                        ogid, oglevel = og_selection.select_OG_by_level_name(
+                            query_odb_gene_id, level, og_level_list
+                        )
+                except ValueError as e:
+                    level_results[level] = {"critical error": str(e)}
+                    continue
+            og_info_json_file = (
+                Path(config.main_output_folder)
+                / "info_jsons"
+                / f"{_output_file_prefix(query_odb_gene_id, oglevel, ogid)}_info.json"
+            )
+            if og_info_json_file.exists() and not config.overwrite:
+                level_errors[level] = FileExistsError(
+                    f"info json file already exists: {og_info_json_file}"
+                )
+                continue
+            level_ogs[level] = (ogid, oglevel)
+
+        # fetch the sequences of all of the OGs and compute the species and
+        # the filters of each sequence once
+        with shared_metrics.measure("member_listing"):
+            level_members = {
+                level: query_cache.ogid_2_odb_gene_id_list(ogid)
+                for level, (ogid, _) in level_ogs.items()
+            }
+            all_members = list(dict.fromkeys(chain(*level_members.values())))
+            species_id_dict = query_cache.odb_gene_id_list_2_species_id_dict(
+                all_members
+            )
+        with shared_metrics.measure("sequence_fetch"):
+            all_sequences = env.get_orthoDB_database().get_sequence_records(all_members)
+        if level_ogs:
+            query_seqrecord = all_sequences[query_odb_gene_id]
+            with shared_metrics.measure("filtering"):
+                passing_sequences = _sequences_passing_filters(
+                    config.filter_params.min_fraction_shorter_than_query,
+                    query_seqrecord,
+                    all_sequences,
+                )
+
+        for level, (ogid, oglevel) in level_ogs.items():
+            metrics = shared_metrics.copy()
+            sequence_dict = {i: all_sequences[i] for i in level_members[level]}
+            with metrics.measure("filtering"):
+                filtered_sequence_dict = {
+                    i: seqrecord
+                    for i, seqrecord in sequence_dict.items()
+                    if i in passing_sequences
+                }
+                if query_odb_gene_id not in filtered_sequence_dict:
+                    filtered_sequence_dict[query_odb_gene_id] = query_seqrecord
+            level_results[level] = _og_stages(
+                config,
+                query_odb_gene_id,
+                ogid,
+                oglevel,
+                sequence_dict,
+                filtered_sequence_dict,
+                species_id_dict,
+                metrics=metrics,
+            )
+            level_metrics[level] = metrics
+
+    outputs = {}
+    for level in og_levels:
+        if level in level_errors:
+            outputs[level] = level_errors[level]
+            continue
+        config.og_select_params.OG_level_name = level
+        if query_error is not None:
+            output_dict = {
+                "query_uniprot_id": uniprot_id,
+                "critical error": query_error,
+            }
+        else:
+            output_dict = level_results[level]
+            output_dict["query_uniprot_id"] = query_uniprot_id
+        metrics = level_metrics.get(level, shared_metrics.copy())
+        try:
+            outputs[level] = _save_outputs(
+                config, output_dict, uniprot_id, odb_gene_id, metrics
+            )
+        except (ValueError, FileExistsError) as err:
+            outputs[level] = err
+    return outputs
+
+
+def og_group_pipeline(
+    config: orthodb_pipeline_parameters.PipelineParams,
+    og_level: str,
+    ogid: str,
+    odb_gene_ids: list[str],
+) -> dict[str, tuple[Path, dict] | Exception]:
+    """run the main pipeline for several genes that are in the same OG at
+    `og_level` (e.g. paralogs)
+
+    The output files are the same as running `orthogroup_pipeline` once for
+    each gene (with `config.og_select_params.OG_level_name` set to
+    `og_level`), but the work that is shared by the genes is only done once:
+    the members of the OG, their species and sequences are looked up once and
+    the sequences with non amino acid characters are filtered once. The word
+    frequencies used by the alfpy google distance and the MSAs of the "msa"
+    LDO selection method are shared by the genes (see `og_group.py`). The
+    length filter, LDO selection, clustering and alignment are then run for
+    each gene.
+
+    The "stage_metrics" in the info json of each gene include the metrics of
+    the shared stages (which ran once for all of the genes).
+
+    Parameters
+    ----------
+    config : conf.PipelineParams
+        pipeline parameters in a PipelineParams object.
+        `config.og_select_params.OG_level_name` is set to `og_level`
+    og_level : str
+        the level name of the OG
+    ogid : str
+        the OG of the genes at `og_level` (see `og_selection.species_og_level_table`)
+    odb_gene_ids : list[str]
+        orthoDB gene ids of the query proteins. They must be members of `ogid`
+
+    Returns
+    -------
+    dict[str, tuple[Path, dict] | Exception]
+        for each gene, the output of `orthogroup_pipeline` (the path of the
+        output file and the pipeline results), or the ValueError (critical
+        error) or FileExistsError (the output already exists) that
+        `orthogroup_pipeline` would have raised for that gene
+    """
+    odb_gene_ids = list(dict.fromkeys(odb_gene_ids))
+    config.og_select_params.OG_level_name = og_level
+    outputs = {}
+    for odb_gene_id in odb_gene_ids:
+        og_info_json_file = (
+            Path(config.main_output_folder)
+            / "info_jsons"
+            / f"{_output_file_prefix(odb_gene_id, og_level, ogid)}_info.json"
+        )
+        if og_info_json_file.exists() and not config.overwrite:
+            outputs[odb_gene_id] = FileExistsError(
+                f"info json file already exists: {og_info_json_file}"
+            )
+    queries = [i for i in odb_gene_ids if i not in outputs]
+    if not queries:
+        return outputs
+
+    # metrics of the stages that are shared by all of the genes
+    shared_metrics = stage_metrics.StageMetrics()
+    with shared_metrics.measure("member_listing"):
+        group_members = query_cache.ogid_2_odb_gene_id_list(ogid)
+        species_id_dict = query_cache.odb_gene_id_list_2_species_id_dict(group_members)
+    with shared_metrics.measure("sequence_fetch"):
+        fetched_sequences = env.get_orthoDB_database().get_sequence_records(
+            group_members
+        )
+        sequence_dict = {i: fetched_sequences[i] for i in group_members}
+    with shared_metrics.measure("filtering"):
+        aa_sequence_dict = filters.filter_seqs_with_nonaa_chars(sequence_dict)
+    group = og_group.OGGroup(sequence_dict, species_id_dict)
+
+    for odb_gene_id in queries:
+        metrics = shared_metrics.copy()
+        with metrics.measure("og_selection"):
+            query_uniprot_id = query_cache.odb_gene_id_2_uniprotid(odb_gene_id)
+        query_seqrecord = sequence_dict[odb_gene_id]
+        with metrics.measure("filtering"):
+            filtered_sequence_dict = filters.filter_shorter_sequences(
+                aa_sequence_dict,
+                min_length=config.filter_params.min_fraction_shorter_than_query
+                * len(query_seqrecord),
+            )
+            if odb_gene_id not in filtered_sequence_dict:
+                filtered_sequence_dict[odb_gene_id] = query_seqrecord
+        output_dict = _og_stages(
+            config,
+            odb_gene_id,
+            ogid,
+            og_level,
+            sequence_dict,
+            filtered_sequence_dict,
+            species_id_dict,
+            metrics=metrics,
+            group=group,
+        )
+        output_dict["query_uniprot_id"] = query_uniprot_id
+        try:
+            outputs[odb_gene_id] = _save_outputs(
+                config, output_dict, None, odb_gene_id, metrics
+            )
+        except (ValueError, FileExistsError) as err:
+            outputs[odb_gene_id] = err
+    return {i: outputs[i] for i in odb_gene_ids}
@@ -1,5 +1,5 @@
 import orthodb_tools.env_variables.env_variables as env
-import orthodb_tools.sql_queries as sql_queries
+import orthodb_tools.query_cache as query_cache
 
 
 def uniprotid_2_odb_gene_id(
@@ -34,11 +34,11 @@ def uniprotid_2_odb_gene_id(
             f"duplicate_action must be 'first' or 'longest', not {duplicate_action}"
         )
     # search the gene refs table
-    odb_gene_ids = sql_queries.uniprotid_2_odb_gene_id_refs(uniprotid)
+    odb_gene_ids = query_cache.uniprotid_2_odb_gene_id_refs(uniprotid)
     if len(odb_gene_ids) == 0:
         print(f"{uniprotid} not found in gene key table, searching in xref table")
         # search the gene xref table
-        odb_gene_ids = sql_queries.uniprotid_2_odb_gene_id_xrefs(uniprotid)
+        odb_gene_ids = query_cache.uniprotid_2_odb_gene_id_xrefs(uniprotid)
     if len(odb_gene_ids) == 0:
         print("not found in xref key table")
         raise ValueError(
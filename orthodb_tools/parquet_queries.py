@@ -0,0 +1,457 @@
+"""
+lookups on the Parquet exports of the orthoDB tables (see `tools/parquet_tools.py`)
+
+The lookup functions have the same names, arguments and return values as the
+ones in `sql_queries`, so they can be used in place of the sqlite databases.
+The filters are pushed down to the datasets: a lookup by gene id or species
+only reads the `species_bucket` partition of the species, an OG lookup only
+reads the `level_NCBI_tax_id` partition of the OG, and the row group
+statistics of the sorted files are used to skip the row groups that can't
+match.
+
+The whole-table functions at the bottom (`og_sizes`, `og_size_distribution`,
+`species_df`, `levels_df`) return pandas DataFrames, for analyses that would
+otherwise take a sqlite query per OG or per gene.
+
+Requires pyarrow. Build the datasets with `odb_groups-export_parquet`.
+"""
+
+from pathlib import Path
+
+import pandas as pd
+
+import orthodb_tools.tools.parquet_tools as parquet_tools
+from orthodb_tools.env_variables import env_variables as env
+
+# (parquet_tools raises an ImportError with install instructions if pyarrow is missing)
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+
+_DATASETS: dict[tuple[str, str], ds.Dataset] = {}
+
+
+def _dataset(table_name: str, db_path: str | Path) -> ds.Dataset:
+    """the dataset of a table, opened once per process"""
+    key = (table_name, str(db_path))
+    if key not in _DATASETS:
+        _DATASETS[key] = parquet_tools.open_dataset(table_name, db_path)
+    return _DATASETS[key]
+
+
+def read_table(
+    table_name: str,
+    db_path: str | Path,
+    filter: ds.Expression | None = None,
+    columns: list[str] | None = None,
+) -> pa.Table:
+    """return the rows of a table that match `filter`
+
+    Parameters
+    ----------
+    table_name : str
+        one of the keys of `parquet_tools.PARQUET_TABLES`
+    db_path : str | Path
+        the dataset directory
+    filter : ds.Expression | None, optional
+        a `pyarrow.dataset` filter, e.g. `ds.field("OG_id") == "1567973at7742"`,
+        by default None (all rows)
+    columns : list[str] | None, optional
+        columns to read, by default all of them
+    """
+    return _dataset(table_name, db_path).to_table(filter=filter, columns=columns)
+
+
+def _species_id(odb_gene_id: str) -> str:
+    return odb_gene_id.partition(":")[0]
+
+
+def _gene_filter(odb_gene_id_list: list[str]) -> ds.Expression:
+    """filter for the rows of the genes in `odb_gene_id_list`, which only
+    reads the partitions of their species"""
+    buckets = {parquet_tools.species_bucket(_species_id(i)) for i in odb_gene_id_list}
+    return ds.field("species_bucket").isin(list(buckets)) & ds.field(
+        "odb_gene_id"
+    ).isin(list(odb_gene_id_list))
+
+
+def _species_filter(species_id: str) -> ds.Expression:
+    """filter for the rows of all of the genes of a species, by odb_gene_id"""
+    # ";" is the character after ":"
+    return (
+        (ds.field("species_bucket") == parquet_tools.species_bucket(species_id))
+        & (ds.field("odb_gene_id") >= f"{species_id}:")
+        & (ds.field("odb_gene_id") < f"{species_id};")
+    )
+
+
+def _ogid_level(ogid: str) -> int | None:
+    """the level NCBI tax id in an OG id ("{number}at{level NCBI tax id}")"""
+    _, sep, level = ogid.rpartition("at")
+    if sep and level.isdigit():
+        return int(level)
+    return None
+
+
+def _ogid_filter(ogid_list: list[str]) -> ds.Expression:
+    """filter for the OGs in `ogid_list`, which only reads the partitions of
+    their levels"""
+    ogid_filter = ds.field("OG_id").isin(list(ogid_list))
+    levels = {_ogid_level(ogid) for ogid in ogid_list}
+    if None in levels:
+        return ogid_filter
+    return ds.field("level_NCBI_tax_id").isin(list(levels)) & ogid_filter
+
+
+def _in_line_order(table: pa.Table) -> pa.Table:
+    """rows in the same order as in the orthoDB file (and sqlite database)"""
+    return table.sort_by("line")
+
+
+def _og_info_tuples(table: pa.Table) -> list[tuple[str]]:
+    return [
+        (ogid, str(level), og_name)
+        for ogid, level, og_name in zip(
+            table["OG_id"].to_pylist(),
+            table["level_NCBI_tax_id"].to_pylist(),
+            table["OG_name"].to_pylist(),
+        )
+    ]
+
+
+def uniprotid_2_odb_gene_id_refs(
+    uniprotid, db_path: str | Path = env.orthoDB_files.gene_refs_parquet
+) -> list[str]:
+    """return the odb_gene_id from a uniprot ID"""
+    table = read_table(
+        "genes",
+        db_path,
+        ds.field("Uniprotid") == uniprotid,
+        ["odb_gene_id", "line"],
+    )
+    return _in_line_order(table)["odb_gene_id"].to_pylist()
+
+
+def uniprotid_2_odb_gene_id_xrefs(
+    uniprotid, db_path: str | Path = env.orthoDB_files.gene_xrefs_parquet
+) -> list[str]:
+    """return the odb_gene_id from a uniprot ID"""
+    table = read_table(
+        "gene_xrefs",
+        db_path,
+        (ds.field("DB_name") == "UniProt") & (ds.field("xref_id") == uniprotid),
+        ["odb_gene_id", "line"],
+    )
+    return _in_line_order(table)["odb_gene_id"].to_pylist()
+
+
+def odb_gene_id_2_species_id(
+    odb_gene_id, db_path: str | Path = env.orthoDB_files.gene_refs_parquet
+) -> str:
+    """return the species ID from an orthodb ID"""
+    table = read_table("genes", db_path, _gene_filter([odb_gene_id]), ["species_id"])
+    return table["species_id"].to_pylist()[0]
+
+
+def odb_gene_id_2_ogid_list(
+    odb_gene_id, db_path: str | Path = env.orthoDB_files.OG2genes_parquet
+) -> list[str]:
+    """Given a odb_gene_id, return the list of OGs it belongs to
+
+    Raises
+    ------
+    ValueError
+        if no OGs are found for the gene id
+    """
+    table = read_table("OG2genes", db_path, _gene_filter([odb_gene_id]), ["OG_id"])
+    og_ids = list(set(table["OG_id"].to_pylist()))
+    if len(og_ids) == 0:
+        raise ValueError(f"no OGs found for gene id {odb_gene_id}")
+    return og_ids
+
+
+def get_ogid_info(
+    ogid, db_path: str | Path = env.orthoDB_files.ogs_parquet
+) -> tuple[str]:
+    """return the info about the OG with the given ogid
+
+    Returns
+    -------
+    tuple[str]
+        returns a tuple composed of (ogid, level NCBI tax id, and OG name)
+    """
+    table = read_table("OGs", db_path, _ogid_filter([ogid]))
+    return _og_info_tuples(table)[0]
+
+
+def odb_gene_id_2_og_info_list(
+    odb_gene_id,
+    og2genes_db_path: str | Path = env.orthoDB_files.OG2genes_parquet,
+    ogs_db_path: str | Path = env.orthoDB_files.ogs_parquet,
+) -> list[tuple[str]]:
+    """return the info about every OG that a odb_gene_id belongs to
+
+    Returns
+    -------
+    list[tuple[str]]
+        list of (ogid, level NCBI tax id, OG name) tuples, the same as `get_ogid_info`
+
+    Raises
+    ------
+    ValueError
+        if no OGs are found for the gene id
+    """
+    ogids = odb_gene_id_2_ogid_list(odb_gene_id, og2genes_db_path)
+    return list(ogid_list_2_ogid_info_dict(ogids, ogs_db_path).values())
+
+
+def species_id_2_og_info_list(
+    species_id: str,
+    og2genes_db_path: str | Path = env.orthoDB_files.OG2genes_parquet,
+    ogs_db_path: str | Path = env.orthoDB_files.ogs_parquet,
+) -> list[tuple[str]]:
+    """return the OG membership of every gene in a species
+
+    Returns
+    -------
+    list[tuple[str]]
+        list of (odb_gene_id, ogid, level NCBI tax id) tuples
+    """
+    members = read_table(
+        "OG2genes",
+        og2genes_db_path,
+        _species_filter(species_id),
+        ["odb_gene_id", "OG_id"],
+    )
+    ogids = pc.unique(members["OG_id"]).to_pylist()
+    if len(ogids) == 0:
+        return []
+    ogs = read_table(
+        "OGs", ogs_db_path, _ogid_filter(ogids), ["OG_id", "level_NCBI_tax_id"]
+    )
+    members = members.join(ogs, "OG_id")
+    # DISTINCT
+    members = members.group_by(["odb_gene_id", "OG_id", "level_NCBI_tax_id"]).aggregate(
+        []
+    )
+    return [
+        (odb_gene_id, ogid, str(level))
+        for odb_gene_id, ogid, level in zip(
+            members["odb_gene_id"].to_pylist(),
+            members["OG_id"].to_pylist(),
+            members["level_NCBI_tax_id"].to_pylist(),
+        )
+    ]
+
+
+def odb_gene_id_2_uniprotid(
+    odb_gene_id, db_path: str | Path = env.orthoDB_files.gene_refs_parquet
+) -> str:
+    """return the uniprot ID from an orthodb ID ("" if there isn't one)"""
+    table = read_table("genes", db_path, _gene_filter([odb_gene_id]), ["Uniprotid"])
+    if table.num_rows == 0:
+        return ""
+    return table["Uniprotid"].to_pylist()[0]
+
+
+def ogid_2_odb_gene_id_list(
+    ogid, db_path: str | Path = env.orthoDB_files.OG2genes_parquet
+) -> list[str]:
+    """return the members of an OG, in the same order as the sqlite database"""
+    table = read_table(
+        "OG2genes", db_path, ds.field("OG_id") == ogid, ["odb_gene_id", "line"]
+    )
+    return _in_line_order(table)["odb_gene_id"].to_pylist()
+
+
+def get_all_odb_gene_ids_from_species_id(
+    species_id: str, db_path: str | Path = env.orthoDB_files.gene_refs_parquet
+) -> list[str]:
+    table = read_table(
+        "genes",
+        db_path,
+        (ds.field("species_bucket") == parquet_tools.species_bucket(species_id))
+        & (ds.field("species_id") == species_id),
+        ["odb_gene_id"],
+    )
+    return list(set(table["odb_gene_id"].to_pylist()))
+
+
+# ==============================================================================
+# // batched lookups
+# ==============================================================================
+
+
+def odb_gene_id_list_2_species_id_dict(
+    odb_gene_id_list: list[str],
+    db_path: str | Path = env.orthoDB_files.gene_refs_parquet,
+) -> dict[str, str]:
+    """return a dictionary mapping each odb_gene_id in `odb_gene_id_list` to its species ID
+
+    gene ids that are not found in the database are left out of the dictionary
+    """
+    if len(odb_gene_id_list) == 0:
+        return {}
+    table = read_table(
+        "genes", db_path, _gene_filter(odb_gene_id_list), ["odb_gene_id", "species_id"]
+    )
+    return dict(zip(table["odb_gene_id"].to_pylist(), table["species_id"].to_pylist()))
+
+
+def ogid_list_2_ogid_info_dict(
+    ogid_list: list[str], db_path: str | Path = env.orthoDB_files.ogs_parquet
+) -> dict[str, tuple[str]]:
+    """return a dictionary mapping each ogid in `ogid_list` to the same info as `get_ogid_info`:
+    a tuple composed of (ogid, level NCBI tax id, and OG name)
+
+    ogids that are not found in the database are left out of the dictionary
+    """
+    if len(ogid_list) == 0:
+        return {}
+    table = read_table("OGs", db_path, _ogid_filter(ogid_list))
+    return {og_info[0]: og_info for og_info in _og_info_tuples(table)}
+
+
+def odb_gene_id_list_2_uniprotid_dict(
+    odb_gene_id_list: list[str],
+    db_path: str | Path = env.orthoDB_files.gene_refs_parquet,
+) -> dict[str, str]:
+    """return a dictionary mapping each odb_gene_id in `odb_gene_id_list` to its uniprot ID
+
+    like `odb_gene_id_2_uniprotid`, gene ids without a uniprot ID are mapped to ""
+    """
+    uniprot_id_dict = {odb_gene_id: "" for odb_gene_id in odb_gene_id_list}
+    if len(odb_gene_id_list) == 0:
+        return uniprot_id_dict
+    table = read_table(
+        "genes", db_path, _gene_filter(odb_gene_id_list), ["odb_gene_id", "Uniprotid"]
+    )
+    uniprot_id_dict.update(
+        zip(table["odb_gene_id"].to_pylist(), table["Uniprotid"].to_pylist())
+    )
+    return uniprot_id_dict
+
+
+# ==============================================================================
+# // whole-table analyses
+# ==============================================================================
+
+
+def og_sizes(
+    level_NCBI_tax_id: int | str | None = None,
+    og2genes_db_path: str | Path = env.orthoDB_files.OG2genes_parquet,
+    ogs_db_path: str | Path = env.orthoDB_files.ogs_parquet,
+) -> pd.DataFrame:
+    """return the number of genes and species in every OG
+
+    Parameters
+    ----------
+    level_NCBI_tax_id : int | str | None, optional
+        only return the OGs built at this level, by default all of the OGs
+
+    Returns
+    -------
+    pd.DataFrame
+        columns: OG_id, level_NCBI_tax_id, OG_name, n_genes, n_species
+    """
+    if level_NCBI_tax_id is None:
+        ogs = read_table("OGs", ogs_db_path)
+        member_filter = None
+    else:
+        ogs = read_table(
+            "OGs", ogs_db_path, ds.field("level_NCBI_tax_id") == int(level_NCBI_tax_id)
+        )
+        member_filter = ds.field("OG_id").isin(ogs["OG_id"])
+    members = read_table(
+        "OG2genes", og2genes_db_path, member_filter, ["OG_id", "odb_gene_id"]
+    )
+    members = members.append_column(
+        "species_id", parquet_tools.gene_id_species(members["odb_gene_id"])
+    )
+    sizes = members.group_by("OG_id").aggregate(
+        [("odb_gene_id", "count_distinct"), ("species_id", "count_distinct")]
+    )
+    sizes = sizes.rename_columns(["OG_id", "n_genes", "n_species"])
+    sizes = ogs.join(sizes, "OG_id", join_type="left outer").to_pandas()
+    # OGs without any members in OG2genes
+    sizes[["n_genes", "n_species"]] = (
+        sizes[["n_genes", "n_species"]].fillna(0).astype(int)
+    )
+    # (the sample data has duplicated OG rows)
+    sizes = sizes.drop_duplicates("OG_id")
+    return sizes.sort_values("OG_id", ignore_index=True)
+
+
+def og_size_distribution(
+    level_NCBI_tax_id: int | str | None = None,
+    og2genes_db_path: str | Path = env.orthoDB_files.OG2genes_parquet,
+    ogs_db_path: str | Path = env.orthoDB_files.ogs_parquet,
+    levels_db_path: str | Path = env.orthoDB_files.levels_parquet,
+) -> pd.DataFrame:
+    """return summary statistics of the OG sizes (number of genes) at each level
+
+    Parameters
+    ----------
+    level_NCBI_tax_id : int | str | None, optional
+        only summarize this level, by default all of the levels
+
+    Returns
+    -------
+    pd.DataFrame
+        one row per level: level_NCBI_tax_id, level_name, n_OGs and the
+        mean, std, min, quartiles and max of the number of genes per OG
+    """
+    sizes = og_sizes(level_NCBI_tax_id, og2genes_db_path, ogs_db_path)
+    distribution = (
+        sizes.groupby("level_NCBI_tax_id")["n_genes"]
+        .describe()
+        .rename(columns={"count": "n_OGs"})
+        .reset_index()
+    )
+    distribution["n_OGs"] = distribution["n_OGs"].astype(int)
+    levels = read_table(
+        "levels", levels_db_path, columns=["level_NCBI_tax_id", "level_name"]
+    ).to_pandas()
+    distribution = distribution.merge(levels, on="level_NCBI_tax_id", how="left")
+    columns = ["level_NCBI_tax_id", "level_name", "n_OGs"]
+    return distribution[columns + [c for c in distribution.columns if c not in columns]]
+
+
+def _nullable_ints(arrow_type: pa.DataType):
+    # keep the integer columns with missing values as integers
+    if pa.types.is_integer(arrow_type):
+        return pd.Int64Dtype()
+    return None
+
+
+def species_df(
+    db_path: str | Path = env.orthoDB_files.species_parquet,
+) -> pd.DataFrame:
+    """the species table, with the same columns as `env.load_data_species_df`.
+    Unlike `pd.read_csv`, empty text fields are "" rather than NaN"""
+    df = read_table("species", db_path).to_pandas(types_mapper=_nullable_ints)
+    df.columns = [
+        "NCBI id",
+        "species ID",
+        "species name",
+        "assembly ID",
+        "n clustered genes",
+        "n OGs",
+        "mapping type",
+    ]
+    return df
+
+
+def levels_df(db_path: str | Path = env.orthoDB_files.levels_parquet) -> pd.DataFrame:
+    """the levels table, with the same columns as `env.load_data_levels_df`.
+    Missing counts (`\\N` in the orthoDB file) are null rather than the string "\\N"
+    """
+    df = read_table("levels", db_path).to_pandas(types_mapper=_nullable_ints)
+    df.columns = [
+        "level NCBI tax id",
+        "level name",
+        "total non-redundant count of genes in all underneath clustered species",
+        "total count of OGs built on it",
+        "total non-redundant count of species underneath",
+    ]
+    return df
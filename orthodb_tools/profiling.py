@@ -0,0 +1,99 @@
+"""
+opt-in cProfile profiles of pipeline jobs (the `--profile` option of the
+pipeline scripts)
+
+Each job (one gene, at all of its levels) is profiled on its own with
+`profile_job`, inside the worker process that runs it, and the profile is
+saved to `<main_output_folder>/profiles/<job>.prof`. At the end of a run,
+`merge_profiles` adds up the profiles of all of the jobs into
+`aggregate.prof` and writes a text report sorted by cumulative time
+(`aggregate.txt`).
+
+The `.prof` files can also be opened with `pstats` or a viewer such as
+snakeviz. Only the Python code of the worker processes is profiled. The time
+spent in mafft and cd-hit shows up as time spent waiting in `subprocess.run`.
+"""
+
+import cProfile
+import io
+import pstats
+from contextlib import contextmanager
+from pathlib import Path
+
+from orthodb_tools.config import orthodb_pipeline_parameters
+
+PROFILE_FOLDER = "profiles"
+AGGREGATE_NAME = "aggregate"
+# number of functions in the text report
+REPORT_N_FUNCTIONS = 60
+
+
+def profile_folder(config: orthodb_pipeline_parameters.PipelineParams) -> Path:
+    return Path(config.main_output_folder) / PROFILE_FOLDER
+
+
+def job_profile_file(
+    config: orthodb_pipeline_parameters.PipelineParams, job_name: str
+) -> Path:
+    """the profile file of a job (e.g. a gene id)"""
+    return profile_folder(config) / f"{job_name.replace(':', '_')}.prof"
+
+
+@contextmanager
+def profile_job(profile_file: str | Path | None):
+    """profile the code in the `with` block and save the profile to
+    `profile_file`. Does nothing if `profile_file` is None"""
+    if profile_file is None:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        Path(profile_file).parent.mkdir(parents=True, exist_ok=True)
+        profiler.dump_stats(profile_file)
+
+
+def merge_profiles(
+    profile_files: list[str | Path],
+    output_folder: str | Path,
+    n_functions: int = REPORT_N_FUNCTIONS,
+) -> Path | None:
+    """add up the profiles in `profile_files` and save them to
+    `aggregate.prof` and a report sorted by cumulative time to `aggregate.txt`
+    in `output_folder`
+
+    Returns
+    -------
+    Path | None
+        the path of the text report, or None if there are no profiles
+    """
+    profile_files = [str(f) for f in profile_files if Path(f).exists()]
+    if not profile_files:
+        return None
+    output_folder = Path(output_folder)
+    output_folder.mkdir(parents=True, exist_ok=True)
+    stream = io.StringIO()
+    stats = pstats.Stats(*profile_files, stream=stream)
+    stats.dump_stats(output_folder / f"{AGGREGATE_NAME}.prof")
+    stream.write(f"{len(profile_files)} job profiles\n")
+    # don't list every job's file in the report header
+    stats.files = []
+    stats.strip_dirs().sort_stats("cumulative").print_stats(n_functions)
+    report_file = output_folder / f"{AGGREGATE_NAME}.txt"
+    report_file.write_text(stream.getvalue())
+    return report_file
+
+
+def merge_run_profiles(
+    config: orthodb_pipeline_parameters.PipelineParams, profile_files: list
+):
+    """merge the job profiles of a run into the profile folder of the main
+    output folder and print where the report is"""
+    report_file = merge_profiles(profile_files, profile_folder(config))
+    if report_file is None:
+        print("no job profiles to merge")
+    else:
+        print(f"profile of {len(profile_files)} jobs: {report_file}")
@@ -0,0 +1,321 @@
+"""
+size-bounded in-process cache in front of `sql_queries`
+
+The functions in this module have the same names and signatures as the ones in
+`sql_queries` and return the same results, but repeated lookups of the same
+key are served from a per-process LRU cache instead of the database. This is
+useful when the same species ids, OG info and OG members are looked up over and
+over (e.g. when running the pipeline for several levels or for many genes in
+one worker process).
+
+Each lookup type has its own cache, bounded both by number of entries and by an
+approximate memory footprint. The limits are read from the `.env` file
+(`METADATA_CACHE_MAX_ENTRIES`, `METADATA_CACHE_MAX_MB`) and can be changed at
+runtime with `configure`. Use `cache_stats` to get the hit/miss counters.
+
+The caches are safe to use in `multiprocessing.Pool` workers. A forked worker
+keeps the entries cached by the parent (the database is read-only so they are
+still valid) but starts with its own counters.
+"""
+
+import os
+import sys
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from orthodb_tools import sql_queries
+from orthodb_tools.env_variables import env_variables as env
+
+_MISSING = object()
+
+
+def _sizeof(obj) -> int:
+    """approximate memory footprint of a cache key or value in bytes"""
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (tuple, list)):
+        size += sum(_sizeof(i) for i in obj)
+    elif isinstance(obj, dict):
+        size += sum(_sizeof(k) + _sizeof(v) for k, v in obj.items())
+    return size
+
+
+class LRUCache:
+    """least recently used cache bounded by number of entries and approximate size
+
+    Parameters
+    ----------
+    max_entries : int
+        maximum number of entries. 0 disables the cache
+    max_bytes : int
+        maximum approximate size of the keys and values in bytes
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.n_bytes = 0
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=_MISSING):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key][0]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        size = _sizeof(key) + _sizeof(value)
+        if self.max_entries <= 0 or size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._data:
+                self.n_bytes -= self._data.pop(key)[1]
+            self._data[key] = (value, size)
+            self.n_bytes += size
+            self._evict()
+
+    def _evict(self):
+        while self._data and (
+            len(self._data) > self.max_entries or self.n_bytes > self.max_bytes
+        ):
+            _, (_, evicted_size) = self._data.popitem(last=False)
+            self.n_bytes -= evicted_size
+            self.evictions += 1
+
+    def resize(self, max_entries: int, max_bytes: int):
+        """change the size limits, evicting entries as needed"""
+        with self._lock:
+            self.max_entries = max_entries
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.n_bytes = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": len(self._data),
+            "bytes": self.n_bytes,
+        }
+
+    def _after_fork(self):
+        # the lock could have been held by another thread when the process forked
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def __len__(self):
+        return len(self._data)
+
+
+_CACHES = {
+    name: LRUCache(
+        env.METADATA_CACHE_MAX_ENTRIES, env.METADATA_CACHE_MAX_MB * 1024 * 1024
+    )
+    for name in [
+        "species_id",
+        "ogid_info",
+        "og_members",
+        "gene_og_info",
+        "uniprotid",
+        "uniprotid_2_odb_gene_ids",
+    ]
+}
+
+
+def _after_fork_in_child():
+    for cache in _CACHES.values():
+        cache._after_fork()
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def configure(max_entries: int | None = None, max_mb: float | None = None):
+    """change the size limits of all of the caches. Entries are evicted as needed"""
+    for cache in _CACHES.values():
+        cache.resize(
+            cache.max_entries if max_entries is None else max_entries,
+            cache.max_bytes if max_mb is None else int(max_mb * 1024 * 1024),
+        )
+
+
+def cache_stats() -> dict[str, dict]:
+    """return the hit/miss counters and size of each cache"""
+    return {name: cache.stats() for name, cache in _CACHES.items()}
+
+
+def clear_caches():
+    for cache in _CACHES.values():
+        cache.clear()
+        cache.reset_stats()
+
+
+def _cached_lookup(cache_name: str, key, db_path, lookup_function):
+    cache = _CACHES[cache_name]
+    cache_key = (str(db_path), key)
+    value = cache.get(cache_key)
+    if value is _MISSING:
+        value = lookup_function(key, db_path)
+        if isinstance(value, list):
+            value = tuple(value)
+        cache.put(cache_key, value)
+    return value
+
+
+def _cached_batch_lookup(
+    cache_name: str, keys: list, db_path, batch_lookup_function
+) -> dict:
+    cache = _CACHES[cache_name]
+    results = {}
+    missing_keys = []
+    for key in dict.fromkeys(keys):
+        value = cache.get((str(db_path), key))
+        if value is _MISSING:
+            missing_keys.append(key)
+        else:
+            results[key] = value
+    if missing_keys:
+        new_results = batch_lookup_function(missing_keys, db_path)
+        for key, value in new_results.items():
+            cache.put((str(db_path), key), value)
+        results.update(new_results)
+    return results
+
+
+# ==============================================================================
+# // cached versions of the sql_queries functions
+# ==============================================================================
+
+
+def odb_gene_id_2_species_id(
+    odb_gene_id, db_path: str | Path = env.orthoDB_files.gene_refs_sqlite
+) -> str:
+    """cached version of `sql_queries.odb_gene_id_2_species_id`"""
+    return _cached_lookup(
+        "species_id", odb_gene_id, db_path, sql_queries.odb_gene_id_2_species_id
+    )
+
+
+def odb_gene_id_list_2_species_id_dict(
+    odb_gene_id_list: list[str],
+    db_path: str | Path = env.orthoDB_files.gene_refs_sqlite,
+) -> dict[str, str]:
+    """cached version of `sql_queries.odb_gene_id_list_2_species_id_dict`"""
+    return _cached_batch_lookup(
+        "species_id",
+        odb_gene_id_list,
+        db_path,
+        sql_queries.odb_gene_id_list_2_species_id_dict,
+    )
+
+
+def get_ogid_info(ogid, db_path: str | Path = env.orthoDB_files.ogs_sqlite) -> tuple:
+    """cached version of `sql_queries.get_ogid_info`"""
+    return _cached_lookup("ogid_info", ogid, db_path, sql_queries.get_ogid_info)
+
+
+def ogid_list_2_ogid_info_dict(
+    ogid_list: list[str], db_path: str | Path = env.orthoDB_files.ogs_sqlite
+) -> dict[str, tuple[str]]:
+    """cached version of `sql_queries.ogid_list_2_ogid_info_dict`"""
+    return _cached_batch_lookup(
+        "ogid_info", ogid_list, db_path, sql_queries.ogid_list_2_ogid_info_dict
+    )
+
+
+def ogid_2_odb_gene_id_list(
+    ogid, db_path: str | Path = env.orthoDB_files.OG2genes_sqlite
+) -> list[str]:
+    """cached version of `sql_queries.ogid_2_odb_gene_id_list`"""
+    return list(
+        _cached_lookup("og_members", ogid, db_path, sql_queries.ogid_2_odb_gene_id_list)
+    )
+
+
+def odb_gene_id_2_og_info_list(
+    odb_gene_id,
+    og2genes_db_path: str | Path = env.orthoDB_files.OG2genes_sqlite,
+    ogs_db_path: str | Path = env.orthoDB_files.ogs_sqlite,
+) -> list[tuple[str]]:
+    """cached version of `sql_queries.odb_gene_id_2_og_info_list`"""
+    return list(
+        _cached_lookup(
+            "gene_og_info",
+            odb_gene_id,
+            (str(og2genes_db_path), str(ogs_db_path)),
+            lambda key, db_paths: sql_queries.odb_gene_id_2_og_info_list(
+                key, *db_paths
+            ),
+        )
+    )
+
+
+def odb_gene_id_2_uniprotid(
+    odb_gene_id, db_path: str | Path = env.orthoDB_files.gene_refs_sqlite
+) -> str:
+    """cached version of `sql_queries.odb_gene_id_2_uniprotid`"""
+    return _cached_lookup(
+        "uniprotid", odb_gene_id, db_path, sql_queries.odb_gene_id_2_uniprotid
+    )
+
+
+def odb_gene_id_list_2_uniprotid_dict(
+    odb_gene_id_list: list[str],
+    db_path: str | Path = env.orthoDB_files.gene_refs_sqlite,
+) -> dict[str, str]:
+    """cached version of `sql_queries.odb_gene_id_list_2_uniprotid_dict`"""
+    return _cached_batch_lookup(
+        "uniprotid",
+        odb_gene_id_list,
+        db_path,
+        sql_queries.odb_gene_id_list_2_uniprotid_dict,
+    )
+
+
+def uniprotid_2_odb_gene_id_refs(
+    uniprotid, db_path: str | Path = env.orthoDB_files.gene_refs_sqlite
+) -> list[str]:
+    """cached version of `sql_queries.uniprotid_2_odb_gene_id_refs`"""
+    return list(
+        _cached_lookup(
+            "uniprotid_2_odb_gene_ids",
+            ("refs", uniprotid),
+            db_path,
+            lambda key, db_path: sql_queries.uniprotid_2_odb_gene_id_refs(
+                key[1], db_path
+            ),
+        )
+    )
+
+
+def uniprotid_2_odb_gene_id_xrefs(
+    uniprotid, db_path: str | Path = env.orthoDB_files.gene_xrefs_sqlite
+) -> list[str]:
+    """cached version of `sql_queries.uniprotid_2_odb_gene_id_xrefs`"""
+    return list(
+        _cached_lookup(
+            "uniprotid_2_odb_gene_ids",
+            ("xrefs", uniprotid),
+            db_path,
+            lambda key, db_path: sql_queries.uniprotid_2_odb_gene_id_xrefs(
+                key[1], db_path
+            ),
+        )
+    )
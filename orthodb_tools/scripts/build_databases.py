@@ -0,0 +1,560 @@
+#!/usr/bin/env python
+
+"""
+build the SQLite databases/indexes for the orthoDB files that the pipeline uses
+
+Each table is written to its own database file, so they are independent and
+are built in parallel, one process per table.
+
+Each database records a fingerprint of its source file (size, modification
+time and sha256 checksum) and the schema it was built with. Databases whose
+source file and schema haven't changed are skipped. The others are built into
+a temporary file which then replaces the old database in one step, so an
+interrupted build never leaves a partial database behind.
+"""
+
+import argparse
+import functools
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import time
+from pathlib import Path
+
+from Bio import SeqIO
+
+import orthodb_tools.env_variables.env_variables as env
+import orthodb_tools.tools.sqlite3_db_tools as sqltools
+import orthodb_tools.compressed_sequence_store as compressed_sequence_store
+import orthodb_tools.fasta_offset_index as fasta_offset_index
+import orthodb_tools.og_membership_index as og_membership_index
+from orthodb_tools.tools.general_utils import file_fingerprint
+
+# table name -> how to build it from the orthoDB files
+# `tsv`/`db` are attribute names of `env.OrthoDBFiles`
+TABLE_SPECS = {
+    "genes": {
+        "tsv": "gene_refs_tsv",
+        "db": "gene_refs_sqlite",
+        "table_name": "gene_refs",
+        "column_names": [
+            "odb_gene_id",
+            "species_id",
+            "source_id",
+            "synonyms",
+            "Uniprotid",
+            "Ensemble",
+            "NCBI_id",
+            "description",
+        ],
+        "index_column_name": ["odb_gene_id", "Uniprotid"],
+    },
+    "gene_xrefs": {
+        "tsv": "gene_xrefs_tsv",
+        "db": "gene_xrefs_sqlite",
+        "table_name": "gene_xrefs",
+        "column_names": ["odb_gene_id", "xref_id", "DB_name"],
+        "index_column_name": ["odb_gene_id", "xref_id", "DB_name"],
+    },
+    "OGs": {
+        "tsv": "ogs_tsv",
+        "db": "ogs_sqlite",
+        "table_name": "OGs",
+        "column_names": ["OG_id", "level_NCBI_tax_id", "OG_name"],
+        "index_column_name": "OG_id",
+    },
+    "OG2genes": {
+        "tsv": "OG2genes_tsv",
+        "db": "OG2genes_sqlite",
+        "table_name": "OG2genes",
+        "column_names": ["OG_id", "odb_gene_id"],
+        "index_column_name": ["OG_id", "odb_gene_id"],
+    },
+    # the OG <-> gene membership as memory-mapped CSR arrays (a directory, see
+    # `og_membership_index.py`). `sql_queries` uses it when it exists
+    "OG2genes_csr": {
+        "tsv": "OG2genes_tsv",
+        "db": "OG2genes_csr",
+    },
+    # not a table, this is the Biopython `SeqIO.index_db` index of the sequences
+    "fasta": {
+        "tsv": "all_seqs_fasta",
+        "db": "all_seqs_sqlite",
+    },
+    # the memory-mapped offset index of the sequences (a directory, see `fasta_offset_index.py`)
+    "fasta_offset_index": {
+        "tsv": "all_seqs_fasta",
+        "db": "all_seqs_offset_index",
+    },
+    # the block-compressed copy of the sequences (a directory, see `compressed_sequence_store.py`)
+    "fasta_compressed": {
+        "tsv": "all_seqs_fasta",
+        "db": "all_seqs_compressed",
+    },
+    # Parquet datasets (directories, see `tools/parquet_tools.py`). Not used by
+    # the pipeline, so they are not built by default. Requires pyarrow
+    "parquet_genes": {
+        "tsv": "gene_refs_tsv",
+        "db": "gene_refs_parquet",
+        "parquet_table": "genes",
+    },
+    "parquet_gene_xrefs": {
+        "tsv": "gene_xrefs_tsv",
+        "db": "gene_xrefs_parquet",
+        "parquet_table": "gene_xrefs",
+    },
+    "parquet_OGs": {
+        "tsv": "ogs_tsv",
+        "db": "ogs_parquet",
+        "parquet_table": "OGs",
+    },
+    "parquet_OG2genes": {
+        "tsv": "OG2genes_tsv",
+        "db": "OG2genes_parquet",
+        "parquet_table": "OG2genes",
+    },
+    "parquet_levels": {
+        "tsv": "levels_tsv",
+        "db": "levels_parquet",
+        "parquet_table": "levels",
+    },
+    "parquet_level2species": {
+        "tsv": "levels2species_tsv",
+        "db": "levels2species_parquet",
+        "parquet_table": "level2species",
+    },
+    "parquet_species": {
+        "tsv": "species_tsv",
+        "db": "species_parquet",
+        "parquet_table": "species",
+    },
+}
+PARQUET_TABLES = [name for name, spec in TABLE_SPECS.items() if "parquet_table" in spec]
+# sequence store selected in the .env file -> the table it needs
+SEQUENCE_STORE_TABLES = {
+    "sqlite": "fasta",
+    "offset_index": "fasta_offset_index",
+    "compressed": "fasta_compressed",
+}
+
+
+def default_tables() -> list[str]:
+    """the tables built by default: the sqlite tables, the OG membership index
+    and the sequence store selected in the .env file (`SEQUENCE_STORE`)"""
+    tables = ["genes", "gene_xrefs", "OGs", "OG2genes", "OG2genes_csr", "fasta"]
+    store_table = SEQUENCE_STORE_TABLES.get(env.SEQUENCE_STORE, "fasta")
+    if store_table not in tables:
+        tables.append(store_table)
+    return tables
+
+
+def _schema(name: str, compact: bool) -> tuple[str, int]:
+    """the (schema name, schema version) of a table"""
+    if name == "fasta":
+        return "seqio_index", sqltools.SCHEMA_VERSION
+    if name == "fasta_offset_index":
+        return "offset_index", fasta_offset_index.FORMAT_VERSION
+    if name == "OG2genes_csr":
+        return "og_membership_csr", og_membership_index.FORMAT_VERSION
+    if name == "fasta_compressed":
+        # changing the codec or block size in the .env file triggers a rebuild
+        return (
+            f"compressed-{env.COMPRESSED_STORE_CODEC}-{env.COMPRESSED_STORE_BLOCK_KB}k",
+            compressed_sequence_store.FORMAT_VERSION,
+        )
+    if name in PARQUET_TABLES:
+        import orthodb_tools.tools.parquet_tools as parquet_tools
+
+        return "parquet", parquet_tools.FORMAT_VERSION
+    if compact:
+        return sqltools.COMPACT_SCHEMA, sqltools.SCHEMA_VERSION
+    return "text", sqltools.SCHEMA_VERSION
+
+
+def _read_build_info(db_file_name: str | Path) -> dict[str, str]:
+    """return the build info recorded in an existing database ({} if there is none)"""
+    if not Path(db_file_name).exists():
+        return {}
+    if Path(db_file_name).is_dir():
+        return fasta_offset_index.read_build_info(db_file_name)
+    connection = sqlite3.connect(
+        f"{Path(db_file_name).resolve().as_uri()}?mode=ro", uri=True
+    )
+    try:
+        return sqltools.read_schema_info(connection)
+    except sqlite3.DatabaseError:
+        return {}
+    finally:
+        connection.close()
+
+
+def check_database(
+    name: str,
+    database_files: env.OrthoDBFiles = env.orthoDB_files,
+    compact: bool = False,
+) -> str | None:
+    """check whether the database for one of the tables in `TABLE_SPECS` is up to date
+
+    The source file is only read (to compare checksums) if its size is the
+    same as when the database was built but its modification time is not. If
+    the checksum is the same, the new modification time is recorded in the
+    build info, so that the file isn't read again on the next check.
+
+    Returns
+    -------
+    str | None
+        the reason the database has to be rebuilt, or None if it is up to date
+    """
+    spec = TABLE_SPECS[name]
+    db_file_name = getattr(database_files, spec["db"])
+    if not Path(db_file_name).exists():
+        return "no database"
+    build_info = _read_build_info(db_file_name)
+    if "source_sha256" not in build_info:
+        return "no build info"
+    schema, schema_version = _schema(name, compact)
+    if build_info.get("schema") != schema or build_info.get("schema_version") != str(
+        schema_version
+    ):
+        return "schema changed"
+    source_file_name = getattr(database_files, spec["tsv"])
+    fingerprint = file_fingerprint(source_file_name, checksum=False)
+    if str(fingerprint["size"]) != build_info["source_size"]:
+        return "source file changed"
+    if str(fingerprint["mtime_ns"]) == build_info["source_mtime_ns"]:
+        return None
+    if file_fingerprint(source_file_name)["sha256"] != build_info["source_sha256"]:
+        return "source file changed"
+    build_info["source_mtime_ns"] = fingerprint["mtime_ns"]
+    try:
+        _write_build_info(Path(db_file_name), build_info)
+    except (OSError, sqlite3.Error) as e:
+        # e.g. a read-only database. The file is hashed again next time
+        print(f"could not update the build info of {db_file_name}: {e}")
+    return None
+
+
+def build_database(
+    name: str,
+    database_files: env.OrthoDBFiles = env.orthoDB_files,
+    compact: bool = False,
+    force: bool = False,
+) -> dict:
+    """build the database for one of the tables in `TABLE_SPECS`, unless it
+    is already up to date (see `check_database`)
+
+    If `compact` is True, the table is built with the compact (integer coded)
+    schema (see `sqlite3_db_tools.create_compact_sqlitedb_from_csv`). The
+    `sql_queries` functions read either schema. The fasta index and the
+    Parquet datasets are the same either way.
+
+    Parameters
+    ----------
+    name : str
+        one of the keys of `TABLE_SPECS`
+    database_files : env.OrthoDBFiles, optional
+        the orthoDB file paths, by default env.orthoDB_files
+    compact : bool, optional
+        whether to use the compact schema, by default False
+    force : bool, optional
+        rebuild the database even if it is up to date, by default False
+
+    Returns
+    -------
+    dict
+        build statistics (name, status ("built" or "skipped"), reason, database
+        file, number of rows, build time and file size)
+    """
+    spec = TABLE_SPECS[name]
+    db_file_name = Path(getattr(database_files, spec["db"]))
+    source_file_name = getattr(database_files, spec["tsv"])
+    start_time = time.perf_counter()
+    reason = "forced" if force else check_database(name, database_files, compact)
+    if reason is None:
+        build_info = _read_build_info(db_file_name)
+        return {
+            "name": name,
+            "status": "skipped",
+            "reason": "up to date",
+            "db_file": str(db_file_name),
+            "n_rows": int(build_info.get("n_rows", 0)),
+            "build_time_s": time.perf_counter() - start_time,
+            "size_bytes": _path_size(db_file_name),
+        }
+    print(f"building {name} ({reason})")
+    # fingerprint the source before building so that changes made while the
+    # database is being built are picked up by the next build
+    fingerprint = file_fingerprint(source_file_name)
+    # build into a new file in the same directory and swap it in at the end.
+    # The old database stays usable until then. A temporary file left behind
+    # by a build that was killed is overwritten
+    tmp_file_name = db_file_name.with_name(f"{db_file_name.name}.tmp")
+    _remove_path(tmp_file_name)
+    try:
+        stats = _build_database_file(name, tmp_file_name, source_file_name, compact)
+        schema, schema_version = _schema(name, compact)
+        build_info = {
+            "schema": schema,
+            "schema_version": schema_version,
+            "source_file": Path(source_file_name).name,
+            "source_size": fingerprint["size"],
+            "source_mtime_ns": fingerprint["mtime_ns"],
+            "source_sha256": fingerprint["sha256"],
+            "n_rows": stats["n_rows"],
+        }
+        if name == "fasta_compressed":
+            build_info.update(
+                {
+                    k: stats[k]
+                    for k in [
+                        "codec",
+                        "block_size",
+                        "n_blocks",
+                        "raw_size",
+                        "compressed_size",
+                    ]
+                }
+            )
+        _write_build_info(tmp_file_name, build_info)
+        _replace_path(tmp_file_name, db_file_name)
+    finally:
+        _remove_path(tmp_file_name)
+    stats["name"] = name
+    stats["status"] = "built"
+    stats["reason"] = reason
+    stats["db_file"] = str(db_file_name)
+    stats["build_time_s"] = time.perf_counter() - start_time
+    stats["size_bytes"] = _path_size(db_file_name)
+    return stats
+
+
+def _write_build_info(db_file_name: Path, info: dict):
+    if db_file_name.is_dir():
+        fasta_offset_index.write_build_info(db_file_name, info)
+        return
+    connection = sqlite3.connect(db_file_name)
+    sqltools.write_schema_info(connection.cursor(), info)
+    connection.commit()
+    connection.close()
+
+
+def _remove_path(path: Path):
+    if path.is_dir():
+        shutil.rmtree(path)
+    else:
+        path.unlink(missing_ok=True)
+
+
+def _replace_path(src: Path, dst: Path):
+    """move `src` to `dst`, replacing `dst`. This is atomic for files. A
+    directory can't replace a non-empty directory in one step, so the old
+    directory is moved out of the way first"""
+    if dst.is_dir():
+        old = dst.with_name(f"{dst.name}.old")
+        _remove_path(old)
+        os.replace(dst, old)
+        os.replace(src, dst)
+        _remove_path(old)
+    else:
+        os.replace(src, dst)
+
+
+def _path_size(path: Path) -> int:
+    if path.is_dir():
+        return sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+    return path.stat().st_size
+
+
+def _build_database_file(
+    name: str, db_file_name: Path, source_file_name: str | Path, compact: bool
+) -> dict:
+    spec = TABLE_SPECS[name]
+    if name == "fasta":
+        records = SeqIO.index_db(str(db_file_name), source_file_name, "fasta")
+        stats = {"n_rows": len(records)}
+        records.close()
+    elif name == "fasta_offset_index":
+        stats = fasta_offset_index.build_offset_index(source_file_name, db_file_name)
+    elif name == "OG2genes_csr":
+        stats = og_membership_index.build_membership_index(
+            source_file_name, db_file_name
+        )
+    elif name == "fasta_compressed":
+        stats = compressed_sequence_store.build_compressed_store(
+            source_file_name,
+            db_file_name,
+            codec=env.COMPRESSED_STORE_CODEC,
+            block_size=env.COMPRESSED_STORE_BLOCK_KB * 1024,
+        )
+    elif name in PARQUET_TABLES:
+        # imported here so that pyarrow is only needed to build the Parquet tables
+        import orthodb_tools.tools.parquet_tools as parquet_tools
+
+        stats = parquet_tools.export_table(
+            spec["parquet_table"], source_file_name, db_file_name
+        )
+    elif compact:
+        connection = sqlite3.connect(db_file_name)
+        stats = sqltools.create_compact_sqlitedb_from_csv(
+            connection.cursor(),
+            connection,
+            csv_file_name=source_file_name,
+            table_name=spec["table_name"],
+        )
+        connection.close()
+    else:
+        connection = sqlite3.connect(db_file_name)
+        cursor = connection.cursor()
+        stats = sqltools.create_sqlitedb_from_csv(
+            cursor,
+            connection,
+            csv_file_name=source_file_name,
+            table_name=spec["table_name"],
+            column_names=spec["column_names"],
+            index_column_name=spec["index_column_name"],
+        )
+        connection.close()
+    return stats
+
+
+def _source_file_size(name: str, database_files: env.OrthoDBFiles) -> int:
+    return Path(getattr(database_files, TABLE_SPECS[name]["tsv"])).stat().st_size
+
+
+def _format_size(n_bytes: float) -> str:
+    for unit in ["B", "KB", "MB", "GB"]:
+        if n_bytes < 1024:
+            return f"{n_bytes:.1f} {unit}"
+        n_bytes /= 1024
+    return f"{n_bytes:.1f} TB"
+
+
+def print_summary(stats_list: list[dict], total_time: float):
+    print("\nbuild summary:")
+    print(
+        f"{'name':<24}{'status':<9}{'rows':>15}{'rows/s':>12}{'time (s)':>10}{'size':>12}"
+    )
+    for stats in stats_list:
+        rows_per_s = stats.get("rows_per_second")
+        rows_per_s = f"{rows_per_s:,.0f}" if rows_per_s is not None else "-"
+        print(
+            f"{stats['name']:<24}{stats['status']:<9}{stats['n_rows']:>15,}{rows_per_s:>12}"
+            f"{stats['build_time_s']:>10.1f}{_format_size(stats['size_bytes']):>12}"
+        )
+    print(f"total wall time: {total_time:.1f} s")
+
+
+class _NoPool:
+    """stands in for `multiprocessing.Pool` when there is only one process"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    @staticmethod
+    def imap_unordered(function, iterable):
+        return map(function, iterable)
+
+
+def main(
+    names: list[str] | None = None,
+    n_cores: int | None = None,
+    database_files: env.OrthoDBFiles = env.orthoDB_files,
+    compact: bool = False,
+    force: bool = False,
+) -> list[dict]:
+    """build the databases for the tables in `names` (`default_tables()` by
+    default), `n_cores` at a time. If `compact` is True, use the compact schema.
+    Databases that are up to date are skipped unless `force` is True.
+
+    With a single process, the databases are built in this process, which lets
+    the fasta offset index use all of the cores (see `fasta_offset_index.build_offset_index`)
+    """
+    if names is None:
+        names = default_tables()
+    for name in names:
+        if name not in TABLE_SPECS:
+            raise ValueError(
+                f"unknown table `{name}`. must be one of: {list(TABLE_SPECS.keys())}"
+            )
+    if n_cores is None:
+        n_cores = len(names)
+    n_cores = max(1, min(n_cores, len(names)))
+    start_time = time.perf_counter()
+    stats_list = []
+    # start the biggest tables first so that they don't end up waiting for a free process
+    build_order = sorted(
+        names, key=lambda x: _source_file_size(x, database_files), reverse=True
+    )
+    build_function = functools.partial(
+        build_database,
+        database_files=database_files,
+        compact=compact,
+        force=force,
+    )
+    with multiprocessing.Pool(n_cores) if n_cores > 1 else _NoPool() as p:
+        results = p.imap_unordered(build_function, build_order)
+        for stats in results:
+            stats_list.append(stats)
+            if stats["status"] == "skipped":
+                print(
+                    f"[{len(stats_list)}/{len(names)}] skipped {stats['name']} ({stats['reason']})"
+                )
+                continue
+            print(
+                f"[{len(stats_list)}/{len(names)}] finished {stats['name']} in "
+                f"{stats['build_time_s']:.1f} s ({_format_size(stats['size_bytes'])})"
+            )
+    stats_list = sorted(stats_list, key=lambda x: names.index(x["name"]))
+    print_summary(stats_list, time.perf_counter() - start_time)
+    return stats_list
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(
+        description=f"""build the SQLite databases for the orthoDB files in the directory set in the .env file ({env.orthodb_dir}).
+Each table is built in a separate process.
+Databases that are already up to date (same source file and schema) are skipped.""",
+        formatter_class=argparse.RawTextHelpFormatter,
+    )
+    parser.add_argument(
+        "-t",
+        "--tables",
+        nargs="*",
+        metavar="<list>",
+        default=None,
+        help=f"""tables to build. One or more of: {list(TABLE_SPECS.keys())}
+Default is all of the sqlite tables, the OG membership index and the sequence store selected with
+SEQUENCE_STORE in the .env file: {default_tables()}""",
+    )
+    parser.add_argument(
+        "-n",
+        "--n_cores",
+        type=int,
+        metavar="<int>",
+        default=None,
+        help="""number of tables to build at the same time. Default is all of them at once""",
+    )
+    parser.add_argument(
+        "--compact",
+        action="store_true",
+        help="""use the compact schema: gene ids are stored as integers, species ids and
+database names are stored once in lookup tables, and the tables are WITHOUT ROWID
+tables keyed on the columns that are queried. The database files are smaller.
+The pipeline reads databases built either way""",
+    )
+    parser.add_argument(
+        "-f",
+        "--force",
+        action="store_true",
+        help="""rebuild the databases even if their source files and schema haven't changed""",
+    )
+    args = parser.parse_args()
+    main(args.tables, n_cores=args.n_cores, compact=args.compact, force=args.force)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+
+"""
+export the orthoDB tables to partitioned Parquet datasets, for
+`orthodb_tools/parquet_queries.py` and for analyses with pandas/pyarrow (see
+`orthodb_tools/tools/parquet_tools.py` for the layout of the datasets)
+
+The datasets are built by `build_databases`, so like the sqlite databases,
+datasets whose source file hasn't changed are skipped and rebuilt datasets
+replace the old ones at the end of the export. Requires pyarrow.
+"""
+
+import argparse
+
+import orthodb_tools.env_variables.env_variables as env
+from orthodb_tools.scripts import build_databases
+
+TABLES = [
+    build_databases.TABLE_SPECS[name]["parquet_table"]
+    for name in build_databases.PARQUET_TABLES
+]
+
+
+def main(
+    tables: list[str] | None = None,
+    n_cores: int | None = None,
+    database_files: env.OrthoDBFiles = env.orthoDB_files,
+    force: bool = False,
+) -> list[dict]:
+    """export the tables in `tables` (all of them by default), `n_cores` at a
+    time. Datasets that are up to date are skipped unless `force` is True"""
+    if tables is None:
+        tables = TABLES
+    for table in tables:
+        if table not in TABLES:
+            raise ValueError(f"unknown table `{table}`. must be one of: {TABLES}")
+    return build_databases.main(
+        [f"parquet_{table}" for table in tables],
+        n_cores=n_cores,
+        database_files=database_files,
+        force=force,
+    )
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(
+        description=f"""export the orthoDB files in the directory set in the .env file ({env.orthodb_dir}) to Parquet datasets.
+Each table is exported in a separate process.
+Datasets that are already up to date are skipped.""",
+        formatter_class=argparse.RawTextHelpFormatter,
+    )
+    parser.add_argument(
+        "-t",
+        "--tables",
+        nargs="*",
+        metavar="<list>",
+        default=None,
+        help=f"""tables to export. One or more of: {TABLES}
+Default is all of them""",
+    )
+    parser.add_argument(
+        "-n",
+        "--n_cores",
+        type=int,
+        metavar="<int>",
+        default=None,
+        help="""number of tables to export at the same time. Default is all of them at once""",
+    )
+    parser.add_argument(
+        "-f",
+        "--force",
+        action="store_true",
+        help="""export the tables even if their source files haven't changed""",
+    )
+    args = parser.parse_args()
+    main(args.tables, n_cores=args.n_cores, force=args.force)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -7,6 +7,9 @@ from orthodb_tools.config import orthodb_pipeline_parameters
 
 
 import orthodb_tools.orthogroup_processing.pipeline as pipeline
+import orthodb_tools.profiling as profiling
+import orthodb_tools.stage_cache as stage_cache
+import orthodb_tools.stage_metrics as stage_metrics
 
 
 def main_cli():
@@ -54,9 +57,30 @@ def main_cli():
         default=None,
         help="""path to config file, default=None""",
     )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="""profile the run with cProfile. The profile is saved to <main_output_folder>/profiles/<gene id>.prof
+with a report sorted by cumulative time (profiles/aggregate.txt)""",
+    )
     args = parser.parse_args()
     config = pipeline.load_config(args.config)
-    pipeline.orthogroup_pipeline(config, args.uniprot_id, args.odb_gene_id)
+    profile_file = None
+    if args.profile:
+        profile_file = profiling.job_profile_file(
+            config, args.uniprot_id or args.odb_gene_id
+        )
+    with profiling.profile_job(profile_file):
+        pipeline.orthogroup_pipeline(config, args.uniprot_id, args.odb_gene_id)
+    if profile_file is not None:
+        profiling.merge_run_profiles(config, [profile_file])
+    print(
+        stage_metrics.format_summary(
+            stage_metrics.merge_totals([stage_metrics.totals()])
+        )
+    )
+    if stage_cache.get_stage_cache() is not None:
+        print(stage_cache.format_stats(stage_cache.cache_stats()))
 
 
 if __name__ == "__main__":
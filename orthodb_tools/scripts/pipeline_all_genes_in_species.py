@@ -9,9 +9,13 @@ from attrs import asdict
 
 import orthodb_tools.config.orthodb_pipeline_parameters as conf
 from orthodb_tools.config import orthodb_pipeline_parameters
-import orthodb_tools.sql_queries as sql_queries
+import orthodb_tools.shared_database as shared_database
+import orthodb_tools.profiling as profiling
+import orthodb_tools.stage_cache as stage_cache
+import orthodb_tools.stage_metrics as stage_metrics
 
 import orthodb_tools.scripts.create_filemap as create_filemap
+import orthodb_tools.orthogroup_processing.og_selection as og_selection
 import orthodb_tools.orthogroup_processing.pipeline as pipeline
 
 SPECIES_ID = "9606_0"
@@ -19,19 +23,113 @@ N_CORES = multiprocessing.cpu_count() - 2
 
 
 def multiple_levels(
-    config: conf.PipelineParams, query_odb_gene_id: str, og_levels: list
+    config: conf.PipelineParams,
+    query_odb_gene_id: str,
+    og_levels: list,
+    og_level_ogid_dict: dict | None = None,
+    profile: bool = False,
 ):
     """
-    run the pipeline for a single odb_gene_id for multiple og_levels
+    run the pipeline for a single odb_gene_id for multiple og_levels (see
+    `pipeline.multi_level_pipeline`)
+
+    `og_level_ogid_dict` can map each level to the OG id of the gene at that
+    level if it is already known (see `og_selection.species_og_level_table`)
+
+    If `profile` is True, the job is profiled (see `profiling.py`)
+
+    Returns the stage cache hit/miss counts, the stage metrics totals and the
+    profile file of the job (see `stage_cache.py` and `stage_metrics.py`)
     """
-    for og_level in og_levels:
-        config.og_select_params.OG_level_name = og_level
-        try:
-            pipeline.orthogroup_pipeline(config, odb_gene_id=query_odb_gene_id)
-        except ValueError as err:
-            traceback.print_exc()
+    stage_cache.reset_stats()
+    stage_metrics.reset_totals()
+    profile_file = None
+    if profile:
+        profile_file = profiling.job_profile_file(config, query_odb_gene_id)
+    with profiling.profile_job(profile_file):
+        level_outputs = pipeline.multi_level_pipeline(
+            config,
+            og_levels,
+            odb_gene_id=query_odb_gene_id,
+            og_level_ogid_dict=og_level_ogid_dict,
+        )
+    for og_level, output in level_outputs.items():
+        if isinstance(output, ValueError):
+            traceback.print_exception(output)
             # logger.error(f"{query_geneid} - {og_level} - {err}")
-            print(f"{query_odb_gene_id} - {og_level} - {err}")
+            print(f"{query_odb_gene_id} - {og_level} - {output}")
+        elif isinstance(output, Exception):
+            raise output
+    return {
+        "stage_cache": stage_cache.cache_stats(),
+        "stage_metrics": stage_metrics.totals(),
+        "profile_file": profile_file,
+    }
+
+
+def og_group_job(
+    config: conf.PipelineParams,
+    og_level: str,
+    ogid: str,
+    query_odb_gene_ids: list,
+    profile: bool = False,
+):
+    """
+    run the pipeline for the odb_gene_ids that are in the OG `ogid` at
+    `og_level` (see `pipeline.og_group_pipeline`)
+
+    If `profile` is True, the job is profiled (see `profiling.py`)
+
+    Returns the same as `multiple_levels`
+    """
+    stage_cache.reset_stats()
+    stage_metrics.reset_totals()
+    profile_file = None
+    if profile:
+        profile_file = profiling.job_profile_file(config, f"{og_level}_{ogid}")
+    with profiling.profile_job(profile_file):
+        gene_outputs = pipeline.og_group_pipeline(
+            config, og_level, ogid, query_odb_gene_ids
+        )
+    for query_odb_gene_id, output in gene_outputs.items():
+        if isinstance(output, ValueError):
+            traceback.print_exception(output)
+            print(f"{query_odb_gene_id} - {og_level} - {output}")
+        elif isinstance(output, Exception):
+            raise output
+    return {
+        "stage_cache": stage_cache.cache_stats(),
+        "stage_metrics": stage_metrics.totals(),
+        "profile_file": profile_file,
+    }
+
+
+def _og_group_jobs(
+    config: conf.PipelineParams, og_table, profile: bool = False
+) -> tuple[list, list]:
+    """the arguments of the `og_group_job`s (one per OG and level, largest
+    group first) and of the `multiple_levels` jobs of the genes that have
+    several OGs at a level (which are left to `select_OG_by_level_name` to
+    report)"""
+    single_og_table = og_table[og_table["n OGs"] == 1]
+    groups = single_og_table.groupby(["level name", "OG id"], sort=False)[
+        "odb_gene_id"
+    ].agg(list)
+    group_args = [
+        (config, og_level, ogid, odb_gene_ids, profile)
+        for (og_level, ogid), odb_gene_ids in sorted(
+            groups.items(), key=lambda x: len(x[1]), reverse=True
+        )
+    ]
+    gene_args = []
+    multiple_og_table = og_table[og_table["n OGs"] > 1]
+    for odb_gene_id, gene_og_table in multiple_og_table.groupby(
+        "odb_gene_id", sort=False
+    ):
+        gene_args.append(
+            (config, odb_gene_id, list(gene_og_table["level name"]), {}, profile)
+        )
+    return group_args, gene_args
 
 
 def main(
@@ -42,8 +140,51 @@ def main(
     n_cores=N_CORES,
     overwrite=False,
     filemap=False,
+    shared_sequences_mb: float = 0,
+    profile: bool = False,
+    group_by_og: bool = False,
 ):
-    odbgeneid_list = sql_queries.get_all_odb_gene_ids_from_species_id(species_id)
+    """run the pipeline for every gene of `species_id` at each of `og_levels`
+
+    In multiprocess mode, the metadata is loaded before the pool is created
+    and shared with the workers. If `shared_sequences_mb` > 0, the sequences
+    of the OGs used by the most jobs are also put in shared memory, up to
+    about that many MB (see `orthodb_tools/shared_database.py`)
+
+    If `profile` is True, each job is profiled and the profiles are merged
+    into a report at the end (see `orthodb_tools/profiling.py`)
+
+    If `group_by_og` is True, the genes that are in the same OG at a level are
+    run in one job, which shares the work on the OG (fetching and filtering
+    its sequences, computing the similarities) between the genes (see
+    `pipeline.og_group_pipeline`). The output files are the same. The
+    profiles are named after the OGs instead of the genes
+    """
+    # look up the OGs of every gene in the species at once rather than for each job.
+    # gene/level combinations without an OG are not run
+    og_table = og_selection.species_og_level_table(species_id, og_levels)
+    og_table = og_table[og_table["n OGs"] > 0]
+    print(
+        f"{og_table['odb_gene_id'].nunique()} genes in {species_id} have an OG at one of the levels: {og_levels}"
+    )
+    group_args = []
+    if group_by_og:
+        group_args, f_args = _og_group_jobs(config, og_table, profile)
+        print(
+            f"{len(group_args)} OG jobs (one per OG and level) and {len(f_args)} genes with multiple OGs at a level"
+        )
+    else:
+        f_args = []
+        for odb_gene_id, gene_og_table in og_table.groupby("odb_gene_id", sort=False):
+            gene_og_levels = list(gene_og_table["level name"])
+            # genes with multiple OGs at a level are left to `select_OG_by_level_name` to report
+            single_og_table = gene_og_table[gene_og_table["n OGs"] == 1]
+            og_level_ogid_dict = dict(
+                zip(single_og_table["level name"], single_og_table["OG id"])
+            )
+            f_args.append(
+                (config, odb_gene_id, gene_og_levels, og_level_ogid_dict, profile)
+            )
     if Path(config.main_output_folder).exists():
         if overwrite:
             shutil.rmtree(config.main_output_folder)
@@ -52,14 +193,36 @@ def main(
                 f"main_output_folder already exists: {config.main_output_folder}. Use -o flag to overwrite"
             )
     if multiprocess:
-        p = multiprocessing.Pool(n_cores)
-        f_args = [(config, i, og_levels) for i in odbgeneid_list]
-        p.starmap(multiple_levels, f_args)
-        p.close()
-        p.join()
+        job_ogids = list(og_table["OG id"].dropna())
+        with shared_database.SharedDatabase(
+            shared_database.hot_ogids(job_ogids), shared_sequences_mb
+        ) as shared:
+            p = multiprocessing.Pool(
+                n_cores,
+                initializer=shared_database.worker_init,
+                initargs=(shared.handle,),
+            )
+            # the largest groups are submitted first, one at a time
+            job_stats = p.starmap(og_group_job, group_args, chunksize=1)
+            job_stats += p.starmap(multiple_levels, f_args)
+            p.close()
+            p.join()
     else:
-        for i in odbgeneid_list:
-            multiple_levels(config, i, og_levels)
+        job_stats = [og_group_job(*args) for args in group_args]
+        job_stats += [multiple_levels(*args) for args in f_args]
+    if stage_cache.get_stage_cache() is not None:
+        print(
+            stage_cache.format_stats(
+                stage_cache.merge_stats(s["stage_cache"] for s in job_stats)
+            )
+        )
+    pipeline.save_stage_metrics_summary(
+        config, stage_metrics.merge_totals(s["stage_metrics"] for s in job_stats)
+    )
+    if profile:
+        profiling.merge_run_profiles(
+            config, [s["profile_file"] for s in job_stats if s["profile_file"]]
+        )
     if filemap:
         create_filemap.create_filemap(
             config.main_output_folder,
@@ -128,6 +291,26 @@ def main_cli():
         action="store_true",
         help=f"""if flag is provided, create a file named 'database_key.json' in the main_output_folder that maps the protein odb_gene_id to the files generated by the pipeline.
 by default, the file is not created""",
+    )
+    parser.add_argument(
+        "--shared_sequences_mb",
+        type=float,
+        metavar="<float>",
+        default=0,
+        help="""put the sequences of the OGs used by the most jobs in shared memory, up to about this many MB.
+The workers read these sequences from shared memory instead of the sequence store. Default is 0 (off)""",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="""profile each job with cProfile. The profiles are saved to <main_output_folder>/profiles/<gene id>.prof
+and merged into a report sorted by cumulative time (profiles/aggregate.txt)""",
+    )
+    parser.add_argument(
+        "--group_by_og",
+        action="store_true",
+        help="""run the genes that are in the same OG at a level (e.g. paralogs) in one job, which fetches and filters
+the sequences of the OG and computes their similarities once for all of the genes. The output files are the same""",
     )
     args = parser.parse_args()
     config = pipeline.load_config(args.config)
@@ -139,6 +322,9 @@ by default, the file is not created""",
         n_cores=args.n_cores,
         overwrite=args.overwrite,
         filemap=args.filemap,
+        shared_sequences_mb=args.shared_sequences_mb,
+        profile=args.profile,
+        group_by_og=args.group_by_og,
     )
     # create_filemap.create_filemap(
     #     config.main_output_folder,
@@ -12,11 +12,17 @@ import pandas as pd
 
 import orthodb_tools.config.orthodb_pipeline_parameters as conf
 import orthodb_tools.sql_queries as sql_queries
+import orthodb_tools.shared_database as shared_database
+import orthodb_tools.profiling as profiling
+import orthodb_tools.stage_cache as stage_cache
+import orthodb_tools.stage_metrics as stage_metrics
 
 # import local_scripts.create_filemap as create_filemap
 from orthodb_tools.config import orthodb_pipeline_parameters
 from attrs import asdict
+import orthodb_tools.orthogroup_processing.og_selection as og_selection
 import orthodb_tools.orthogroup_processing.pipeline as pipeline
+import orthodb_tools.orthogroup_processing.uniprotid_search as uniprotid_search
 import orthodb_tools.scripts.create_filemap as create_filemap
 
 
@@ -29,40 +35,74 @@ def multiple_levels(
     gene_id: str,
     og_levels: list,
     id_type: Literal["odb_gene_id", "uniprot_id"],
+    profile: bool = False,
 ):
     """
-    run the pipeline for a single odb_gene_id for multiple og_levels
+    run the pipeline for a single odb_gene_id for multiple og_levels (see
+    `pipeline.multi_level_pipeline`)
+
+    If `profile` is True, the job is profiled (see `profiling.py`)
+
+    Returns the stage cache hit/miss counts, the stage metrics totals and the
+    profile file of the job (see `stage_cache.py` and `stage_metrics.py`)
     """
+    stage_cache.reset_stats()
+    stage_metrics.reset_totals()
     assert id_type in [
         "odb_gene_id",
         "uniprot_id",
     ], f"id_type must be 'odb_gene_id' or 'uniprot_id', not {id_type}"
-    for og_level in og_levels:
-        config.og_select_params.OG_level_name = og_level
+    profile_file = None
+    if profile:
+        profile_file = profiling.job_profile_file(config, gene_id)
+    with profiling.profile_job(profile_file):
         if id_type == "odb_gene_id":
-            try:
-                pipeline.orthogroup_pipeline(config, odb_gene_id=gene_id)
-            except ValueError as err:
-                traceback.print_exc()
-                # logger.error(f"{query_geneid} - {og_level} - {err}")
-                print(f"{gene_id} - {og_level} - {err}")
-                continue
-            except FileExistsError as err:
-                print(f"{gene_id} - {og_level} - {err}")
-                print(f"skipping {gene_id} - {og_level}")
-                continue
+            level_outputs = pipeline.multi_level_pipeline(
+                config, og_levels, odb_gene_id=gene_id
+            )
         else:
+            level_outputs = pipeline.multi_level_pipeline(
+                config, og_levels, uniprot_id=gene_id
+            )
+    for og_level, output in level_outputs.items():
+        if isinstance(output, ValueError):
+            traceback.print_exception(output)
+            # logger.error(f"{query_geneid} - {og_level} - {err}")
+            print(f"{gene_id} - {og_level} - {output}")
+        elif isinstance(output, FileExistsError):
+            print(f"{gene_id} - {og_level} - {output}")
+            print(f"skipping {gene_id} - {og_level}")
+    return {
+        "stage_cache": stage_cache.cache_stats(),
+        "stage_metrics": stage_metrics.totals(),
+        "profile_file": profile_file,
+    }
+
+
+def job_ogids(
+    id_list: list[str],
+    og_levels: list,
+    id_type: Literal["odb_gene_id", "uniprot_id"],
+) -> list[str]:
+    """the OG id that each job (gene and level) will use, for the jobs where
+    it can be determined (genes with exactly one OG at the level)"""
+    ogids = []
+    for gene_id in id_list:
+        if id_type == "uniprot_id":
             try:
-                pipeline.orthogroup_pipeline(config, uniprot_id=gene_id)
-            except ValueError as err:
-                traceback.print_exc()
-                # logger.error(f"{query_geneid} - {og_level} - {err}")
-                print(f"{gene_id} - {og_level} - {err}")
-                continue
-            except FileExistsError as err:
-                print(f"{gene_id} - {og_level} - {err}")
-                print(f"skipping {gene_id} - {og_level}")
+                gene_id = uniprotid_search.uniprotid_2_odb_gene_id(gene_id)
+            except ValueError:
                 continue
+        try:
+            og_level_list = og_selection.get_og_level_list(gene_id)
+        except ValueError:
+            # the job will report it
+            continue
+        for og_level in og_levels:
+            level_ogids = [og[0] for og in og_level_list if og[2] == og_level]
+            if len(level_ogids) == 1:
+                ogids.append(level_ogids[0])
+    return ogids
 
 
 def main(
@@ -75,7 +115,19 @@ def main(
     clear_output_folder=False,
     multiprocess=True,
     filemap=False,
+    shared_sequences_mb: float = 0,
+    profile: bool = False,
 ):
+    """run the pipeline for every gene in a table at each of `og_levels`
+
+    In multiprocess mode, the metadata is loaded before the pool is created
+    and shared with the workers. If `shared_sequences_mb` > 0, the sequences
+    of the OGs used by the most jobs are also put in shared memory, up to
+    about that many MB (see `orthodb_tools/shared_database.py`)
+
+    If `profile` is True, each job is profiled and the profiles are merged
+    into a report at the end (see `orthodb_tools/profiling.py`)
+    """
     table = pd.read_csv(table_file)
     if Path(config.main_output_folder).exists():
         if clear_output_folder:
@@ -102,15 +154,41 @@ def main(
             "either odb_gene_id_column or uniprot_id_column must be provided"
         )
     if multiprocess:
-        p = multiprocessing.Pool(n_cores)
-        f_args = [(config, i, og_levels, id_type) for i in id_list]
-        p.starmap(multiple_levels, f_args)
-        p.close()
-        p.join()
+        hot_ogids = []
+        if shared_sequences_mb > 0:
+            hot_ogids = shared_database.hot_ogids(
+                job_ogids(id_list, og_levels, id_type)
+            )
+        with shared_database.SharedDatabase(hot_ogids, shared_sequences_mb) as shared:
+            p = multiprocessing.Pool(
+                n_cores,
+                initializer=shared_database.worker_init,
+                initargs=(shared.handle,),
+            )
+            f_args = [(config, i, og_levels, id_type, profile) for i in id_list]
+            job_stats = p.starmap(multiple_levels, f_args)
+            p.close()
+            p.join()
     else:
+        job_stats = []
         for i in id_list:
             print(i)
-            multiple_levels(config, i, og_levels, id_type)
+            job_stats.append(
+                multiple_levels(config, i, og_levels, id_type, profile)
+            )
+    if stage_cache.get_stage_cache() is not None:
+        print(
+            stage_cache.format_stats(
+                stage_cache.merge_stats(s["stage_cache"] for s in job_stats)
+            )
+        )
+    pipeline.save_stage_metrics_summary(
+        config, stage_metrics.merge_totals(s["stage_metrics"] for s in job_stats)
+    )
+    if profile:
+        profiling.merge_run_profiles(
+            config, [s["profile_file"] for s in job_stats if s["profile_file"]]
+        )
     if filemap:
         create_filemap.create_filemap(
             config.main_output_folder,
@@ -189,6 +267,20 @@ def main_cli():
         action="store_true",
         help=f"""if flag is provided, create a file named 'database_key.json' in the main_output_folder that maps the protein odb_gene_id to the files generated by the pipeline.
 by default, the file is not created""",
+    )
+    parser.add_argument(
+        "--shared_sequences_mb",
+        type=float,
+        metavar="<float>",
+        default=0,
+        help="""put the sequences of the OGs used by the most jobs in shared memory, up to about this many MB.
+The workers read these sequences from shared memory instead of the sequence store. Default is 0 (off)""",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="""profile each job with cProfile. The profiles are saved to <main_output_folder>/profiles/<gene id>.prof
+and merged into a report sorted by cumulative time (profiles/aggregate.txt)""",
     )
     args = parser.parse_args()
     # for arg in vars(args):
@@ -204,6 +296,8 @@ by default, the file is not created""",
         clear_output_folder=args.clear,
         multiprocess=True,
         filemap=args.filemap,
+        shared_sequences_mb=args.shared_sequences_mb,
+        profile=args.profile,
     )
     # create_filemap.create_filemap(
     #     config.main_output_folder,
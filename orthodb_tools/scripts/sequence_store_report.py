@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+
+"""
+compare the sequence stores (`SEQUENCE_STORE` in the .env file): size on disk,
+compression ratio and how long it takes to fetch the sequences of an OG
+
+The sequences of randomly chosen OGs are fetched twice. The first pass starts
+with empty in-process caches (but whatever is in the OS page cache stays
+there) and the second pass shows the effect of the compressed store's block
+cache.
+"""
+
+import argparse
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+
+import orthodb_tools.env_variables.env_variables as env
+import orthodb_tools.sql_queries as sql_queries
+
+
+def _path_size(path: str | Path) -> int:
+    path = Path(path)
+    if not path.exists():
+        return 0
+    if path.is_dir():
+        return sum(f.stat().st_size for f in path.iterdir() if f.is_file())
+    return path.stat().st_size
+
+
+def store_size(
+    sequence_store: str, database_files: env.OrthoDBFiles = env.orthoDB_files
+) -> int:
+    """size on disk (bytes) of the files that a sequence store reads"""
+    if sequence_store == "sqlite":
+        files = [database_files.all_seqs_sqlite, database_files.all_seqs_fasta]
+    elif sequence_store == "offset_index":
+        files = [database_files.all_seqs_offset_index, database_files.all_seqs_fasta]
+    else:
+        files = [database_files.all_seqs_compressed]
+    return sum(_path_size(f) for f in files)
+
+
+def _fetch(store, sequence_ids: list[str]) -> dict:
+    if hasattr(store, "get_many"):
+        return store.get_many(sequence_ids)
+    return {i: store[i] for i in sequence_ids}
+
+
+def _time_batches(store, batches: list[list[str]]) -> dict:
+    times = []
+    n_sequences = 0
+    for batch in batches:
+        start_time = time.perf_counter()
+        n_sequences += len(_fetch(store, batch))
+        times.append(time.perf_counter() - start_time)
+    times = np.array(times) * 1000
+    total_s = times.sum() / 1000
+    return {
+        "mean_ms": float(times.mean()),
+        "p50_ms": float(np.percentile(times, 50)),
+        "p95_ms": float(np.percentile(times, 95)),
+        "sequences_per_s": n_sequences / total_s if total_s > 0 else 0.0,
+    }
+
+
+def report_store(
+    sequence_store: str,
+    batches: list[list[str]],
+    database_files: env.OrthoDBFiles = env.orthoDB_files,
+) -> dict:
+    """size and fetch latency of one sequence store"""
+    start_time = time.perf_counter()
+    store = env.load_data_all_odb_seqs(database_files, sequence_store)
+    open_time = time.perf_counter() - start_time
+    report = {
+        "store": sequence_store,
+        "size_bytes": store_size(sequence_store, database_files),
+        "open_ms": open_time * 1000,
+        "first_pass": _time_batches(store, batches),
+        "second_pass": _time_batches(store, batches),
+    }
+    if hasattr(store, "stats"):
+        stats = store.stats()
+        report["compression_ratio"] = stats["compression_ratio"]
+        report["block_cache"] = stats["block_cache"]
+    store.close()
+    return report
+
+
+def print_report(reports: list[dict], n_batches: int, n_sequences: int):
+    print(f"fetched {n_sequences:,} sequences from {n_batches} OGs, twice")
+    print(
+        f"{'store':<14}{'size':>12}{'ratio':>8}{'open (ms)':>11}"
+        f"{'1st pass mean/p95 (ms)':>25}{'2nd pass mean/p95 (ms)':>25}{'seqs/s (2nd)':>14}"
+    )
+    for r in reports:
+        first, second = r["first_pass"], r["second_pass"]
+        ratio = r.get("compression_ratio")
+        ratio = f"{ratio:.2f}" if ratio is not None else "-"
+        print(
+            f"{r['store']:<14}{r['size_bytes'] / 1024**2:>10.1f}MB"
+            f"{ratio:>8}{r['open_ms']:>11.1f}"
+            f"{first['mean_ms']:>15.2f} /{first['p95_ms']:>8.2f}"
+            f"{second['mean_ms']:>15.2f} /{second['p95_ms']:>8.2f}"
+            f"{second['sequences_per_s']:>14,.0f}"
+        )
+
+
+def main(
+    sequence_stores: list[str] | None = None,
+    n_ogs: int = 100,
+    seed: int = 0,
+    output_file: str | Path | None = None,
+    database_files: env.OrthoDBFiles = env.orthoDB_files,
+) -> list[dict]:
+    if sequence_stores is None:
+        sequence_stores = env.SEQUENCE_STORES
+    ogids = sql_queries.sample_ogids(n_ogs, seed, database_files.ogs_sqlite)
+    batches = [
+        sql_queries.ogid_2_odb_gene_id_list(ogid, database_files.OG2genes_sqlite)
+        for ogid in ogids
+    ]
+    reports = []
+    for sequence_store in sequence_stores:
+        try:
+            reports.append(report_store(sequence_store, batches, database_files))
+        except FileNotFoundError as e:
+            print(f"skipping {sequence_store}: {e}")
+    print_report(reports, len(batches), sum(len(b) for b in batches))
+    if output_file is not None:
+        with open(output_file, "w") as f:
+            json.dump(reports, f, indent=4)
+    return reports
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(
+        description="""compare the sequence stores: size on disk, compression ratio and the time it
+takes to fetch the sequences of randomly chosen OGs. Stores that haven't been
+built are skipped (build them with `odb_groups-build_databases -t <table>`)""",
+        formatter_class=argparse.RawTextHelpFormatter,
+    )
+    parser.add_argument(
+        "-s",
+        "--stores",
+        nargs="*",
+        metavar="<list>",
+        default=env.SEQUENCE_STORES,
+        help=f"""sequence stores to compare. Default is all of them: {env.SEQUENCE_STORES}""",
+    )
+    parser.add_argument(
+        "-n",
+        "--n_ogs",
+        type=int,
+        metavar="<int>",
+        default=100,
+        help="""number of OGs to fetch the sequences of. Default is 100""",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        metavar="<int>",
+        default=0,
+        help="""random seed used to pick the OGs. Default is 0""",
+    )
+    parser.add_argument(
+        "-o",
+        "--output_file",
+        type=str,
+        metavar="<file>",
+        default=None,
+        help="""write the report to this json file""",
+    )
+    args = parser.parse_args()
+    main(args.stores, n_ogs=args.n_ogs, seed=args.seed, output_file=args.output_file)
+
+
+if __name__ == "__main__":
+    main_cli()
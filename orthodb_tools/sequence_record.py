@@ -0,0 +1,93 @@
+"""
+lightweight, immutable sequence record used by the pipeline
+
+The pipeline only needs the id and the sequence of the orthoDB sequences (and
+the fasta header, to write them back out). A Biopython `SeqRecord` carries a
+lot more than that (a `Seq` object, annotation dicts, letter annotations,
+etc.), and the pipeline used to deep-copy the records at every step. A
+`SequenceRecord` is a `__slots__` class that holds 3 strings and can't be
+modified, so the same records are shared by all of the steps of a job without
+copying them.
+
+They are converted to `SeqRecord` objects only where Biopython is used, i.e.
+when they are written to a file for MAFFT/CD-HIT (see `as_seqrecords`).
+"""
+
+from Bio.Seq import Seq
+from Bio.SeqRecord import SeqRecord
+
+
+class SequenceRecord:
+    """an immutable (id, sequence) record
+
+    The attributes have the same names as the `SeqRecord` attributes, so code
+    that only reads `.id`, `.seq` and `len()` works with either. Note that `.seq`
+    is a `str`, not a `Seq`.
+
+    Parameters
+    ----------
+    id : str
+        the sequence id (the first word of the fasta header)
+    seq : str
+        the sequence
+    description : str | None, optional
+        the full fasta header (without the ">"). By default, the id
+    """
+
+    __slots__ = ("id", "seq", "description")
+
+    def __init__(self, id: str, seq: str, description: str | None = None):
+        object.__setattr__(self, "id", id)
+        object.__setattr__(self, "seq", seq)
+        object.__setattr__(
+            self, "description", id if description is None else description
+        )
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __reduce__(self):
+        # the default pickling of __slots__ classes sets the attributes
+        return (type(self), (self.id, self.seq, self.description))
+
+    def __len__(self) -> int:
+        return len(self.seq)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, SequenceRecord):
+            return NotImplemented
+        return (self.id, self.seq, self.description) == (
+            other.id,
+            other.seq,
+            other.description,
+        )
+
+    def __hash__(self) -> int:
+        return hash((self.id, self.seq, self.description))
+
+    def __repr__(self) -> str:
+        seq = self.seq if len(self.seq) <= 20 else f"{self.seq[:17]}..."
+        return f"{type(self).__name__}(id={self.id!r}, seq={seq!r}, length={len(self.seq)})"
+
+    @classmethod
+    def from_seqrecord(cls, seqrecord: SeqRecord) -> "SequenceRecord":
+        return cls(seqrecord.id, str(seqrecord.seq), seqrecord.description)
+
+    def to_seqrecord(self) -> SeqRecord:
+        """a new `SeqRecord` with the same id, name, description and sequence
+        as the records parsed from the fasta file by `Bio.SeqIO`"""
+        return SeqRecord(
+            Seq(self.seq), id=self.id, name=self.id, description=self.description
+        )
+
+
+def as_seqrecords(records: list) -> list[SeqRecord]:
+    """convert a list of `SequenceRecord` and/or `SeqRecord` objects to
+    `SeqRecord` objects (for writing them with `Bio.SeqIO`)"""
+    return [
+        record.to_seqrecord() if isinstance(record, SequenceRecord) else record
+        for record in records
+    ]
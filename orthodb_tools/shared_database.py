@@ -0,0 +1,220 @@
+"""
+share the orthoDB data between the worker processes of a `multiprocessing.Pool`
+
+Without this, each worker of `pipeline_all_genes_in_species` and
+`pipeline_input_table` loads the species/levels tables, opens the OG
+membership index and reads every sequence it needs from the sequence store on
+its own. `SharedDatabase` prepares the data in the parent process before the
+pool is created:
+
+- the species and levels tables and the OG membership index are loaded in the
+  parent. With the `fork` start method, the workers inherit them (the
+  membership index is memory-mapped, so its pages are shared with any start
+  method).
+- optionally, the sequences of the OGs that the most jobs will use (the "hot"
+  OGs) are packed into one block of shared memory
+  (`multiprocessing.shared_memory`), as sorted id/offset arrays and one
+  buffer of sequence data, like the offset index. Sequences that aren't in the
+  block are read from the sequence store as usual.
+
+`worker_init` is the pool initializer that attaches each worker to the shared
+block. Because the shared sequences are a few large arrays rather than many
+small Python objects, they are never copied into a worker, so the memory used
+by each worker doesn't grow with the number of workers.
+
+Example::
+
+    with SharedDatabase(hot_ogids, max_mb=1024) as shared:
+        with multiprocessing.Pool(
+            n_cores, initializer=worker_init, initargs=(shared.handle,)
+        ) as p:
+            p.starmap(...)
+"""
+
+from collections import Counter
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import orthodb_tools.env_variables.env_variables as env
+import orthodb_tools.query_cache as query_cache
+import orthodb_tools.sql_queries as sql_queries
+
+
+class SharedSequences:
+    """read-only sequence id -> (description, sequence) lookups on a block of
+    shared memory
+
+    Use `create` in the parent process and `attach` in the workers.
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory, n: int, id_itemsize: int):
+        self._shm = shm
+        self.n = n
+        self.id_itemsize = id_itemsize
+        # layout: starts (int64), ends (int64), ids, sequence data
+        self.starts = np.ndarray((n,), dtype=np.int64, buffer=shm.buf, offset=0)
+        self.ends = np.ndarray((n,), dtype=np.int64, buffer=shm.buf, offset=8 * n)
+        self.ids = np.ndarray(
+            (n,), dtype=f"S{id_itemsize}", buffer=shm.buf, offset=16 * n
+        )
+        self._data_offset = 16 * n + id_itemsize * n
+
+    @classmethod
+    def create(cls, records: dict[str, tuple[str, str]]) -> "SharedSequences":
+        """copy {sequence id: (description, sequence)} to a new block of shared memory"""
+        sequence_ids = sorted(records)
+        encoded = [f"{d}\n{s}".encode() for d, s in (records[i] for i in sequence_ids)]
+        ids = np.array([i.encode() for i in sequence_ids], dtype=bytes)
+        if len(ids) == 0:
+            ids = np.array([], dtype="S1")
+        n, id_itemsize = len(ids), ids.dtype.itemsize
+        lengths = np.array([len(e) for e in encoded], dtype=np.int64)
+        data_offset = 16 * n + id_itemsize * n
+        ends = np.cumsum(lengths)
+        shm = shared_memory.SharedMemory(
+            create=True, size=max(data_offset + int(ends[-1] if n else 0), 1)
+        )
+        shared = cls(shm, n, id_itemsize)
+        shared.starts[:] = ends - lengths
+        shared.ends[:] = ends
+        shared.ids[:] = ids
+        shm.buf[data_offset : data_offset + int(ends[-1] if n else 0)] = b"".join(
+            encoded
+        )
+        return shared
+
+    @classmethod
+    def attach(cls, handle: dict) -> "SharedSequences":
+        """attach to a block created by `create` (from its `handle`)"""
+        # (the pool workers share the parent's resource tracker, which
+        # removes the block if the parent exits without calling `unlink`)
+        shm = shared_memory.SharedMemory(name=handle["name"])
+        return cls(shm, handle["n"], handle["id_itemsize"])
+
+    @property
+    def handle(self) -> dict:
+        """what a worker needs to attach to the block (can be pickled)"""
+        return {"name": self._shm.name, "n": self.n, "id_itemsize": self.id_itemsize}
+
+    @property
+    def nbytes(self) -> int:
+        return self._shm.size
+
+    def get_many_raw(self, sequence_ids: list[str]) -> dict[str, tuple[str, str]]:
+        """return {sequence id: (description, sequence)} for the ids that are in
+        the block (ids that aren't in it are left out)"""
+        if self.n == 0 or len(sequence_ids) == 0:
+            return {}
+        sequence_ids = [
+            i for i in dict.fromkeys(sequence_ids) if len(i) <= self.id_itemsize
+        ]
+        query = np.array([i.encode() for i in sequence_ids], dtype=self.ids.dtype)
+        positions = np.minimum(np.searchsorted(self.ids, query), self.n - 1)
+        found = {}
+        for sequence_id, key, position in zip(sequence_ids, query, positions):
+            if self.ids[position] != key:
+                continue
+            start = self._data_offset + int(self.starts[position])
+            end = self._data_offset + int(self.ends[position])
+            description, _, sequence = (
+                bytes(self._shm.buf[start:end]).decode().partition("\n")
+            )
+            found[sequence_id] = (description, sequence)
+        return found
+
+    def close(self):
+        # the numpy views have to be released before the block can be closed
+        del self.starts, self.ends, self.ids
+        self._shm.close()
+
+    def unlink(self):
+        self._shm.unlink()
+
+
+def hot_ogids(job_ogids: list[str]) -> list[str]:
+    """the OG ids in `job_ogids` (one entry per job) ordered by the number of
+    jobs that use them, most used first"""
+    return [ogid for ogid, _ in Counter(job_ogids).most_common()]
+
+
+def _hot_sequences(ogids: list[str], max_mb: float) -> dict[str, tuple[str, str]]:
+    """{sequence id: (description, sequence)} for the members of the OGs in
+    `ogids`, adding whole OGs in order while the sequences fit in `max_mb`"""
+    odb_database = env.get_orthoDB_database()
+    max_bytes = max_mb * 1024 * 1024
+    records = {}
+    n_bytes = 0
+    for ogid in ogids:
+        members = [
+            i for i in query_cache.ogid_2_odb_gene_id_list(ogid) if i not in records
+        ]
+        og_records = odb_database.get_raw_sequences(members)
+        og_bytes = sum(len(d) + len(s) + 1 for d, s in og_records.values())
+        if n_bytes + og_bytes > max_bytes:
+            # a smaller OG further down the list might still fit
+            continue
+        records.update(og_records)
+        n_bytes += og_bytes
+    return records
+
+
+class SharedDatabase:
+    """load the orthoDB data in the parent process, to share it with the
+    workers of a `multiprocessing.Pool` (see the module docstring)
+
+    Parameters
+    ----------
+    ogids : list[str] | None, optional
+        OG ids whose sequences should be put in shared memory, most important
+        first (see `hot_ogids`). By default, None (no shared sequences)
+    max_mb : float, optional
+        approximate size limit of the shared sequences in MB. OGs are added in
+        order until the limit is reached. By default 0 (no shared sequences)
+    """
+
+    def __init__(self, ogids: list[str] | None = None, max_mb: float = 0):
+        odb_database = env.get_orthoDB_database()
+        # load the tables so that forked workers inherit them
+        odb_database.data_species_dict
+        odb_database.data_levels_taxid_name_dict
+        sql_queries._membership_index(env.orthoDB_files.OG2genes_sqlite)
+        self.shared_sequences = None
+        if ogids and max_mb > 0:
+            records = _hot_sequences(ogids, max_mb)
+            self.shared_sequences = SharedSequences.create(records)
+            print(
+                f"{self.shared_sequences.n:,} sequences "
+                f"({self.shared_sequences.nbytes / 1024 / 1024:.1f} MB) in shared memory"
+            )
+
+    @property
+    def handle(self) -> dict | None:
+        """the argument to pass to `worker_init`"""
+        if self.shared_sequences is None:
+            return None
+        return self.shared_sequences.handle
+
+    def close(self):
+        """free the shared memory. Call it once the pool has finished"""
+        if self.shared_sequences is not None:
+            self.shared_sequences.close()
+            self.shared_sequences.unlink()
+            self.shared_sequences = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def worker_init(handle: dict | None):
+    """initializer for the pool workers: attach to the shared sequences and
+    load the tables (which forked workers already have)"""
+    odb_database = env.get_orthoDB_database()
+    if handle is not None:
+        odb_database.shared_sequences = SharedSequences.attach(handle)
+    odb_database.data_species_dict
+    odb_database.data_levels_taxid_name_dict
+    sql_queries._membership_index(env.orthoDB_files.OG2genes_sqlite)
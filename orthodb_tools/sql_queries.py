@@ -1,21 +1,232 @@
+import os
+import random
 import sqlite3
+import threading
 from pathlib import Path
 
 from orthodb_tools.env_variables import env_variables as env
+from orthodb_tools.fasta_offset_index import read_build_info
+from orthodb_tools.og_membership_index import OGMembershipIndex
+from orthodb_tools.tools.sqlite3_db_tools import GeneIdCodec, read_schema_info
+
+
+class SQLiteConnectionPool:
+    """keeps one open read-only connection per database file for the whole process
+
+    The orthoDB sqlite databases are never modified after they are built, so
+    the connections are opened with `mode=ro&immutable=1`, which lets sqlite
+    skip file locking and change detection. All queries use bound parameters,
+    so sqlite3's per-connection statement cache means each query is only
+    compiled once per process.
+
+    Other databases can be ATTACHed to a connection (see `get_connection`) so
+    that a single query can join tables that live in separate database files.
+
+    The pool is fork-safe: it remembers the process id that opened the
+    connections and drops them if it is used from a different process (e.g. a
+    `multiprocessing.Pool` worker), which then opens its own connections.
+
+    Parameters
+    ----------
+    mmap_size : int, optional
+        value for `PRAGMA mmap_size` (bytes), by default env.SQLITE_MMAP_SIZE
+    cache_size : int, optional
+        value for `PRAGMA cache_size` (negative values are KiB), by default env.SQLITE_CACHE_SIZE
+    cached_statements : int, optional
+        number of prepared statements kept per connection, by default 256
+    """
+
+    def __init__(
+        self,
+        mmap_size: int = env.SQLITE_MMAP_SIZE,
+        cache_size: int = env.SQLITE_CACHE_SIZE,
+        cached_statements: int = 256,
+    ):
+        self.mmap_size = mmap_size
+        self.cache_size = cache_size
+        self.cached_statements = cached_statements
+        self._connections: dict[str, sqlite3.Connection] = {}
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _read_only_uri(db_path: str | Path) -> str:
+        db_path = Path(db_path)
+        if not db_path.exists():
+            raise FileNotFoundError(f"sqlite database not found: {db_path}")
+        return f"{db_path.resolve().as_uri()}?mode=ro&immutable=1"
+
+    def _open(
+        self, db_path: str | Path, attach: dict[str, str | Path]
+    ) -> sqlite3.Connection:
+        connection = sqlite3.connect(
+            self._read_only_uri(db_path),
+            uri=True,
+            check_same_thread=False,
+            cached_statements=self.cached_statements,
+        )
+        connection.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+        connection.execute(f"PRAGMA cache_size={int(self.cache_size)}")
+        for schema_name, attach_path in attach.items():
+            connection.execute(
+                f"ATTACH DATABASE ? AS {schema_name}",
+                (self._read_only_uri(attach_path),),
+            )
+        return connection
+
+    def get_connection(
+        self, db_path: str | Path, attach: dict[str, str | Path] | None = None
+    ) -> sqlite3.Connection:
+        """return the open connection to `db_path`, opening it if needed
+
+        Parameters
+        ----------
+        db_path : str | Path
+            path to the main database
+        attach : dict[str, str | Path] | None, optional
+            other databases to ATTACH to the connection, as a dictionary of
+            {schema name: database path}, by default None. A connection with
+            attached databases is kept separately from the plain connection to
+            `db_path`
+        """
+        if attach is None:
+            attach = {}
+        with self._lock:
+            if self._pid != os.getpid():
+                # inherited from the parent process. sqlite connections can't
+                # be shared across a fork, so just forget them
+                self._connections = {}
+                self._pid = os.getpid()
+            key = str(db_path)
+            if attach:
+                key += "".join(f"|{k}={v}" for k, v in sorted(attach.items()))
+            if key not in self._connections:
+                self._connections[key] = self._open(db_path, attach)
+            return self._connections[key]
+
+    def close_all(self):
+        """close all of the connections opened by this process"""
+        with self._lock:
+            if self._pid == os.getpid():
+                for connection in self._connections.values():
+                    connection.close()
+            self._connections = {}
+            self._pid = os.getpid()
+
+
+CONNECTION_POOL = SQLiteConnectionPool()
+# number of keys bound per `IN (...)` query in the batched lookups. older sqlite
+# builds limit a statement to 999 variables
+BATCH_SIZE = 900
+
+
+def _execute(
+    db_path: str | Path,
+    query: str,
+    parameters=(),
+    attach: dict[str, str | Path] | None = None,
+) -> list[tuple]:
+    connection = CONNECTION_POOL.get_connection(db_path, attach)
+    return connection.execute(query, parameters).fetchall()
+
+
+def _execute_batched(
+    db_path: str | Path, query: str, keys, batch_size: int = BATCH_SIZE
+) -> list[tuple]:
+    """run `query` for every key in `keys`, `batch_size` keys at a time.
+
+    `query` should contain a `{placeholders}` field where the `IN (...)` list goes.
+    e.g. "SELECT OG_id, odb_gene_id FROM OG2genes WHERE OG_id IN ({placeholders})"
+    """
+    keys = list(dict.fromkeys(keys))
+    results = []
+    for i in range(0, len(keys), batch_size):
+        batch = keys[i : i + batch_size]
+        placeholders = ",".join("?" * len(batch))
+        results.extend(
+            _execute(db_path, query.format(placeholders=placeholders), batch)
+        )
+    return results
+
+
+_GENE_ID_CODECS: dict[str, GeneIdCodec | None] = {}
+
+
+def _gene_id_codec(db_path: str | Path) -> GeneIdCodec | None:
+    """return the gene id codec of a database built with the compact schema,
+    or None if it was built with the default (text) schema
+
+    The functions in this module check this to read either schema. The codec
+    is read once per database file.
+    """
+    key = str(db_path)
+    if key not in _GENE_ID_CODECS:
+        _GENE_ID_CODECS[key] = GeneIdCodec.from_connection(
+            CONNECTION_POOL.get_connection(db_path)
+        )
+    return _GENE_ID_CODECS[key]
+
+
+def _encode_gene_ids(codec: GeneIdCodec, odb_gene_id_list: list[str]) -> dict[int, str]:
+    """{gene key: odb_gene_id} for the gene ids that can be in the database"""
+    gene_keys = {}
+    for odb_gene_id in odb_gene_id_list:
+        gene_key = codec.encode(odb_gene_id)
+        if gene_key is not None:
+            gene_keys[gene_key] = odb_gene_id
+    return gene_keys
+
+
+_MEMBERSHIP_INDEXES: dict[str, OGMembershipIndex | None] = {}
+
+
+def _membership_index(og2genes_db_path: str | Path) -> OGMembershipIndex | None:
+    """return the CSR membership index of an OG2genes database (see
+    `og_membership_index.py`), or None if there isn't one
+
+    The index is the directory next to the database with the same name and a
+    `.csr` suffix (`env.orthoDB_files.OG2genes_csr` for the default database).
+    It isn't used if it was built from a different OG2genes file than the
+    database. The OG membership lookups in this module use the index instead
+    of the database when there is one.
+    """
+    key = str(og2genes_db_path)
+    if key not in _MEMBERSHIP_INDEXES:
+        index_dir = Path(og2genes_db_path).with_suffix(".csr")
+        index = None
+        if (index_dir / "ogids.npy").exists():
+            index_source = read_build_info(index_dir).get("source_sha256")
+            db_source = None
+            if Path(og2genes_db_path).exists():
+                db_source = read_schema_info(
+                    CONNECTION_POOL.get_connection(og2genes_db_path)
+                ).get("source_sha256")
+            if index_source is not None and db_source not in (None, index_source):
+                print(
+                    f"WARNING: not using the OG membership index {index_dir}, it was built "
+                    f"from a different OG2genes file than {og2genes_db_path}. "
+                    "Rebuild it with `odb_groups-build_databases -t OG2genes_csr`"
+                )
+            else:
+                index = OGMembershipIndex(index_dir)
+        _MEMBERSHIP_INDEXES[key] = index
+    return _MEMBERSHIP_INDEXES[key]
 
 
 def uniprotid_2_odb_gene_id_refs(
     uniprotid, db_path: str | Path = env.orthoDB_files.gene_refs_sqlite
 ) -> list[str]:
     """return the odb_gene_id from a uniprot ID"""
-    connection = sqlite3.connect(db_path)
-    cursor = connection.cursor()
-    res = cursor.execute(
-        f"SELECT odb_gene_id FROM gene_refs WHERE Uniprotid='{uniprotid}'"
+    codec = _gene_id_codec(db_path)
+    if codec is not None:
+        gene_keys = _execute(
+            db_path, "SELECT gene_key FROM gene_refs WHERE Uniprotid=?", (uniprotid,)
+        )
+        return [codec.decode(x[0]) for x in gene_keys]
+    odb_gene_ids = _execute(
+        db_path, "SELECT odb_gene_id FROM gene_refs WHERE Uniprotid=?", (uniprotid,)
     )
-    odb_gene_ids = res.fetchall()
     odb_gene_ids = [x[0] for x in odb_gene_ids]
-    connection.close()
     return odb_gene_ids
 
 
@@ -23,14 +234,23 @@ def uniprotid_2_odb_gene_id_xrefs(
     uniprotid, db_path: str | Path = env.orthoDB_files.gene_xrefs_sqlite
 ) -> list[str]:
     """return the odb_gene_id from a uniprot ID"""
-    connection = sqlite3.connect(db_path)
-    cursor = connection.cursor()
-    # res = cursor.execute(f"SELECT odb_gene_id FROM gene_xrefs WHERE xref_id='{uniprotid}' AND DB_name='UniProt'")
+    codec = _gene_id_codec(db_path)
+    if codec is not None:
+        gene_keys = _execute(
+            db_path,
+            """SELECT gene_xrefs.gene_key FROM gene_xrefs
+            JOIN db_names ON db_names.db_code = gene_xrefs.db_code
+            WHERE gene_xrefs.xref_id=? AND db_names.DB_name='UniProt'""",
+            (uniprotid,),
+        )
+        return [codec.decode(x[0]) for x in gene_keys]
     # This is much faster if you don't specify the DB_name and then filter the results
-    res = cursor.execute(f"SELECT * FROM gene_xrefs WHERE xref_id='{uniprotid}'")
-    odb_gene_ids = res.fetchall()
-    odb_gene_ids = [x[1] for x in odb_gene_ids if x[3] == "UniProt"]
-    connection.close()
+    odb_gene_ids = _execute(
+        db_path,
+        "SELECT odb_gene_id, DB_name FROM gene_xrefs WHERE xref_id=?",
+        (uniprotid,),
+    )
+    odb_gene_ids = [x[0] for x in odb_gene_ids if x[1] == "UniProt"]
     return odb_gene_ids
 
 
@@ -38,13 +258,18 @@ def odb_gene_id_2_species_id(
     odb_gene_id, db_path: str | Path = env.orthoDB_files.gene_refs_sqlite
 ) -> str:
     """return the species ID from an orthodb ID"""
-    connection = sqlite3.connect(db_path)
-    cursor = connection.cursor()
-    res = cursor.execute(
-        f"SELECT species_id FROM gene_refs WHERE odb_gene_id='{odb_gene_id}'"
+    codec = _gene_id_codec(db_path)
+    if codec is not None:
+        res = _execute(
+            db_path,
+            "SELECT gene_key FROM gene_refs WHERE gene_key=?",
+            (codec.encode(odb_gene_id),),
+        )
+        return codec.species_id(res[0][0])
+    res = _execute(
+        db_path, "SELECT species_id FROM gene_refs WHERE odb_gene_id=?", (odb_gene_id,)
     )
-    species_id = res.fetchall()[0][0]
-    connection.close()
+    species_id = res[0][0]
     return species_id
 
 
@@ -65,15 +290,25 @@ def odb_gene_id_2_ogid_list(
     list[str]
         list of OGs the gene id (orthodb id) belongs to
     """
-    connection = sqlite3.connect(db_path)
-    cursor = connection.cursor()
-    res = cursor.execute(
-        f"SELECT OG_id FROM OG2genes WHERE odb_gene_id='{odb_gene_id}'"
-    )
-    og_ids = res.fetchall()
-    og_ids = [og_id[0] for og_id in og_ids]
+    index = _membership_index(db_path)
+    if index is not None:
+        og_ids = index.gene_ogid_list(odb_gene_id)
+    else:
+        codec = _gene_id_codec(db_path)
+        if codec is not None:
+            og_ids = _execute(
+                db_path,
+                "SELECT OG_id FROM OG2genes WHERE gene_key=?",
+                (codec.encode(odb_gene_id),),
+            )
+        else:
+            og_ids = _execute(
+                db_path,
+                "SELECT OG_id FROM OG2genes WHERE odb_gene_id=?",
+                (odb_gene_id,),
+            )
+        og_ids = [og_id[0] for og_id in og_ids]
     og_ids = list(set(og_ids))
-    connection.close()
     if len(og_ids) == 0:
         raise ValueError(f"no OGs found for gene id {odb_gene_id}")
     return og_ids
@@ -89,26 +324,132 @@ def get_ogid_info(
     tuple[str]
         returns a tuple composed of (ogid, level NCBI tax id, and OG name)
     """
-    connection = sqlite3.connect(db_path)
-    cursor = connection.cursor()
-    res = cursor.execute(f"SELECT * FROM OGs WHERE OG_id='{ogid}'")
-    og_info = res.fetchall()[0]
+    res = _execute(
+        db_path,
+        "SELECT OG_id, CAST(level_NCBI_tax_id AS TEXT), OG_name FROM OGs WHERE OG_id=?",
+        (ogid,),
+    )
     # raise error if no results found?
-    connection.close()
-    return og_info[1:]
+    og_info = res[0]
+    return og_info
+
+
+def odb_gene_id_2_og_info_list(
+    odb_gene_id,
+    og2genes_db_path: str | Path = env.orthoDB_files.OG2genes_sqlite,
+    ogs_db_path: str | Path = env.orthoDB_files.ogs_sqlite,
+) -> list[tuple[str]]:
+    """return the info about every OG that a odb_gene_id belongs to in a single query
+
+    The OGs database is attached to the OG2genes database so that the
+    OG2genes -> OGs lookup is a single indexed join instead of a
+    `get_ogid_info` query for each OG.
+
+    Returns
+    -------
+    list[tuple[str]]
+        list of (ogid, level NCBI tax id, OG name) tuples, the same as `get_ogid_info`
+
+    Raises
+    ------
+    ValueError
+        if no OGs are found for the gene id
+    """
+    index = _membership_index(og2genes_db_path)
+    if index is not None:
+        og_info_dict = ogid_list_2_ogid_info_dict(
+            index.gene_ogid_list(odb_gene_id), ogs_db_path
+        )
+        if len(og_info_dict) == 0:
+            raise ValueError(f"no OGs found for gene id {odb_gene_id}")
+        return list(og_info_dict.values())
+    codec = _gene_id_codec(og2genes_db_path)
+    if codec is not None:
+        gene_column, gene_value = "gene_key", codec.encode(odb_gene_id)
+    else:
+        gene_column, gene_value = "odb_gene_id", odb_gene_id
+    og_info_list = _execute(
+        og2genes_db_path,
+        f"""SELECT DISTINCT OG2genes.OG_id, CAST(OGs.level_NCBI_tax_id AS TEXT), OGs.OG_name
+        FROM OG2genes JOIN ogs_db.OGs AS OGs ON OGs.OG_id = OG2genes.OG_id
+        WHERE OG2genes.{gene_column}=?""",
+        (gene_value,),
+        attach={"ogs_db": ogs_db_path},
+    )
+    if len(og_info_list) == 0:
+        raise ValueError(f"no OGs found for gene id {odb_gene_id}")
+    return og_info_list
+
+
+def species_id_2_og_info_list(
+    species_id: str,
+    og2genes_db_path: str | Path = env.orthoDB_files.OG2genes_sqlite,
+    ogs_db_path: str | Path = env.orthoDB_files.ogs_sqlite,
+) -> list[tuple[str]]:
+    """return the OG membership of every gene in a species in a single pass
+
+    odb_gene_ids are formatted as "{species_id}:{gene}", so all of the genes
+    of a species are a contiguous range of the OG2genes odb_gene_id index (or
+    of the gene key index in the compact schema).
+
+    Returns
+    -------
+    list[tuple[str]]
+        list of (odb_gene_id, ogid, level NCBI tax id) tuples
+    """
+    index = _membership_index(og2genes_db_path)
+    if index is not None:
+        gene_ogid_pairs = index.species_gene_ogid_pairs(species_id)
+        og_info_dict = ogid_list_2_ogid_info_dict(
+            list(dict.fromkeys(ogid for _, ogid in gene_ogid_pairs)), ogs_db_path
+        )
+        return [
+            (odb_gene_id, ogid, og_info_dict[ogid][1])
+            for odb_gene_id, ogid in gene_ogid_pairs
+            if ogid in og_info_dict
+        ]
+    codec = _gene_id_codec(og2genes_db_path)
+    if codec is not None:
+        key_range = codec.species_key_range(species_id)
+        if key_range is None:
+            return []
+        res = _execute(
+            og2genes_db_path,
+            """SELECT DISTINCT OG2genes.gene_key, OG2genes.OG_id, CAST(OGs.level_NCBI_tax_id AS TEXT)
+            FROM OG2genes JOIN ogs_db.OGs AS OGs ON OGs.OG_id = OG2genes.OG_id
+            WHERE OG2genes.gene_key BETWEEN ? AND ?""",
+            key_range,
+            attach={"ogs_db": ogs_db_path},
+        )
+        return [(codec.decode(gene_key), ogid, level) for gene_key, ogid, level in res]
+    return _execute(
+        og2genes_db_path,
+        """SELECT DISTINCT OG2genes.odb_gene_id, OG2genes.OG_id, CAST(OGs.level_NCBI_tax_id AS TEXT)
+        FROM OG2genes JOIN ogs_db.OGs AS OGs ON OGs.OG_id = OG2genes.OG_id
+        WHERE OG2genes.odb_gene_id >= ? AND OG2genes.odb_gene_id < ?""",
+        # ";" is the character after ":"
+        (f"{species_id}:", f"{species_id};"),
+        attach={"ogs_db": ogs_db_path},
+    )
 
 
 def odb_gene_id_2_uniprotid(
     odb_gene_id, db_path: str | Path = env.orthoDB_files.gene_refs_sqlite
 ) -> str:
     """return the uniprot ID from an orthodb ID"""
-    connection = sqlite3.connect(db_path)
-    cursor = connection.cursor()
-    res = cursor.execute(
-        f"SELECT Uniprotid FROM gene_refs WHERE odb_gene_id='{odb_gene_id}'"
-    )
-    result = res.fetchall()
-    connection.close()
+    codec = _gene_id_codec(db_path)
+    if codec is not None:
+        result = _execute(
+            db_path,
+            "SELECT Uniprotid FROM gene_refs WHERE gene_key=?",
+            (codec.encode(odb_gene_id),),
+        )
+    else:
+        result = _execute(
+            db_path,
+            "SELECT Uniprotid FROM gene_refs WHERE odb_gene_id=?",
+            (odb_gene_id,),
+        )
     if len(result) == 0:
         # raise ValueError(f"no uniprot id found for gene id {odb_gene_id}")
         return ""
@@ -119,22 +460,125 @@ def odb_gene_id_2_uniprotid(
 def ogid_2_odb_gene_id_list(
     ogid, db_path: str | Path = env.orthoDB_files.OG2genes_sqlite
 ) -> list[str]:
-    connection = sqlite3.connect(db_path)
-    cursor = connection.cursor()
-    res = cursor.execute(f"SELECT odb_gene_id FROM OG2genes WHERE OG_id='{ogid}'")
-    odb_gene_ids = res.fetchall()
+    index = _membership_index(db_path)
+    if index is not None:
+        return index.og_members_list(ogid)
+    codec = _gene_id_codec(db_path)
+    if codec is not None:
+        # the primary key is (OG_id, line), so the members are in the same
+        # order as in the default schema
+        gene_keys = _execute(
+            db_path, "SELECT gene_key FROM OG2genes WHERE OG_id=?", (ogid,)
+        )
+        return [codec.decode(x[0]) for x in gene_keys]
+    odb_gene_ids = _execute(
+        db_path, "SELECT odb_gene_id FROM OG2genes WHERE OG_id=?", (ogid,)
+    )
     odb_gene_ids = [x[0] for x in odb_gene_ids]
-    connection.close()
     return odb_gene_ids
 
 
 def get_all_odb_gene_ids_from_species_id(
     species_id: str, db_path: str | Path = env.orthoDB_files.gene_refs_sqlite
 ) -> list[str]:
-    connection = sqlite3.connect(db_path)
-    cursor = connection.cursor()
-    res = cursor.execute(f"SELECT * FROM gene_refs WHERE species_id='{species_id}'")
-    results = res.fetchall()
-    gene_list = list(set([i[1] for i in results]))
-    connection.close()
+    codec = _gene_id_codec(db_path)
+    if codec is not None:
+        key_range = codec.species_key_range(species_id)
+        if key_range is None:
+            return []
+        results = _execute(
+            db_path,
+            "SELECT gene_key FROM gene_refs WHERE gene_key BETWEEN ? AND ?",
+            key_range,
+        )
+        return list(set([codec.decode(i[0]) for i in results]))
+    results = _execute(
+        db_path, "SELECT odb_gene_id FROM gene_refs WHERE species_id=?", (species_id,)
+    )
+    gene_list = list(set([i[0] for i in results]))
     return gene_list
+
+
+def sample_ogids(
+    n: int, seed: int = 0, db_path: str | Path = env.orthoDB_files.ogs_sqlite
+) -> list[str]:
+    """return `n` OG ids picked at random (but reproducibly, for a given `seed`)
+    from the OGs database. Used for benchmarking"""
+    ogids = [x[0] for x in _execute(db_path, "SELECT OG_id FROM OGs")]
+    rng = random.Random(seed)
+    return rng.sample(ogids, min(n, len(ogids)))
+
+
+# ==============================================================================
+# // batched lookups
+# ==============================================================================
+
+
+def odb_gene_id_list_2_species_id_dict(
+    odb_gene_id_list: list[str],
+    db_path: str | Path = env.orthoDB_files.gene_refs_sqlite,
+) -> dict[str, str]:
+    """return a dictionary mapping each odb_gene_id in `odb_gene_id_list` to its species ID
+
+    gene ids that are not found in the database are left out of the dictionary
+    """
+    codec = _gene_id_codec(db_path)
+    if codec is not None:
+        gene_keys = _encode_gene_ids(codec, odb_gene_id_list)
+        res = _execute_batched(
+            db_path,
+            "SELECT gene_key FROM gene_refs WHERE gene_key IN ({placeholders})",
+            gene_keys,
+        )
+        return {gene_keys[x[0]]: codec.species_id(x[0]) for x in res}
+    res = _execute_batched(
+        db_path,
+        "SELECT odb_gene_id, species_id FROM gene_refs WHERE odb_gene_id IN ({placeholders})",
+        odb_gene_id_list,
+    )
+    return dict(res)
+
+
+def ogid_list_2_ogid_info_dict(
+    ogid_list: list[str], db_path: str | Path = env.orthoDB_files.ogs_sqlite
+) -> dict[str, tuple[str]]:
+    """return a dictionary mapping each ogid in `ogid_list` to the same info as `get_ogid_info`:
+    a tuple composed of (ogid, level NCBI tax id, and OG name)
+
+    ogids that are not found in the database are left out of the dictionary
+    """
+    res = _execute_batched(
+        db_path,
+        """SELECT OG_id, CAST(level_NCBI_tax_id AS TEXT), OG_name
+        FROM OGs WHERE OG_id IN ({placeholders})""",
+        ogid_list,
+    )
+    return {og_info[0]: og_info for og_info in res}
+
+
+def odb_gene_id_list_2_uniprotid_dict(
+    odb_gene_id_list: list[str],
+    db_path: str | Path = env.orthoDB_files.gene_refs_sqlite,
+) -> dict[str, str]:
+    """return a dictionary mapping each odb_gene_id in `odb_gene_id_list` to its uniprot ID
+
+    like `odb_gene_id_2_uniprotid`, gene ids without a uniprot ID are mapped to ""
+    """
+    codec = _gene_id_codec(db_path)
+    if codec is not None:
+        gene_keys = _encode_gene_ids(codec, odb_gene_id_list)
+        res = _execute_batched(
+            db_path,
+            "SELECT gene_key, Uniprotid FROM gene_refs WHERE gene_key IN ({placeholders})",
+            gene_keys,
+        )
+        res = [(gene_keys[gene_key], uniprot_id) for gene_key, uniprot_id in res]
+    else:
+        res = _execute_batched(
+            db_path,
+            "SELECT odb_gene_id, Uniprotid FROM gene_refs WHERE odb_gene_id IN ({placeholders})",
+            odb_gene_id_list,
+        )
+    uniprot_id_dict = {odb_gene_id: "" for odb_gene_id in odb_gene_id_list}
+    uniprot_id_dict.update(res)
+    return uniprot_id_dict
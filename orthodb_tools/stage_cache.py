@@ -0,0 +1,250 @@
+"""
+on-disk cache of the results of the expensive pipeline stages
+
+LDO selection, CD-HIT clustering and the final MAFFT alignment are the slow
+parts of the pipeline. Their results only depend on the input sequences, the
+stage parameters and the tool that is run, so they are saved to disk keyed by
+a hash of all three (see `stage_key`) and reused when a stage is run again
+with identical inputs, e.g. when a run is restarted after a crash, in
+parameter sweeps that only change the later stages, or for genes whose OGs are
+the same at several levels.
+
+The cache is turned on by setting `STAGE_CACHE_DIR` in the `.env` file. Each
+entry is a pickle file (`<STAGE_CACHE_DIR>/<stage>/<key[:2]>/<key>.pkl`). When
+the total size of the cache goes over `STAGE_CACHE_MAX_MB`, the least recently
+used entries are removed. Entries are written atomically, so the cache can be
+shared by the workers of a `multiprocessing.Pool` (and by concurrent runs).
+
+`cache_stats` returns the hit/miss counts of each stage in the current
+process.
+"""
+
+import functools
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import threading
+from pathlib import Path
+from typing import Any, Iterable
+
+import orthodb_tools
+import orthodb_tools.env_variables.env_variables as env
+from orthodb_tools.tools.general_utils import file_fingerprint
+
+# changing the format of the stored values invalidates every entry
+FORMAT_VERSION = 1
+STAGES = ["find_LDOs", "cdhit", "mafft_alignment"]
+# fraction of the size limit to evict down to, so that eviction doesn't run on
+# every write once the cache is full
+EVICT_TO_FRACTION = 0.9
+
+
+def _hash_records(records: Iterable) -> str:
+    """hash of the ids, descriptions and sequences of a list of records, in order"""
+    digest = hashlib.sha256()
+    for record in records:
+        for field in (record.id, record.description, str(record.seq)):
+            digest.update(field.encode())
+            digest.update(b"\0")
+    return digest.hexdigest()
+
+
+@functools.lru_cache(maxsize=None)
+def tool_fingerprint(executable: str) -> dict:
+    """identify the version of an external tool by the path, size and
+    modification time of its executable (without running it)"""
+    path = shutil.which(executable)
+    if path is None:
+        return {"executable": executable}
+    path = os.path.realpath(path)
+    fingerprint = file_fingerprint(path, checksum=False)
+    return {"executable": path, **fingerprint}
+
+
+def stage_key(stage: str, records: Iterable, params: dict) -> str:
+    """cache key of a stage run on `records` with `params`
+
+    Parameters
+    ----------
+    stage : str
+        name of the stage (one of `STAGES`)
+    records : Iterable
+        the input sequences (`SequenceRecord` or `SeqRecord`), in order
+    params : dict
+        everything else that the result depends on (parameters, tool
+        fingerprints, package versions). Must be JSON serializable
+
+    Returns
+    -------
+    str
+        hex sha256 digest
+    """
+    key_data = {
+        "format_version": FORMAT_VERSION,
+        "orthodb_tools_version": orthodb_tools.__version__,
+        "stage": stage,
+        "params": params,
+        "records": _hash_records(records),
+    }
+    return hashlib.sha256(
+        json.dumps(key_data, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+class StageCache:
+    """on-disk cache of stage results, bounded by total size
+
+    Parameters
+    ----------
+    cache_dir : str | Path
+        directory of the cache. Created if it doesn't exist
+    max_bytes : int
+        approximate maximum size of the cache in bytes. Each process only
+        counts its own writes between evictions, so processes that share the
+        cache can take it somewhat over the limit
+    """
+
+    def __init__(self, cache_dir: str | Path, max_bytes: int):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # estimate of the size of the cache, updated by this process' writes
+        self._n_bytes = None
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.stats = {stage: {"hits": 0, "misses": 0} for stage in STAGES}
+
+    def _path(self, stage: str, key: str) -> Path:
+        return self.cache_dir / stage / key[:2] / f"{key}.pkl"
+
+    def get(self, stage: str, key: str) -> Any | None:
+        """the cached result, or None if there isn't one"""
+        path = self._path(stage, key)
+        try:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+        except FileNotFoundError:
+            value = None
+        except Exception:
+            # e.g. an entry that was evicted while it was read
+            value = None
+        stage_stats = self.stats.setdefault(stage, {"hits": 0, "misses": 0})
+        if value is None:
+            stage_stats["misses"] += 1
+            return None
+        stage_stats["hits"] += 1
+        try:
+            # the modification time is used as the last access time for eviction
+            os.utime(path)
+        except OSError:
+            pass
+        return value
+
+    def put(self, stage: str, key: str, value: Any):
+        path = self._path(stage, key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        try:
+            with open(tmp_path, "wb") as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+        with self._lock:
+            if self._n_bytes is None:
+                self._n_bytes = self.size()
+            else:
+                self._n_bytes += path.stat().st_size
+            if self._n_bytes > self.max_bytes:
+                self._n_bytes = self.evict(int(self.max_bytes * EVICT_TO_FRACTION))
+
+    def _entries(self) -> list[tuple[float, int, Path]]:
+        entries = []
+        for path in self.cache_dir.glob("*/*/*.pkl"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def size(self) -> int:
+        """total size of the cache entries in bytes"""
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self, max_bytes: int) -> int:
+        """remove the least recently used entries until the cache is at most
+        `max_bytes`. Returns the size of the cache"""
+        entries = sorted(self._entries())
+        n_bytes = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if n_bytes <= max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            n_bytes -= size
+        return n_bytes
+
+
+_STAGE_CACHE = None
+
+
+def get_stage_cache() -> StageCache | None:
+    """the cache configured in the `.env` file, or None if it is turned off"""
+    global _STAGE_CACHE
+    if not env.STAGE_CACHE_DIR:
+        return None
+    if _STAGE_CACHE is None:
+        _STAGE_CACHE = StageCache(
+            env.STAGE_CACHE_DIR, int(env.STAGE_CACHE_MAX_MB * 1024 * 1024)
+        )
+    return _STAGE_CACHE
+
+
+def _after_fork_in_child():
+    if _STAGE_CACHE is not None:
+        _STAGE_CACHE._lock = threading.Lock()
+        _STAGE_CACHE.reset_stats()
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def cache_stats() -> dict[str, dict[str, int]]:
+    """hit/miss counts of each stage in this process ({} if the cache is off)"""
+    cache = get_stage_cache()
+    if cache is None:
+        return {}
+    return {stage: dict(counts) for stage, counts in cache.stats.items()}
+
+
+def reset_stats():
+    cache = get_stage_cache()
+    if cache is not None:
+        cache.reset_stats()
+
+
+def merge_stats(stats_list: Iterable[dict]) -> dict[str, dict[str, int]]:
+    """add up the `cache_stats` of several processes/jobs"""
+    total = {}
+    for stats in stats_list:
+        for stage, counts in (stats or {}).items():
+            stage_total = total.setdefault(stage, {"hits": 0, "misses": 0})
+            stage_total["hits"] += counts["hits"]
+            stage_total["misses"] += counts["misses"]
+    return total
+
+
+def format_stats(stats: dict[str, dict[str, int]]) -> str:
+    """one line per stage: hits, misses and hit rate"""
+    lines = ["stage cache:"]
+    for stage, counts in stats.items():
+        n = counts["hits"] + counts["misses"]
+        rate = counts["hits"] / n if n else 0.0
+        lines.append(
+            f"  {stage:<16} {counts['hits']:>6} hits {counts['misses']:>6} misses ({rate:.0%} hit rate)"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,205 @@
+"""
+wall time, CPU time and peak memory of each stage of the pipeline
+
+`orthogroup_pipeline` and `multi_level_pipeline` record, for each stage of a
+job (see `STAGES`), with `StageMetrics.measure`:
+
+- `wall_s`: elapsed time
+- `cpu_s`: CPU time (user + system) of the Python process
+- `children_cpu_s`: CPU time of the child processes that finished during the
+  stage (mafft and cd-hit)
+- `peak_rss_mb`: peak resident memory of the Python process during the stage.
+  On Linux the peak is reset at the start of each stage (through
+  `/proc/self/clear_refs`). Elsewhere it is the peak since the process
+  started
+
+The peak memory of the child processes isn't recorded: the OS only keeps the
+largest peak of all of the children, and a child started with `fork` starts
+out with the peak of the Python process.
+
+The metrics of each job are saved in its info json file under
+`"stage_metrics"`. They are also added to per-process totals (see `totals`),
+which the batch scripts combine across the worker processes into a summary of
+the whole run (`merge_totals`, `format_summary`).
+"""
+
+import os
+import resource
+import sys
+import time
+from contextlib import contextmanager
+from typing import Iterable
+
+# in the order they run
+STAGES = [
+    "og_selection",
+    "member_listing",
+    "sequence_fetch",
+    "filtering",
+    "ldo_selection",
+    "cdhit",
+    "alignment",
+    "output",
+]
+_CLEAR_REFS = "/proc/self/clear_refs"
+
+
+def _maxrss_mb(who: int) -> float:
+    maxrss = resource.getrusage(who).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in KB on Linux
+    if sys.platform == "darwin":
+        return maxrss / 1024 / 1024
+    return maxrss / 1024
+
+
+def _reset_peak_rss() -> bool:
+    """reset the peak RSS of the process to its current RSS (Linux only).
+    Returns False if it couldn't be reset"""
+    try:
+        with open(_CLEAR_REFS, "w") as f:
+            f.write("5")
+    except OSError:
+        return False
+    return True
+
+
+class StageMetrics:
+    """the metrics of the stages of one job
+
+    Example::
+
+        metrics = StageMetrics()
+        with metrics.measure("sequence_fetch"):
+            ...
+        output_dict["stage_metrics"] = metrics.as_dict()
+    """
+
+    def __init__(self):
+        self.stages = {}
+
+    @contextmanager
+    def measure(self, stage: str):
+        """record the metrics of the code in the `with` block as `stage`. If
+        a stage is measured more than once, the times are added up"""
+        _reset_peak_rss()
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall
+            cpu = time.process_time() - cpu
+            children_end = resource.getrusage(resource.RUSAGE_CHILDREN)
+            children_cpu = (children_end.ru_utime + children_end.ru_stime) - (
+                children.ru_utime + children.ru_stime
+            )
+            metrics = {
+                "wall_s": wall,
+                "cpu_s": cpu,
+                "children_cpu_s": children_cpu,
+                "peak_rss_mb": _maxrss_mb(resource.RUSAGE_SELF),
+            }
+            self._add(stage, metrics)
+
+    def _add(self, stage: str, metrics: dict):
+        _add_to_totals(stage, metrics)
+        if stage in self.stages:
+            previous = self.stages[stage]
+            for key in ["wall_s", "cpu_s", "children_cpu_s"]:
+                metrics[key] += previous[key]
+            metrics["peak_rss_mb"] = max(
+                metrics["peak_rss_mb"], previous["peak_rss_mb"]
+            )
+        self.stages[stage] = metrics
+
+    def copy(self) -> "StageMetrics":
+        """a copy of the metrics recorded so far (e.g. of stages shared by
+        several jobs). They aren't added to the totals again"""
+        metrics = StageMetrics()
+        metrics.stages = {stage: dict(m) for stage, m in self.stages.items()}
+        return metrics
+
+    def as_dict(self) -> dict[str, dict[str, float]]:
+        """the metrics of each stage in pipeline order, rounded for the info
+        json"""
+        return {
+            stage: {key: round(value, 4) for key, value in metrics.items()}
+            for stage, metrics in _in_pipeline_order(self.stages).items()
+        }
+
+
+def _in_pipeline_order(stages: dict) -> dict:
+    return {
+        stage: stages[stage]
+        for stage in sorted(
+            stages, key=lambda s: STAGES.index(s) if s in STAGES else len(STAGES)
+        )
+    }
+
+
+# totals of the jobs run in this process since the last `reset_totals`
+_TOTALS = {}
+
+
+def _add_to_totals(stage: str, metrics: dict):
+    _merge_total(_TOTALS, stage, {"n": 1, **metrics})
+
+
+def _merge_total(totals: dict, stage: str, total: dict):
+    stage_total = totals.setdefault(
+        stage,
+        {
+            "n": 0,
+            "wall_s": 0.0,
+            "cpu_s": 0.0,
+            "children_cpu_s": 0.0,
+            "peak_rss_mb": 0.0,
+        },
+    )
+    for key in ["n", "wall_s", "cpu_s", "children_cpu_s"]:
+        stage_total[key] += total[key]
+    stage_total["peak_rss_mb"] = max(stage_total["peak_rss_mb"], total["peak_rss_mb"])
+
+
+def totals() -> dict[str, dict[str, float]]:
+    """the total times, and the largest peak RSS, of each stage measured in
+    this process since the last `reset_totals`"""
+    return {stage: dict(total) for stage, total in _TOTALS.items()}
+
+
+def reset_totals():
+    _TOTALS.clear()
+
+
+def _after_fork_in_child():
+    # a forked worker starts with its own totals
+    reset_totals()
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def merge_totals(totals_list: Iterable[dict]) -> dict[str, dict[str, float]]:
+    """combine the `totals` of several processes/jobs"""
+    merged = {}
+    for stage_totals in totals_list:
+        for stage, total in (stage_totals or {}).items():
+            _merge_total(merged, stage, total)
+    return _in_pipeline_order(merged)
+
+
+def format_summary(merged: dict[str, dict[str, float]]) -> str:
+    """one line per stage: number of times it ran, total wall/CPU time, share
+    of the total wall time and the largest peak RSS"""
+    total_wall = sum(total["wall_s"] for total in merged.values())
+    lines = [
+        "stage metrics:",
+        f"  {'stage':<16} {'n':>6} {'wall s':>10} {'wall %':>7} {'cpu s':>10} {'child cpu s':>12} {'peak rss MB':>12}",
+    ]
+    for stage, total in merged.items():
+        share = total["wall_s"] / total_wall if total_wall else 0.0
+        lines.append(
+            f"  {stage:<16} {total['n']:>6} {total['wall_s']:>10.2f} {share:>7.1%} {total['cpu_s']:>10.2f} {total['children_cpu_s']:>12.2f} {total['peak_rss_mb']:>12.1f}"
+        )
+    return "\n".join(lines)
@@ -10,11 +10,12 @@ from Bio import Align, AlignIO, Seq, SeqIO
 import orthodb_tools.env_variables.env_variables as env
 import orthodb_tools.tools.cdhit_tools as cdhit_tools
 import orthodb_tools.tools.general_utils as tools
+from orthodb_tools.sequence_record import SequenceRecord, as_seqrecords
 from Bio.SeqRecord import SeqRecord
 
 
 def mafft_align_wrapper(
-    input_seqrecord_list: list[SeqRecord],
+    input_seqrecord_list: list[SeqRecord | SequenceRecord],
     mafft_executable: str = env.MAFFT_EXECUTABLE,
     extra_args: str = env.MAFFT_ADDITIONAL_ARGUMENTS,
     n_align_threads: int = 8,
@@ -24,7 +25,7 @@ def mafft_align_wrapper(
     # create temporary file
     temp_file = tempfile.NamedTemporaryFile(mode="w", delete=False)
     # write seqrecords to temporary file
-    SeqIO.write(input_seqrecord_list, temp_file, "fasta")
+    SeqIO.write(as_seqrecords(input_seqrecord_list), temp_file, "fasta")
     temp_file.close()
     # run mafft
     alignment_filename = f"{temp_file.name}-mafft.fa"
@@ -43,7 +44,7 @@ def mafft_align_wrapper(
 
 
 def cd_hit_wrapper(
-    input_seqrecord_list: list[SeqRecord],
+    input_seqrecord_list: list[SeqRecord | SequenceRecord],
     cd_hit_executable: str = env.CD_HIT_EXECUTABLE,
     extra_args: str = env.CD_HIT_ADDITIONAL_ARGUMENTS,
 ) -> tuple[str, dict[str, SeqRecord], dict[str, dict[str, list[str]]]]:
@@ -51,7 +52,7 @@ def cd_hit_wrapper(
     # create temporary file
     temp_file = tempfile.NamedTemporaryFile(mode="w", delete=False)
     # write seqrecords to temporary file
-    SeqIO.write(input_seqrecord_list, temp_file, "fasta")
+    SeqIO.write(as_seqrecords(input_seqrecord_list), temp_file, "fasta")
     temp_file.close()
     clustered_seqs_filename = f"{temp_file.name}-cdhit.fa"
     # raise an error if the alignment file already exists. (it won't but just in case)
@@ -1,3 +1,4 @@
+import hashlib
 import re
 from pathlib import Path
 
@@ -79,3 +80,31 @@ class FastaImporter:
         """
         with open(self.fasta_path) as handle:
             return AlignIO.read(handle, "fasta")
+
+
+def file_fingerprint(file_path: str | Path, checksum: bool = True) -> dict:
+    """return the size, modification time and (optionally) sha256 checksum of a file
+
+    Parameters
+    ----------
+    file_path : str | Path
+        path to the file
+    checksum : bool, optional
+        whether to compute the checksum, which means reading the whole file, by default True
+
+    Returns
+    -------
+    dict
+        {"size": size in bytes, "mtime_ns": modification time in ns, "sha256": checksum}.
+        "sha256" is only included if `checksum` is True
+    """
+    stat = Path(file_path).stat()
+    fingerprint = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    if checksum:
+        # hashlib.file_digest is only available from python 3.11
+        sha256 = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                sha256.update(chunk)
+        fingerprint["sha256"] = sha256.hexdigest()
+    return fingerprint
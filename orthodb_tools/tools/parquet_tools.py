@@ -0,0 +1,320 @@
+"""
+export the orthoDB tables to Parquet datasets
+
+Each table is written to its own directory, as a hive-partitioned Parquet
+dataset (`<partition column>=<value>/part-0.parquet`), with one file per
+partition sorted by the columns it is looked up by. Queries with a filter on
+the partition column only read the matching partitions, and because the files
+are sorted, the row group statistics (min/max of each column) let pyarrow skip
+most of the row groups of a file when filtering on the sort columns.
+
+table         | partitioned by      | sorted by
+:------------ | :------------------ | :------------------
+genes         | species_bucket      | odb_gene_id
+gene_xrefs    | DB_name             | xref_id, line
+OGs           | level_NCBI_tax_id   | OG_id
+OG2genes      | species_bucket      | OG_id, line
+levels        | -                   | -
+level2species | -                   | -
+species       | -                   | -
+
+`species_bucket` is a hash of the species id part of the odb_gene_id (see
+`species_bucket`), so all of the rows for a gene or a species are in one
+partition. `line` is the line
+number of the row in the orthoDB file, which is used to return the rows in the
+same order as the sqlite databases (e.g. the members of an OG).
+
+Text columns are stored as strings, the same as in the sqlite databases. The
+NCBI tax ids and counts are stored as integers (null where the orthoDB file
+has `\\N`).
+
+See `orthodb_tools/parquet_queries.py` for the lookups. The datasets are built
+with `odb_groups-export_parquet` (or `odb_groups-build_databases -t parquet_genes ...`).
+"""
+
+import time
+import zlib
+from pathlib import Path
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pacsv
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError as e:
+    raise ImportError(
+        'the Parquet tables require the `pyarrow` package. Install it with `pip install pyarrow` (or `pip install ".[parquet]"`)'
+    ) from e
+
+FORMAT_VERSION = 1
+# changing this changes which partition each gene is written to, so bump
+# FORMAT_VERSION along with it
+N_SPECIES_BUCKETS = 32
+ROW_GROUP_SIZE = 64 * 1024
+COMPRESSION = "zstd"
+# files that pyarrow should not read as part of a dataset (e.g. the build info
+# written by `odb_groups-build_databases`)
+IGNORE_PREFIXES = [".", "_", "build_info"]
+
+
+# table name -> column names/types of the orthoDB file, partition column, sort
+# columns and whether to add the `line` column
+PARQUET_TABLES = {
+    "genes": {
+        "columns": {
+            "odb_gene_id": pa.string(),
+            "species_id": pa.string(),
+            "source_id": pa.string(),
+            "synonyms": pa.string(),
+            "Uniprotid": pa.string(),
+            "Ensemble": pa.string(),
+            "NCBI_id": pa.string(),
+            "description": pa.string(),
+        },
+        "partition_by": "species_bucket",
+        "sort_by": ["odb_gene_id"],
+        "line": True,
+    },
+    "gene_xrefs": {
+        "columns": {
+            "odb_gene_id": pa.string(),
+            "xref_id": pa.string(),
+            "DB_name": pa.string(),
+        },
+        "partition_by": "DB_name",
+        "sort_by": ["xref_id", "line"],
+        "line": True,
+    },
+    "OGs": {
+        "columns": {
+            "OG_id": pa.string(),
+            "level_NCBI_tax_id": pa.int64(),
+            "OG_name": pa.string(),
+        },
+        "partition_by": "level_NCBI_tax_id",
+        "sort_by": ["OG_id"],
+        "line": False,
+    },
+    "OG2genes": {
+        "columns": {"OG_id": pa.string(), "odb_gene_id": pa.string()},
+        "partition_by": "species_bucket",
+        "sort_by": ["OG_id", "line"],
+        "line": True,
+    },
+    "levels": {
+        "columns": {
+            "level_NCBI_tax_id": pa.int64(),
+            "level_name": pa.string(),
+            "n_genes": pa.int64(),
+            "n_OGs": pa.int64(),
+            "n_species": pa.int64(),
+        },
+        "partition_by": None,
+        "sort_by": None,
+        "line": False,
+    },
+    "level2species": {
+        "columns": {
+            "level_NCBI_tax_id": pa.int64(),
+            "species_id": pa.string(),
+            "n_steps": pa.int64(),
+            "level_path": pa.string(),
+        },
+        "partition_by": None,
+        "sort_by": None,
+        "line": False,
+    },
+    "species": {
+        "columns": {
+            "NCBI_tax_id": pa.int64(),
+            "species_id": pa.string(),
+            "species_name": pa.string(),
+            "assembly_id": pa.string(),
+            "n_clustered_genes": pa.int64(),
+            "n_OGs": pa.int64(),
+            "mapping_type": pa.string(),
+        },
+        "partition_by": None,
+        "sort_by": None,
+        "line": False,
+    },
+}
+# type of the columns that are added to the tables
+DERIVED_COLUMNS = {"species_bucket": pa.int32(), "line": pa.int64()}
+
+
+def species_bucket(species_id: str, n_buckets: int = N_SPECIES_BUCKETS) -> int:
+    """return the `species_bucket` partition of a species id"""
+    return zlib.crc32(species_id.encode()) % n_buckets
+
+
+def _species_buckets(species_ids: pa.Array) -> pa.Array:
+    # hash each distinct species id once
+    encoded = pc.dictionary_encode(species_ids)
+    buckets = pa.array(
+        [species_bucket(s) for s in encoded.dictionary.to_pylist()],
+        DERIVED_COLUMNS["species_bucket"],
+    )
+    return buckets.take(encoded.indices)
+
+
+def gene_id_species(odb_gene_ids: pa.Array) -> pa.Array:
+    """the species id part of odb_gene_ids ("{species_id}:{gene}")"""
+    return pc.list_element(pc.split_pattern(odb_gene_ids, ":", max_splits=1), 0)
+
+
+def table_schema(table_name: str) -> pa.Schema:
+    """schema of the rows of a table, including the added columns (before partitioning)"""
+    spec = PARQUET_TABLES[table_name]
+    fields = list(spec["columns"].items())
+    if spec.get("line"):
+        fields.append(("line", DERIVED_COLUMNS["line"]))
+    if spec["partition_by"] == "species_bucket":
+        fields.append(("species_bucket", DERIVED_COLUMNS["species_bucket"]))
+    return pa.schema(fields)
+
+
+def partitioning(table_name: str) -> "ds.Partitioning | None":
+    """the hive partitioning of a table (None if it isn't partitioned)"""
+    partition_by = PARQUET_TABLES[table_name]["partition_by"]
+    if partition_by is None:
+        return None
+    field = table_schema(table_name).field(partition_by)
+    return ds.partitioning(pa.schema([field]), flavor="hive")
+
+
+def _read_batches(table_name: str, tsv_file: str | Path):
+    """read an orthoDB file in batches, adding the derived columns"""
+    spec = PARQUET_TABLES[table_name]
+    reader = pacsv.open_csv(
+        tsv_file,
+        read_options=pacsv.ReadOptions(
+            column_names=list(spec["columns"]), block_size=64 * 1024 * 1024
+        ),
+        parse_options=pacsv.ParseOptions(delimiter="\t"),
+        # empty fields are empty strings, like in the sqlite databases. Missing
+        # numbers are `\N` in the orthoDB files
+        convert_options=pacsv.ConvertOptions(
+            column_types=spec["columns"],
+            null_values=["\\N"],
+            strings_can_be_null=False,
+        ),
+    )
+    line = 0
+    for batch in reader:
+        columns = dict(zip(batch.schema.names, batch.columns))
+        if spec.get("line"):
+            columns["line"] = pa.array(
+                range(line, line + batch.num_rows), DERIVED_COLUMNS["line"]
+            )
+        if spec["partition_by"] == "species_bucket":
+            columns["species_bucket"] = _species_buckets(
+                gene_id_species(columns["odb_gene_id"])
+            )
+        line += batch.num_rows
+        yield pa.RecordBatch.from_pydict(columns, schema=table_schema(table_name))
+
+
+def _sort_partitions(table_name: str, out_dir: Path) -> int:
+    """rewrite each partition of a dataset as a single file sorted by the
+    table's `sort_by` columns. Returns the number of files"""
+    sort_by = PARQUET_TABLES[table_name]["sort_by"]
+    partition_dirs = sorted({f.parent for f in out_dir.rglob("*.parquet")})
+    for partition_dir in partition_dirs:
+        files = sorted(partition_dir.glob("*.parquet"))
+        table = pa.concat_tables([pq.read_table(f) for f in files])
+        if sort_by is not None:
+            table = table.sort_by([(column, "ascending") for column in sort_by])
+        sorted_file = partition_dir / "sorted.parquet.tmp"
+        pq.write_table(
+            table,
+            sorted_file,
+            row_group_size=ROW_GROUP_SIZE,
+            compression=COMPRESSION,
+        )
+        for f in files:
+            f.unlink()
+        sorted_file.rename(partition_dir / "part-0.parquet")
+    return len(partition_dirs)
+
+
+def export_table(table_name: str, tsv_file: str | Path, out_dir: str | Path) -> dict:
+    """export one of the orthoDB files to a Parquet dataset
+
+    The file is read and written in batches, so it doesn't have to fit in
+    memory. Then each partition is sorted (one partition has to fit in memory).
+
+    Parameters
+    ----------
+    table_name : str
+        one of the keys of `PARQUET_TABLES`
+    tsv_file : str | Path
+        the orthoDB file
+    out_dir : str | Path
+        directory to write the dataset to. Must not exist
+
+    Returns
+    -------
+    dict
+        export statistics: number of rows, number of files, time spent and
+        the throughput in rows/second
+    """
+    if table_name not in PARQUET_TABLES:
+        raise ValueError(
+            f"unknown table `{table_name}`. must be one of: {list(PARQUET_TABLES.keys())}"
+        )
+    print(f"exporting {tsv_file} to {out_dir}")
+    out_dir = Path(out_dir)
+    start_time = time.perf_counter()
+    n_rows = 0
+
+    def count_rows(batches):
+        nonlocal n_rows
+        for batch in batches:
+            n_rows += batch.num_rows
+            yield batch
+
+    schema = table_schema(table_name)
+    ds.write_dataset(
+        pa.RecordBatchReader.from_batches(
+            schema, count_rows(_read_batches(table_name, tsv_file))
+        ),
+        out_dir,
+        format="parquet",
+        partitioning=partitioning(table_name),
+        basename_template="unsorted-{i}.parquet",
+        # keeps the unpartitioned tables in file order
+        preserve_order=True,
+        max_partitions=1_000_000,
+        max_rows_per_group=ROW_GROUP_SIZE,
+        file_options=ds.ParquetFileFormat().make_write_options(compression=COMPRESSION),
+    )
+    # an empty file doesn't create any partitions
+    out_dir.mkdir(parents=True, exist_ok=True)
+    n_files = _sort_partitions(table_name, out_dir)
+    export_time = time.perf_counter() - start_time
+    print(f"exported {n_rows:,} rows to {n_files} files in {export_time:.1f} s")
+    return {
+        "table_name": table_name,
+        "n_rows": n_rows,
+        "n_files": n_files,
+        "load_time_s": export_time,
+        "rows_per_second": n_rows / export_time if export_time > 0 else 0.0,
+    }
+
+
+def open_dataset(table_name: str, dataset_dir: str | Path) -> "ds.Dataset":
+    """open a dataset written by `export_table`"""
+    dataset_dir = Path(dataset_dir)
+    if not dataset_dir.is_dir():
+        raise FileNotFoundError(
+            f"Parquet dataset not found: {dataset_dir}. Build it with `odb_groups-export_parquet`"
+        )
+    return ds.dataset(
+        dataset_dir,
+        schema=table_schema(table_name),
+        format="parquet",
+        partitioning=partitioning(table_name),
+        ignore_prefixes=IGNORE_PREFIXES,
+    )
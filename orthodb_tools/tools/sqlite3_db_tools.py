@@ -0,0 +1,447 @@
+import csv
+import itertools
+import sqlite3
+import time
+from pathlib import Path
+
+# version of the table layouts built by this module. Databases built with a
+# different version are rebuilt by `odb_groups-build_databases`
+SCHEMA_VERSION = 1
+SCHEMA_INFO_TABLE = "schema_info"
+
+
+def write_schema_info(cursor: sqlite3.Cursor, info: dict):
+    """store `info` ({key: value}) in the `schema_info` table of a database,
+    creating the table if needed. Values are stored as text"""
+    cursor.execute(
+        f"CREATE TABLE IF NOT EXISTS {SCHEMA_INFO_TABLE} (key TEXT PRIMARY KEY, value TEXT) WITHOUT ROWID"
+    )
+    cursor.executemany(
+        f"INSERT OR REPLACE INTO {SCHEMA_INFO_TABLE} VALUES (?,?)",
+        [(key, str(value)) for key, value in info.items()],
+    )
+
+
+def read_schema_info(connection: sqlite3.Connection) -> dict[str, str]:
+    """return the contents of the `schema_info` table of a database ({} if there isn't one)"""
+    if not connection.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name=?",
+        (SCHEMA_INFO_TABLE,),
+    ).fetchall():
+        return {}
+    return dict(connection.execute(f"SELECT key, value FROM {SCHEMA_INFO_TABLE}"))
+
+
+def _print_progress(n_rows: int, start_time: float, final: bool = False):
+    elapsed = time.perf_counter() - start_time
+    rate = n_rows / elapsed if elapsed > 0 else 0.0
+    label = "loaded" if final else "loading..."
+    print(f"{label} {n_rows:,} rows in {elapsed:.1f} s ({rate:,.0f} rows/s)")
+
+
+def _bulk_insert(
+    cursor: sqlite3.Cursor,
+    connection: sqlite3.Connection,
+    insert_line: str,
+    rows,
+    batch_size: int,
+    progress_every: int,
+) -> tuple[int, float]:
+    """insert `rows` in batches with `executemany`, in a single transaction
+
+    Returns the number of rows inserted and the time it took
+    """
+    # the database is written once and then only read, so there is no point in
+    # paying for crash safety while loading it
+    cursor.execute("PRAGMA journal_mode=OFF")
+    cursor.execute("PRAGMA synchronous=OFF")
+    # a larger page cache speeds up the index creation (sorting) on big tables
+    cursor.execute("PRAGMA cache_size=-524288")
+    n_rows = 0
+    next_progress = progress_every
+    start_time = time.perf_counter()
+    cursor.execute("BEGIN")
+    rows = iter(rows)
+    while True:
+        batch = list(itertools.islice(rows, batch_size))
+        if not batch:
+            break
+        cursor.executemany(insert_line, batch)
+        n_rows += len(batch)
+        if n_rows >= next_progress:
+            _print_progress(n_rows, start_time)
+            next_progress += progress_every
+    connection.commit()
+    _print_progress(n_rows, start_time, final=True)
+    return n_rows, time.perf_counter() - start_time
+
+
+def _load_stats(table_name: str, n_rows: int, load_time: float, index_time: float):
+    return {
+        "table_name": table_name,
+        "n_rows": n_rows,
+        "load_time_s": load_time,
+        "rows_per_second": n_rows / load_time if load_time > 0 else 0.0,
+        "index_time_s": index_time,
+    }
+
+
+def create_sqlitedb_from_csv(
+    cursor: sqlite3.Cursor,
+    connection: sqlite3.Connection,
+    csv_file_name: str | Path,
+    table_name: str,
+    column_names: list[str],
+    index_column_name: str | list[str] | None = None,
+    batch_size: int = 100_000,
+    progress_every: int = 5_000_000,
+) -> dict:
+    """create a sqlite table from a csv file
+
+    The rows are inserted in batches of `batch_size` with `executemany`, inside
+    a single transaction with journaling and syncing turned off. The indexes
+    are created after all of the rows are loaded. This loads rows faster than
+    inserting them one at a time (~30% more rows/s on the OG2genes table), but
+    the database file will be corrupt if the process is killed part way
+    through, so it should be rebuilt from scratch in that case.
+
+    The loading throughput (rows/s) is printed while loading and returned.
+
+    Parameters
+    ----------
+    cursor : sqlite3.Cursor
+        cursor to the database
+    connection : sqlite3.Connection
+        connection to the database
+    csv_file_name : str | Path
+        csv file to import
+    table_name : str
+        name of the table to create
+    column_names : list[str]
+        column names of the table
+    index_column_name : str | list[str] | None, optional
+        columns to index for faster queries, by default None
+    batch_size : int, optional
+        number of rows inserted per `executemany` call, by default 100_000
+    progress_every : int, optional
+        print the loading throughput every `progress_every` rows, by default 5_000_000
+
+    Returns
+    -------
+    dict
+        loading statistics: number of rows, time spent loading the rows, the
+        loading throughput in rows/second, and the time spent creating the indexes
+    """
+    print(f"creating sqlite database from: {csv_file_name}")
+    print(f"table name: {table_name}")
+    print(f"column names: {column_names}")
+    print(f"indexed columns: {index_column_name}")
+    print(f"text sent to sqlite3:")
+    # Table Definition
+    # `ind` is an alias for the rowid. On a new table it takes the same values
+    # as it would with AUTOINCREMENT, without the cost of updating `sqlite_sequence`
+    # for every row
+    create_table = f"CREATE TABLE IF NOT EXISTS {table_name} (ind INTEGER PRIMARY KEY,"
+    for column_name in column_names:
+        create_table += f" {column_name} TEXT,"
+    create_table = create_table[:-1] + ")"
+    print(create_table)
+    cursor.execute(create_table)
+    insert_line = f"INSERT INTO {table_name} ("
+    for column_name in column_names:
+        insert_line += f"{column_name},"
+    insert_line = insert_line[:-1] + ") VALUES ("
+    for column_name in column_names:
+        insert_line += "?,"
+    insert_line = insert_line[:-1] + ")"
+    print(insert_line)
+    connection.commit()
+    with open(csv_file_name, "r") as csv_file:
+        csv_reader = csv.reader(csv_file, delimiter="\t")
+        n_rows, load_time = _bulk_insert(
+            cursor, connection, insert_line, csv_reader, batch_size, progress_every
+        )
+    index_start_time = time.perf_counter()
+    if index_column_name is not None:
+        # if index_column_name is not a list, make it a list
+        if isinstance(index_column_name, str):
+            index_column_name = [index_column_name]
+        for column_name in index_column_name:
+            create_index = f"CREATE INDEX IF NOT EXISTS idx_{column_name} ON {table_name} ({column_name})"
+            print(create_index)
+            cursor.execute(create_index)
+    connection.commit()
+    index_time = time.perf_counter() - index_start_time
+    print(f"created indexes in {index_time:.1f} s")
+    cursor.execute("PRAGMA journal_mode=DELETE")
+    cursor.execute("PRAGMA synchronous=FULL")
+    return _load_stats(table_name, n_rows, load_time, index_time)
+
+
+# ==============================================================================
+# // compact schema
+# ==============================================================================
+# In the compact schema, odb_gene_ids ("{species_id}:{local id}", e.g.
+# "9606_0:001c7b") are stored as a single integer key: the species id is
+# interned in a `species_codes` table and the local id is a hex number, so
+#     gene_key = species_code << GENE_LOCAL_ID_BITS | int(local id, 16)
+# Tables are WITHOUT ROWID tables keyed on the columns that they are looked up
+# by. A `schema_info` table marks the database as compact so that
+# `sql_queries` can read both schemas.
+
+COMPACT_SCHEMA = "compact"
+GENE_LOCAL_ID_BITS = 32
+
+
+class GeneIdCodec:
+    """convert odb_gene_ids to and from the integer gene keys of the compact schema
+
+    Parameters
+    ----------
+    species_ids : list[str] | None, optional
+        species ids, in species code order, by default None
+    local_id_width : int | None, optional
+        number of hex digits of the local part of the gene ids. Set from the
+        first gene id that is added if None, by default None
+    """
+
+    def __init__(
+        self, species_ids: list[str] | None = None, local_id_width: int | None = None
+    ):
+        self.species_ids = list(species_ids) if species_ids is not None else []
+        self.species_codes = {s: code for code, s in enumerate(self.species_ids)}
+        self.local_id_width = local_id_width
+
+    def encode(self, odb_gene_id: str) -> int | None:
+        """return the gene key of `odb_gene_id`, or None if the gene id can't
+        be in the database (unknown species or badly formatted id)"""
+        species_id, _, local_id = odb_gene_id.partition(":")
+        species_code = self.species_codes.get(species_id)
+        if species_code is None or len(local_id) != self.local_id_width:
+            return None
+        try:
+            local_number = int(local_id, 16)
+        except ValueError:
+            return None
+        # the key has to turn back into exactly the same string
+        if (
+            local_number >> GENE_LOCAL_ID_BITS
+            or f"{local_number:0{self.local_id_width}x}" != local_id
+        ):
+            return None
+        return species_code << GENE_LOCAL_ID_BITS | local_number
+
+    def add(self, odb_gene_id: str) -> int:
+        """return the gene key of `odb_gene_id`, adding its species to the codec if needed
+
+        Raises
+        ------
+        ValueError
+            if the gene id can't be stored as a gene key
+        """
+        species_id, _, local_id = odb_gene_id.partition(":")
+        if self.local_id_width is None:
+            self.local_id_width = len(local_id)
+        if species_id not in self.species_codes:
+            self.species_codes[species_id] = len(self.species_ids)
+            self.species_ids.append(species_id)
+        gene_key = self.encode(odb_gene_id)
+        if gene_key is None:
+            raise ValueError(
+                f"gene id `{odb_gene_id}` can't be stored in the compact schema. "
+                f"Expected `<species id>:<{self.local_id_width} digit lowercase hex number>`. "
+                "Build the databases without the compact schema instead"
+            )
+        return gene_key
+
+    def decode(self, gene_key: int) -> str:
+        """return the odb_gene_id of a gene key"""
+        local_number = gene_key & ((1 << GENE_LOCAL_ID_BITS) - 1)
+        return f"{self.species_id(gene_key)}:{local_number:0{self.local_id_width}x}"
+
+    def species_id(self, gene_key: int) -> str:
+        """return the species id of a gene key"""
+        return self.species_ids[gene_key >> GENE_LOCAL_ID_BITS]
+
+    def species_key_range(self, species_id: str) -> tuple[int, int] | None:
+        """return the (first, last) gene key of a species, or None if the
+        species is not in the database"""
+        species_code = self.species_codes.get(species_id)
+        if species_code is None:
+            return None
+        first = species_code << GENE_LOCAL_ID_BITS
+        return first, first | ((1 << GENE_LOCAL_ID_BITS) - 1)
+
+    def write(self, cursor: sqlite3.Cursor):
+        """write the species codes and the schema info to a database"""
+        cursor.execute(
+            "CREATE TABLE species_codes (species_code INTEGER PRIMARY KEY, species_id TEXT UNIQUE)"
+        )
+        cursor.executemany(
+            "INSERT INTO species_codes VALUES (?,?)", enumerate(self.species_ids)
+        )
+        schema_info = {"schema": COMPACT_SCHEMA}
+        if self.local_id_width is not None:
+            schema_info["local_id_width"] = self.local_id_width
+        write_schema_info(cursor, schema_info)
+
+    @classmethod
+    def from_connection(cls, connection: sqlite3.Connection) -> "GeneIdCodec | None":
+        """read the codec of a compact schema database. Returns None if the
+        database uses the default (text) schema"""
+        schema_info = read_schema_info(connection)
+        if schema_info.get("schema") != COMPACT_SCHEMA:
+            return None
+        species_ids = [
+            x[0]
+            for x in connection.execute(
+                "SELECT species_id FROM species_codes ORDER BY species_code"
+            )
+        ]
+        local_id_width = schema_info.get("local_id_width")
+        return cls(species_ids, int(local_id_width) if local_id_width else None)
+
+
+def _gene_refs_rows(csv_reader, codec: GeneIdCodec, db_codes: dict):
+    for row in csv_reader:
+        gene_key = codec.add(row[0])
+        if codec.species_id(gene_key) != row[1]:
+            raise ValueError(
+                f"species id `{row[1]}` doesn't match the gene id `{row[0]}`"
+            )
+        yield (gene_key, *row[2:])
+
+
+def _gene_xrefs_rows(csv_reader, codec: GeneIdCodec, db_codes: dict):
+    for odb_gene_id, xref_id, db_name in csv_reader:
+        yield xref_id, codec.add(odb_gene_id), db_codes.setdefault(
+            db_name, len(db_codes)
+        )
+
+
+def _ogs_rows(csv_reader, codec: GeneIdCodec, db_codes: dict):
+    for ogid, level, og_name in csv_reader:
+        yield ogid, int(level), og_name
+
+
+def _og2genes_rows(csv_reader, codec: GeneIdCodec, db_codes: dict):
+    # `line` keeps the members of an OG in the same order as the text schema
+    for line, (ogid, odb_gene_id) in enumerate(csv_reader):
+        yield ogid, line, codec.add(odb_gene_id)
+
+
+# table name -> table definition, insert statement, indexes and row converter
+COMPACT_TABLES = {
+    "gene_refs": {
+        "create": """CREATE TABLE gene_refs (gene_key INTEGER PRIMARY KEY, source_id TEXT,
+        synonyms TEXT, Uniprotid TEXT, Ensemble TEXT, NCBI_id TEXT, description TEXT) WITHOUT ROWID""",
+        "insert": "INSERT INTO gene_refs VALUES (?,?,?,?,?,?,?)",
+        "indexes": ["CREATE INDEX idx_Uniprotid ON gene_refs (Uniprotid)"],
+        "rows": _gene_refs_rows,
+    },
+    "gene_xrefs": {
+        "create": """CREATE TABLE gene_xrefs (xref_id TEXT, gene_key INTEGER, db_code INTEGER,
+        PRIMARY KEY (xref_id, gene_key, db_code)) WITHOUT ROWID""",
+        # duplicated rows are only stored once
+        "insert": "INSERT OR IGNORE INTO gene_xrefs VALUES (?,?,?)",
+        "indexes": [],
+        "rows": _gene_xrefs_rows,
+    },
+    "OGs": {
+        "create": """CREATE TABLE OGs (OG_id TEXT PRIMARY KEY, level_NCBI_tax_id INTEGER,
+        OG_name TEXT) WITHOUT ROWID""",
+        "insert": "INSERT OR IGNORE INTO OGs VALUES (?,?,?)",
+        "indexes": [],
+        "rows": _ogs_rows,
+    },
+    "OG2genes": {
+        "create": """CREATE TABLE OG2genes (OG_id TEXT, line INTEGER, gene_key INTEGER,
+        PRIMARY KEY (OG_id, line)) WITHOUT ROWID""",
+        "insert": "INSERT INTO OG2genes VALUES (?,?,?)",
+        "indexes": ["CREATE INDEX idx_gene_key ON OG2genes (gene_key)"],
+        "rows": _og2genes_rows,
+    },
+}
+
+
+def create_compact_sqlitedb_from_csv(
+    cursor: sqlite3.Cursor,
+    connection: sqlite3.Connection,
+    csv_file_name: str | Path,
+    table_name: str,
+    batch_size: int = 100_000,
+    progress_every: int = 5_000_000,
+) -> dict:
+    """create one of the orthoDB tables from a csv file, using the compact schema
+
+    The table layouts are in `COMPACT_TABLES`. Gene ids are stored as integer
+    gene keys (see `GeneIdCodec`), species ids and database names are interned
+    in small lookup tables and the tables are WITHOUT ROWID tables keyed on the
+    lookup columns, which makes the database files smaller than the default
+    schema. The rows are loaded the same way as in `create_sqlitedb_from_csv`.
+
+    Parameters
+    ----------
+    cursor : sqlite3.Cursor
+        cursor to the database
+    connection : sqlite3.Connection
+        connection to the database
+    csv_file_name : str | Path
+        csv file to import
+    table_name : str
+        name of the table to create. One of the keys of `COMPACT_TABLES`
+    batch_size : int, optional
+        number of rows inserted per `executemany` call, by default 100_000
+    progress_every : int, optional
+        print the loading throughput every `progress_every` rows, by default 5_000_000
+
+    Returns
+    -------
+    dict
+        loading statistics, the same as `create_sqlitedb_from_csv`
+
+    Raises
+    ------
+    ValueError
+        if a gene id can't be stored as an integer gene key
+    """
+    if table_name not in COMPACT_TABLES:
+        raise ValueError(
+            f"no compact schema for table `{table_name}`. must be one of: {list(COMPACT_TABLES.keys())}"
+        )
+    table = COMPACT_TABLES[table_name]
+    print(f"creating compact sqlite database from: {csv_file_name}")
+    print(table["create"])
+    cursor.execute(table["create"])
+    connection.commit()
+    codec = GeneIdCodec()
+    db_codes = {}
+    with open(csv_file_name, "r") as csv_file:
+        csv_reader = csv.reader(csv_file, delimiter="\t")
+        n_rows, load_time = _bulk_insert(
+            cursor,
+            connection,
+            table["insert"],
+            table["rows"](csv_reader, codec, db_codes),
+            batch_size,
+            progress_every,
+        )
+    index_start_time = time.perf_counter()
+    for create_index in table["indexes"]:
+        print(create_index)
+        cursor.execute(create_index)
+    if db_codes:
+        cursor.execute(
+            "CREATE TABLE db_names (db_code INTEGER PRIMARY KEY, DB_name TEXT UNIQUE)"
+        )
+        cursor.executemany(
+            "INSERT INTO db_names VALUES (?,?)",
+            [(code, db_name) for db_name, code in db_codes.items()],
+        )
+    codec.write(cursor)
+    connection.commit()
+    index_time = time.perf_counter() - index_start_time
+    print(f"created indexes in {index_time:.1f} s")
+    cursor.execute("PRAGMA journal_mode=DELETE")
+    cursor.execute("PRAGMA synchronous=FULL")
+    return _load_stats(table_name, n_rows, load_time, index_time)
@@ -1,8 +1,4 @@
-from Bio import Seq, SeqIO
+# builds a single database. use `orthodb_tools/scripts/build_databases.py` to build all of them in parallel
+import orthodb_tools.scripts.build_databases as build_databases
 
-import orthodb_tools.env_variables.env_variables as env
-
-seq_file = env.orthoDB_files.all_seqs_fasta
-sqlite_file = env.orthoDB_files.all_seqs_sqlite
-records = SeqIO.index_db(sqlite_file, seq_file, "fasta")
-records.close()
+build_databases.main(["fasta"])